@@ -0,0 +1,418 @@
+import argparse
+import json
+import os
+import platform
+import random
+import secrets
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from database import SCHEMA_VERSION, DatabaseManager, hash_password
+from encryption import CIPHERS, EncryptionManager
+from password_generator import CHAR_CATEGORIES, PasswordGenerator
+
+PAYLOAD_SIZES = (16, 256, 4096, 65536, 1024 * 1024)
+ENTRY_SIZES = (16, 256, 4096)
+BATCH_SIZES = (1, 100, 10000)
+
+# Синтетические базы: 10 000 пользователей и от 100 до 1000 паролей у каждого
+DB_USERS = 10000
+DB_PASSWORDS_PER_USER = (100, 1000)
+DB_DIR = '.benchmarks'
+DB_SEED = 1729
+
+# Допустимое замедление относительно базовой линии (0.15 = на 15%)
+REGRESSION_THRESHOLD = 0.15
+
+
+def legacy_xor(data: bytes, encryption_key: bytes) -> bytes:
+    """Побайтовый XOR в том виде, в каком он был в EncryptionManager"""
+    return bytes(
+        byte ^ encryption_key[i % len(encryption_key)]
+        for i, byte in enumerate(data)
+    )
+
+
+def legacy_generate_password(settings: Dict) -> str:
+    """Посимвольная генерация через secrets.choice, как было в PasswordGenerator"""
+    length = settings.get('length', 16)
+    characters = ''.join(
+        chars for setting, chars in CHAR_CATEGORIES.items()
+        if settings.get(setting, True)
+    )
+    password = [
+        secrets.choice(CHAR_CATEGORIES[category])
+        for category in CHAR_CATEGORIES
+        if settings.get(category, True)
+    ]
+    while len(password) < length:
+        password.append(secrets.choice(characters))
+    secrets.SystemRandom().shuffle(password)
+    return ''.join(password[:length])
+
+
+def measure(func: Callable[[], object], min_time: float = 0.2) -> float:
+    """Среднее время одного вызова в секундах"""
+    func()
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - started
+    return elapsed / calls
+
+
+def bench_kdf(min_time: float = 0.2) -> List[Dict]:
+    """Стоимость PBKDF2 и дешевого подключа записи (операций в секунду)"""
+    salt = os.urandom(32)
+    key = os.urandom(32)
+    vault_key = os.urandom(32)
+    cases = {
+        'hash-master-password': lambda: hash_password('correct horse battery staple', salt),
+        'generate-key': lambda: EncryptionManager.generate_key('correct horse battery staple', salt),
+        'derive-vault-key': lambda: EncryptionManager.derive_vault_key(key),
+        'derive-entry-key': lambda: EncryptionManager.derive_entry_key(vault_key, salt),
+    }
+
+    results = []
+    for name, func in cases.items():
+        seconds = measure(func, min_time)
+        results.append({'name': f'kdf.{name}', 'size': 1, 'seconds': seconds, 'per_s': 1 / seconds})
+    return results
+
+
+def bench_ciphers(sizes=PAYLOAD_SIZES, min_time: float = 0.2) -> List[Dict]:
+    """Пропускная способность шифров по размеру буфера (МБ/с)"""
+    key = os.urandom(32)
+    nonce = os.urandom(12)
+    results = []
+
+    for size in sizes:
+        payload = os.urandom(size)
+        cases = {
+            'legacy-xor': lambda: legacy_xor(payload, key),
+            'bulk-xor': lambda: EncryptionManager._xor(payload, key),
+        }
+        for cipher in CIPHERS.values():
+            cases[cipher.name] = lambda cipher=cipher: cipher.encrypt(key, nonce, payload, b'')
+
+        for name, func in cases.items():
+            seconds = measure(func, min_time)
+            results.append({
+                'name': f'cipher.{name}',
+                'size': size,
+                'seconds': seconds,
+                'mb_per_s': size / seconds / 1024 / 1024
+            })
+
+    return results
+
+
+def bench_entries(sizes=ENTRY_SIZES, min_time: float = 0.2) -> List[Dict]:
+    """Шифрование и дешифрование записи целиком: подключ, nonce и AEAD (МБ/с)"""
+    vault_key = os.urandom(32)
+    results = []
+
+    for size in sizes:
+        data = secrets.token_urlsafe(size)[:size]
+        for cipher in CIPHERS.values():
+            entry = EncryptionManager.encrypt_entry(data, vault_key, cipher)
+            cases = {
+                'encrypt': lambda cipher=cipher: EncryptionManager.encrypt_entry(data, vault_key, cipher),
+                'decrypt': lambda entry=entry: EncryptionManager.decrypt_entry(
+                    entry['encrypted_data'], entry['salt'], vault_key),
+            }
+            for name, func in cases.items():
+                seconds = measure(func, min_time)
+                results.append({
+                    'name': f'entry.{name}.{cipher.name}',
+                    'size': size,
+                    'seconds': seconds,
+                    'mb_per_s': size / seconds / 1024 / 1024
+                })
+
+    return results
+
+
+def bench_generation(sizes=BATCH_SIZES, min_time: float = 0.2) -> List[Dict]:
+    """Посимвольная и поштучная генерация против пачки из одного буфера (паролей в секунду)"""
+    settings = {'length': 16, 'use_uppercase': True, 'use_lowercase': True,
+                'use_digits': True, 'use_special': True}
+    passphrase_settings = {'mode': 'passphrase', 'word_count': 6}
+    generator = PasswordGenerator()
+    results = []
+
+    for count in sizes:
+        cases = {
+            'per-char-loop': lambda: [legacy_generate_password(settings) for _ in range(count)],
+            'single': lambda: [generator.generate_password(settings) for _ in range(count)],
+            'batch': lambda: PasswordGenerator.generate_char_batch(settings, count, use_numpy=False),
+            'batch-numpy': lambda: PasswordGenerator.generate_char_batch(settings, count),
+            'passphrase': lambda: generator.generate_batch(passphrase_settings, count),
+        }
+        for name, func in cases.items():
+            seconds = measure(func, min_time)
+            results.append({
+                'name': f'generate.{name}',
+                'size': count,
+                'seconds': seconds,
+                'per_s': count / seconds
+            })
+
+    return results
+
+
+def synthetic_db_path(db_dir: str, users: int, per_user: int) -> str:
+    """Путь к синтетической базе; версия схемы в имени сбрасывает кэш после миграций"""
+    return os.path.join(db_dir, f'bench-{users}x{per_user}-v{SCHEMA_VERSION}.db')
+
+
+def build_synthetic_db(path: str, users: int, per_user: int, seed: int = DB_SEED):
+    """Детерминированная база с пользователями, настройками, паролями и напоминаниями
+
+    Вместо шифротекстов - случайные байты похожего размера: на скорость
+    запросов содержимое не влияет, а шифрование миллионов записей заняло бы
+    больше времени, чем сами замеры.
+    """
+    rng = random.Random(seed)
+    tmp_path = path + '.tmp'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(tmp_path + suffix):
+            os.remove(tmp_path + suffix)
+
+    db = DatabaseManager(tmp_path)
+    now = datetime.utcnow()
+    blobs = [os.urandom(rng.randint(40, 80)) for _ in range(1024)]
+    salts = [os.urandom(16) for _ in range(1024)]
+    password_id = 0
+
+    for first_user in range(1, users + 1, 100):
+        user_ids = range(first_user, min(first_user + 100, users + 1))
+        passwords = []
+        reminders = []
+        for user_id in user_ids:
+            for _ in range(per_user):
+                password_id += 1
+                created_at = now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400))
+                reminder_date = created_at + timedelta(days=365)
+                passwords.append((
+                    password_id, user_id, f'service-{rng.getrandbits(32):08x}.example',
+                    blobs[password_id % len(blobs)], salts[password_id % len(salts)],
+                    created_at.strftime('%Y-%m-%d %H:%M:%S')
+                ))
+                # Напоминания старше месяца считаем уже отправленными
+                reminders.append((
+                    user_id, password_id, reminder_date.strftime('%Y-%m-%d %H:%M:%S'),
+                    int(reminder_date < now - timedelta(days=30))
+                ))
+
+        with db.pool.writer() as conn:
+            conn.executemany(
+                'INSERT INTO users (user_id, master_password_hash, salt) VALUES (?, ?, ?)',
+                [(user_id, secrets.token_hex(32), os.urandom(32)) for user_id in user_ids]
+            )
+            conn.executemany(
+                'INSERT INTO password_settings (user_id) VALUES (?)',
+                [(user_id,) for user_id in user_ids]
+            )
+            conn.executemany(
+                'INSERT INTO passwords (id, user_id, service_name, encrypted_password, salt, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                passwords
+            )
+            conn.executemany(
+                'INSERT INTO reminders (user_id, password_id, reminder_date, sent) VALUES (?, ?, ?, ?)',
+                reminders
+            )
+
+    with db.pool.writer() as conn:
+        conn.execute('ANALYZE')
+    db.close()
+
+    # Переносим WAL в основной файл, чтобы в кэше лежала одна база
+    conn = sqlite3.connect(tmp_path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    os.replace(tmp_path, path)
+
+
+def open_synthetic_db(db_dir: str, users: int, per_user: int) -> str:
+    """Синтетическая база из кэша на диске; строится при первом запуске"""
+    path = synthetic_db_path(db_dir, users, per_user)
+    if not os.path.exists(path):
+        os.makedirs(db_dir, exist_ok=True)
+        print(f"Building synthetic database {path}...", file=sys.stderr)
+        started = time.perf_counter()
+        build_synthetic_db(path, users, per_user)
+        print(f"Built {path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return path
+
+
+def bench_database(db_dir: str = DB_DIR, users: int = DB_USERS, scales=DB_PASSWORDS_PER_USER,
+                   min_time: float = 0.2) -> List[Dict]:
+    """Время каждого запроса DatabaseManager на синтетических базах (запросов в секунду)"""
+    results = []
+
+    for per_user in scales:
+        path = open_synthetic_db(db_dir, users, per_user)
+        db = DatabaseManager(path)
+        # Менеджер без кэшей показывает стоимость самого запроса к SQLite
+        uncached = DatabaseManager(path, cache_size=0)
+        rng = random.Random(DB_SEED)
+
+        def user() -> int:
+            return rng.randint(1, users)
+
+        def second_page():
+            user_id = user()
+            rows, _ = db.get_user_password_list_page(user_id, None, 10)
+            return db.get_user_passwords_page(user_id, (rows[-1][2], rows[-1][0]), 10)
+
+        def save_schedule_delete():
+            user_id = user()
+            password_id = db.save_password(user_id, 'bench.example', os.urandom(64), os.urandom(16))
+            db.schedule_annual_reminder(user_id, password_id)
+            db.delete_passwords([password_id], user_id)
+
+        hot_user = user()
+        settings = db.get_user_settings(hot_user)
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with db.pool.reader() as conn:
+            # Повторная пометка уже отправленных напоминаний не меняет данные
+            sent_ids = [row[0] for row in conn.execute('SELECT id FROM reminders WHERE sent = 1 LIMIT 100')]
+
+        cases = {
+            'user_exists.cached': lambda: db.user_exists(hot_user),
+            'user_exists': lambda: uncached.user_exists(user()),
+            'get_master_credentials': lambda: db.get_master_credentials(user()),
+            'get_user_settings.cached': lambda: db.get_user_settings(hot_user),
+            'get_user_settings': lambda: uncached.get_user_settings(user()),
+            'update_user_settings': lambda: db.update_user_settings(hot_user, settings),
+            'get_user_passwords': lambda: db.get_user_passwords(user()),
+            'get_user_passwords_page.first': lambda: db.get_user_passwords_page(user(), None, 10),
+            'get_user_passwords_page.next': second_page,
+            'get_user_password_list_page': lambda: db.get_user_password_list_page(user(), None, 10),
+            'get_password_by_id': lambda: db.get_password_by_id(rng.randint(1, users * per_user), user()),
+            # Подстрока шестнадцатеричной части названий: поиск по триграммам и, для
+            # запроса короче триграммы, LIKE по записям пользователя
+            'search_passwords.fts': lambda: db.search_passwords(user(), f'{rng.getrandbits(12):03x}', 10),
+            'search_passwords.like': lambda: db.search_passwords(user(), f'{rng.getrandbits(8):02x}', 10),
+            'save_schedule_delete': save_schedule_delete,
+            'get_upcoming_reminders': lambda: db.get_upcoming_reminders((now, 0), 1000),
+            'get_pending_reminders_page': lambda: db.get_pending_reminders_page(None, 500),
+            'mark_reminders_sent': lambda: db.mark_reminders_sent(sent_ids),
+        }
+
+        for name, func in cases.items():
+            seconds = measure(func, min_time)
+            results.append({
+                'name': f'db.{per_user}.{name}',
+                'size': users * per_user,
+                'seconds': seconds,
+                'per_s': 1 / seconds
+            })
+
+        db.close()
+        uncached.close()
+
+    return results
+
+
+def print_results(results: List[Dict]):
+    """Вывод результатов таблицей"""
+    for result in results:
+        if 'mb_per_s' in result:
+            rate = f"{result['mb_per_s']:>10.1f} MB/s"
+        else:
+            rate = f"{result['per_s']:>10.0f} /s"
+        print(f"{result['name']:<44} {result['size']:>9} "
+              f"{result['seconds'] * 1e6:>12.1f} us {rate}")
+
+
+def save_results(path: str, results: List[Dict]):
+    """Сохранение результатов в JSON вместе с описанием окружения"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+            'results': results
+        }, f, indent=2)
+
+
+def compare_results(results: List[Dict], baseline_path: str,
+                    threshold: float = REGRESSION_THRESHOLD) -> List[Dict]:
+    """Сравнение с базовой линией; возвращает замедлившиеся измерения"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {
+            (result['name'], result['size']): result['seconds']
+            for result in json.load(f)['results']
+        }
+
+    regressions = []
+    for result in results:
+        base = baseline.get((result['name'], result['size']))
+        if base is None:
+            continue
+        ratio = result['seconds'] / base
+        regressed = ratio > 1 + threshold
+        print(f"{result['name']:<44} {result['size']:>9} {ratio:>8.2f}x"
+              f"{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append({**result, 'baseline_seconds': base, 'ratio': ratio})
+    return regressions
+
+
+SUITES = {
+    'kdf': bench_kdf,
+    'ciphers': bench_ciphers,
+    'entries': bench_entries,
+    'generation': bench_generation,
+    'database': bench_database,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Password manager benchmarks')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per measurement')
+    parser.add_argument('--only', nargs='+', choices=list(SUITES), help='suites to run')
+    parser.add_argument('--db-dir', default=DB_DIR, help='directory for cached synthetic databases')
+    parser.add_argument('--db-users', type=int, default=DB_USERS, help='users per synthetic database')
+    parser.add_argument('--db-scales', type=int, nargs='+', default=list(DB_PASSWORDS_PER_USER),
+                        help='passwords per user, one synthetic database for each value')
+    parser.add_argument('--json', metavar='PATH', help='write results to a JSON file')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as the new baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='allowed slowdown before a result is reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in args.only or SUITES:
+        if name == 'database':
+            suite_results = bench_database(args.db_dir, args.db_users, args.db_scales, args.min_time)
+        else:
+            suite_results = SUITES[name](min_time=args.min_time)
+        print_results(suite_results)
+        results.extend(suite_results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            save_results(path, results)
+
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} measurements regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,35 @@
+import asyncio
 import logging
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import secrets
+import signal
+from typing import Optional
+
+from telegram import Bot, Update
 from telegram.ext import Application
 
-from config import BOT_TOKEN, LOG_CONFIG
+from config import (LOG_CONFIG, DB_PATH, DB_POOL_READERS, DB_SHARDS, CRYPTO_WORKERS, CRYPTO_QUEUE_LIMIT,
+                    KEY_CACHE_SIZE, KEY_CACHE_TTL, CIPHER, REMINDER_RATE_LIMIT, REMINDER_CONCURRENCY,
+                    REMINDER_PAGE_SIZE, REMINDER_COMMIT_BATCH, REMINDER_WINDOW,
+                    USER_CACHE_SIZE, USER_CACHE_TTL, SESSION_MAX_SIZE, SESSION_IDLE_TTL, SESSION_DB_PATH,
+                    WORDLIST_PATH, METRICS_HOST, METRICS_PORT, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST,
+                    WEBHOOK_PORT, WEBHOOK_PATH, UPDATE_QUEUE_SIZE, CONCURRENT_UPDATES, MAINTENANCE_HOUR,
+                    REMINDER_RETENTION_DAYS, MAINTENANCE_BATCH_SIZE, MAINTENANCE_BATCH_PAUSE, OUTBOUND_GLOBAL_RATE,
+                    OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_MAX_RETRIES, PROFILE_SAMPLE_RATE,
+                    PROFILE_INTERVAL, PROFILE_PATH, PROFILE_MAX_BYTES, PROFILE_BACKUP_COUNT, SLOW_UPDATE_THRESHOLD)
+from crypto_service import CryptoService
 from database import DatabaseManager
 from encryption import EncryptionManager
-from password_generator import PasswordGenerator
+from password_generator import DEFAULT_WORDLIST_PATH, PasswordGenerator
+from reminders import ReminderDispatcher, ReminderScheduler
+from sessions import SessionPersistence, SessionStore
 from handlers import Handlers
+from maintenance import MaintenanceScheduler
+from outbound import LANES, OutboundQueue
+from profiling import StackSampler, UpdateProfiler
+from http_server import HttpServer, Response
+from metrics import LoopLagMonitor, MetricsRegistry, instrument_handler, instrument_methods
+from update_processor import UserOrderedUpdateProcessor
+from webhook import WebhookIngress
 
 # Настройка логирования
 logging.basicConfig(**LOG_CONFIG)
@@ -15,65 +38,237 @@ logger = logging.getLogger(__name__)
 class PasswordManagerBot:
     """Основной класс бота для управления паролями"""
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, bot: Optional[Bot] = None, db_path: str = DB_PATH):
         self.token = token
-        self.application = Application.builder().token(token).build()
-        self.db = DatabaseManager()
-        self.encryption = EncryptionManager()
-        self.generator = PasswordGenerator()
-        self.scheduler = None
+        # Готовый bot подставляется в тестах и нагрузочных прогонах вместо настоящего API
+        # Ограниченная очередь: при переполнении вебхук отвечает 503, а опрос ждет
+        builder = Application.builder().update_queue(asyncio.Queue(maxsize=UPDATE_QUEUE_SIZE))
+        self.update_processor: Optional[UserOrderedUpdateProcessor] = None
+        if CONCURRENT_UPDATES > 1:
+            self.update_processor = UserOrderedUpdateProcessor(CONCURRENT_UPDATES)
+            builder = builder.concurrent_updates(self.update_processor)
+        # Все вызовы Bot API идут через общую очередь; у готового bot очередь задается при его создании
+        self.outbound: Optional[OutboundQueue] = None
+        if bot is not None:
+            rate_limiter = getattr(bot, 'rate_limiter', None)
+            self.outbound = rate_limiter if isinstance(rate_limiter, OutboundQueue) else None
+            builder = builder.bot(bot)
+        else:
+            if OUTBOUND_GLOBAL_RATE > 0:
+                self.outbound = OutboundQueue(OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+                                              OUTBOUND_MAX_RETRIES)
+                builder = builder.rate_limiter(self.outbound)
+            builder = builder.token(token)
+        # С SESSION_DB_PATH сессии и состояния диалогов переживают перезапуск
+        self.sessions = SessionStore(SESSION_MAX_SIZE, SESSION_IDLE_TTL, db_path=SESSION_DB_PATH or None)
+        if self.sessions.persistent:
+            builder = builder.persistence(SessionPersistence(self.sessions))
+        self.application = builder.build()
+        self.db = DatabaseManager(
+            db_path,
+            readers=DB_POOL_READERS,
+            cache_size=USER_CACHE_SIZE,
+            cache_ttl=USER_CACHE_TTL,
+            shards=DB_SHARDS
+        )
+        self.encryption = EncryptionManager(KEY_CACHE_SIZE, KEY_CACHE_TTL, CIPHER)
+        self.generator = PasswordGenerator(WORDLIST_PATH or DEFAULT_WORDLIST_PATH)
+        self.crypto = CryptoService(self.encryption, CRYPTO_WORKERS or None, CRYPTO_QUEUE_LIMIT)
+        self.reminders = ReminderDispatcher(
+            self.db,
+            self.application.bot,
+            rate_limit=REMINDER_RATE_LIMIT,
+            concurrency=REMINDER_CONCURRENCY,
+            page_size=REMINDER_PAGE_SIZE,
+            commit_batch=REMINDER_COMMIT_BATCH
+        )
+        self.scheduler = ReminderScheduler(self.db, self.reminders, window=REMINDER_WINDOW)
+        self.maintenance: Optional[MaintenanceScheduler] = None
+        if MAINTENANCE_HOUR >= 0:
+            self.maintenance = MaintenanceScheduler(
+                self.db,
+                hour=MAINTENANCE_HOUR,
+                retention_days=REMINDER_RETENTION_DAYS,
+                batch_size=MAINTENANCE_BATCH_SIZE,
+                pause=MAINTENANCE_BATCH_PAUSE
+            )
         
         # Инициализация обработчиков
-        self.handlers = Handlers(self.db, self.encryption, self.generator)
+        self.handlers = Handlers(self.db, self.encryption, self.generator, self.crypto, self.sessions)
+
+        self.metrics: Optional[MetricsRegistry] = None
+        self.metrics_server: Optional[HttpServer] = None
+        self.loop_lag = LoopLagMonitor()
+        if METRICS_PORT:
+            self.setup_metrics()
+
+        # Без настроек профилирования ничего не оборачивается
+        self.profiler: Optional[UpdateProfiler] = None
+        if PROFILE_SAMPLE_RATE > 0 or SLOW_UPDATE_THRESHOLD > 0:
+            self.setup_profiling()
+
         self.setup_handlers()
 
+    def setup_metrics(self):
+        """Метрики обработчиков, запросов к базе и криптографии"""
+        self.metrics = MetricsRegistry()
+        self.metrics_server = HttpServer(METRICS_HOST, METRICS_PORT)
+        self.metrics_server.route('GET', '/metrics', self.serve_metrics)
+
+        instrument_methods(
+            self.db,
+            self.metrics.histogram('bot_db_query_seconds', 'DatabaseManager call latency', ['query']),
+            self.metrics.counter('bot_db_query_errors_total', 'DatabaseManager call errors', ['query']),
+            exclude=['close', 'init_database', 'cache_stats']
+        )
+        # Время вызовов CryptoService с учетом очереди пула и кэша ключей,
+        # отдельно - чистое время каждой KDF в процессе пула
+        self.crypto.kdf_latency = self.metrics.histogram(
+            'bot_kdf_seconds', 'KDF run time in the crypto process pool', ['kdf']
+        )
+        instrument_methods(
+            self.crypto,
+            self.metrics.histogram('bot_crypto_seconds', 'Crypto process pool call latency', ['operation']),
+            self.metrics.counter('bot_crypto_errors_total', 'Crypto process pool call errors', ['operation']),
+            exclude=['shutdown']
+        )
+
+        self.metrics.gauge('bot_active_sessions', 'Dialog sessions in memory',
+                           function=lambda: len(self.sessions))
+        self.metrics.gauge('bot_pending_reminders', 'Due reminders not sent yet',
+                           function=self.db.count_pending_reminders)
+        self.metrics.gauge('bot_event_loop_lag_seconds', 'Max event loop lag over the last minute',
+                           function=self.loop_lag.max_lag)
+        self.metrics.gauge('bot_update_queue_depth', 'Updates waiting for processing',
+                           function=lambda: self.application.update_queue.qsize())
+        if self.update_processor is not None:
+            self.metrics.gauge('bot_updates_in_flight', 'Updates taken from the queue and not finished yet',
+                               function=lambda: self.update_processor.pending)
+            self.metrics.gauge('bot_update_users_active', 'Users with updates in flight',
+                               function=lambda: self.update_processor.active_users)
+        if self.outbound is not None:
+            for lane in LANES:
+                self.metrics.gauge(f'bot_outbound_{lane}_queue_depth', f'Outbound {lane} requests waiting or in flight',
+                                   function=lambda lane=lane: self.outbound.queued[lane])
+            self.metrics.gauge('bot_outbound_coalesced_edits', 'Message edits skipped for a newer edit',
+                               function=lambda: self.outbound.coalesced)
+            self.metrics.gauge('bot_outbound_retries', 'Requests retried after RetryAfter',
+                               function=lambda: self.outbound.retries)
+        if self.maintenance is not None:
+            self.metrics.gauge('bot_maintenance_reclaimed_bytes', 'Bytes reclaimed by the last maintenance run',
+                               function=lambda: self.maintenance.last_report.get('reclaimed_bytes', 0))
+            self.metrics.gauge('bot_maintenance_purged_reminders', 'Reminders purged by the last maintenance run',
+                               function=lambda: sum(self.maintenance.last_report.get(kind, 0)
+                                                    for kind in ('sent', 'orphaned')))
+
+    def setup_profiling(self):
+        """Сэмплирующий профайлер и журнал медленных обновлений"""
+        sampler = None
+        if PROFILE_SAMPLE_RATE > 0:
+            sampler = StackSampler(PROFILE_PATH, PROFILE_INTERVAL, PROFILE_MAX_BYTES, PROFILE_BACKUP_COUNT)
+        self.profiler = UpdateProfiler(PROFILE_SAMPLE_RATE, SLOW_UPDATE_THRESHOLD, sampler)
+        self.profiler.instrument(self.db, 'db', exclude=['close', 'init_database', 'cache_stats'])
+        self.profiler.instrument(self.crypto, 'crypto', exclude=['shutdown'])
+        if self.metrics is not None:
+            self.metrics.gauge('bot_slow_updates', 'Updates slower than SLOW_UPDATE_THRESHOLD',
+                               function=lambda: self.profiler.slow_updates)
+
+    async def serve_metrics(self, request) -> Response:
+        """Метрики в текстовом формате Prometheus"""
+        return Response(200, self.metrics.render().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+
     def setup_handlers(self):
         """Настройка обработчиков команд"""
+        if self.metrics is not None:
+            latency = self.metrics.histogram('bot_handler_seconds', 'Update handler latency', ['handler'])
+            errors = self.metrics.counter('bot_handler_errors_total', 'Update handler errors', ['handler'])
+
         for handler in self.handlers.get_handlers():
+            if self.metrics is not None:
+                instrument_handler(handler, latency, errors)
+            if self.profiler is not None:
+                self.profiler.wrap(handler)
             self.application.add_handler(handler)
 
     async def setup_scheduler(self):
-        """Настройка планировщика для напоминаний"""
-        if self.scheduler is None:
-            self.scheduler = AsyncIOScheduler()
-            self.scheduler.add_job(
-                self.send_annual_reminders,
-                'cron',
-                hour=9,
-                minute=0
-            )
-            self.scheduler.start()
-
-    async def send_annual_reminders(self):
-        """Отправка ежегодных напоминаний о смене паролей"""
-        logger.info("Checking for password reminders...")
-        try:
-            reminders = self.db.get_pending_reminders()
-            
-            for reminder_id, user_id, password_id, service_name in reminders:
-                try:
-                    import html
-                    escaped_service = html.escape(service_name)
-                    await self.application.bot.send_message(
-                        chat_id=user_id,
-                        text=f"🔔 <b>Напоминание о смене пароля</b>\n\n"
-                             f"Прошел год с момента создания пароля для <b>{escaped_service}</b>.\n"
-                             f"Рекомендуем сменить пароль для обеспечения безопасности.",
-                        parse_mode='HTML'
-                    )
-                    self.db.mark_reminder_sent(reminder_id)
-                except Exception as e:
-                    logger.error(f"Error sending reminder to user {user_id}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Error in send_annual_reminders: {e}")
+        """Запуск планировщиков напоминаний и обслуживания базы"""
+        self.scheduler.start()
+        if self.maintenance is not None:
+            self.maintenance.start()
 
     async def post_init(self, application: Application):
         """Выполняется после инициализации бота"""
         await self.setup_scheduler()
+        self.sessions.start()
+        if self.profiler is not None:
+            self.profiler.start()
+        if self.metrics_server is not None:
+            self.loop_lag.start()
+            await self.metrics_server.start()
+
+    async def post_shutdown(self, application: Application):
+        """Выполняется после остановки бота"""
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+            await self.loop_lag.stop()
+        await self.scheduler.stop()
+        if self.maintenance is not None:
+            await self.maintenance.stop()
+        await self.sessions.stop()
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.crypto.shutdown()
+        self.db.close()
 
     def run(self):
         """Запуск бота"""
         logger.info("Starting Password Manager Bot...")
+        if WEBHOOK_PORT:
+            asyncio.run(self.run_webhook())
+            return
+
         self.application.post_init = self.post_init
-        self.application.run_polling()
\ No newline at end of file
+        self.application.post_shutdown = self.post_shutdown
+        self.application.run_polling()
+
+    async def run_webhook(self):
+        """Работа через вебхук до SIGINT/SIGTERM"""
+        if not WEBHOOK_SECRET and not WEBHOOK_URL:
+            # Случайный секрет знал бы только сам бот: ни одно обновление не прошло бы проверку
+            raise RuntimeError("Webhook mode needs WEBHOOK_SECRET, or WEBHOOK_URL to register the webhook "
+                               "with a generated secret")
+        secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        ingress = WebhookIngress(
+            self.application, secret, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH,
+            backlog=(lambda: self.update_processor.pending) if self.update_processor is not None else None,
+            max_backlog=UPDATE_QUEUE_SIZE
+        )
+        if self.metrics is not None:
+            self.metrics.gauge('bot_webhook_rejected_updates', 'Webhook updates rejected with 503',
+                               function=lambda: ingress.rejected)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        await self.application.initialize()
+        await self.post_init(self.application)
+        await self.application.start()
+        await ingress.start()
+        try:
+            if WEBHOOK_URL:
+                await self.application.bot.set_webhook(
+                    url=WEBHOOK_URL,
+                    secret_token=secret,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info(f"Webhook registered at {WEBHOOK_URL}")
+            await stop.wait()
+        finally:
+            logger.info("Stopping Password Manager Bot...")
+            await ingress.stop()
+            await self.application.stop()
+            # Как и run_polling: post_shutdown после shutdown, который сбрасывает персистентность
+            await self.application.shutdown()
+            await self.post_shutdown(self.application)
\ No newline at end of file
@@ -14,3 +14,99 @@ LOG_CONFIG = {
 
 
 DB_PATH = 'password_manager.db'
+DB_POOL_READERS = int(os.getenv('DB_POOL_READERS', '4'))
+
+# Число файлов-шардов базы (1 - один файл DB_PATH); менять только вместе с reshard.py
+DB_SHARDS = int(os.getenv('DB_SHARDS', '1'))
+
+# Кэш существования пользователей и их настроек генерации (секунды)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# Пул процессов для PBKDF2 и шифрования (0 - по числу ядер)
+CRYPTO_WORKERS = int(os.getenv('CRYPTO_WORKERS', '0'))
+CRYPTO_QUEUE_LIMIT = int(os.getenv('CRYPTO_QUEUE_LIMIT', '64'))
+
+# Кэш ключей хранилища пользователей (секунды)
+KEY_CACHE_SIZE = int(os.getenv('KEY_CACHE_SIZE', '1024'))
+KEY_CACHE_TTL = int(os.getenv('KEY_CACHE_TTL', '900'))
+
+# AEAD-шифр для новых записей: aes-gcm или chacha20-poly1305
+CIPHER = os.getenv('CIPHER', 'aes-gcm')
+
+# Рассылка напоминаний: сообщений в секунду (лимит Telegram - около 30),
+# одновременных отправок, размер страницы и пачки подтверждений
+REMINDER_RATE_LIMIT = float(os.getenv('REMINDER_RATE_LIMIT', '25'))
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', '32'))
+REMINDER_PAGE_SIZE = int(os.getenv('REMINDER_PAGE_SIZE', '500'))
+REMINDER_COMMIT_BATCH = int(os.getenv('REMINDER_COMMIT_BATCH', '100'))
+
+# Исходящие запросы к Bot API: общий лимит бота в секунду (0 - без очереди),
+# лимит и всплеск для одного чата, повторы после RetryAfter
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+
+# Сколько ближайших напоминаний планировщик держит в памяти
+REMINDER_WINDOW = int(os.getenv('REMINDER_WINDOW', '1000'))
+
+# Незавершенные диалоги: максимум сессий, время простоя до удаления (секунды)
+# и необязательный файл SQLite для переживания перезапусков
+SESSION_MAX_SIZE = int(os.getenv('SESSION_MAX_SIZE', '10000'))
+SESSION_IDLE_TTL = int(os.getenv('SESSION_IDLE_TTL', '900'))
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', '')
+
+# Записей на одной странице /list
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', '10'))
+
+# Результатов поиска в /find и в inline-режиме
+FIND_RESULTS_LIMIT = int(os.getenv('FIND_RESULTS_LIMIT', '10'))
+INLINE_RESULTS_LIMIT = int(os.getenv('INLINE_RESULTS_LIMIT', '10'))
+
+# Максимум паролей в одной команде /generate N
+GENERATE_MAX_BATCH = int(os.getenv('GENERATE_MAX_BATCH', '1000'))
+
+# Список слов для режима парольной фразы (формат diceware или одно слово в строке)
+WORDLIST_PATH = os.getenv('WORDLIST_PATH', '')
+
+# Метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - выключены)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# Режим вебхука вместо run_polling (WEBHOOK_PORT 0 - опрос). Если задан WEBHOOK_URL,
+# бот сам регистрирует вебхук в Telegram (без секрета - со случайным), иначе WEBHOOK_SECRET обязателен
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '0'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+
+# Максимум обновлений, ожидающих обработки (при переполнении вебхук отвечает 503)
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+
+# Сколько обновлений обрабатывать одновременно (обновления одного пользователя - по порядку)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+
+# Импорт и экспорт хранилища: предел размера файла, записей в одной транзакции
+# и число итераций PBKDF2 для ключа файла экспорта
+IMPORT_MAX_FILE_SIZE = int(os.getenv('IMPORT_MAX_FILE_SIZE', str(5 * 1024 * 1024)))
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+EXPORT_KDF_ITERATIONS = int(os.getenv('EXPORT_KDF_ITERATIONS', '600000'))
+
+# Профилирование (по умолчанию выключено): доля обновлений под сэмплирующим
+# профайлером, интервал сэмплов (секунды), файл профилей и его ротация,
+# порог медленного обновления для журнала (секунды, 0 - без журнала)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_PATH = os.getenv('PROFILE_PATH', 'profiles/updates.folded')
+PROFILE_MAX_BYTES = int(os.getenv('PROFILE_MAX_BYTES', str(10 * 1024 * 1024)))
+PROFILE_BACKUP_COUNT = int(os.getenv('PROFILE_BACKUP_COUNT', '5'))
+SLOW_UPDATE_THRESHOLD = float(os.getenv('SLOW_UPDATE_THRESHOLD', '0'))
+
+# Обслуживание базы: час ежедневного запуска (UTC, -1 - выключено), сколько дней
+# хранить отправленные напоминания, размер пачки удаления и пауза между пачками
+MAINTENANCE_HOUR = int(os.getenv('MAINTENANCE_HOUR', '4'))
+REMINDER_RETENTION_DAYS = int(os.getenv('REMINDER_RETENTION_DAYS', '30'))
+MAINTENANCE_BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '1000'))
+MAINTENANCE_BATCH_PAUSE = float(os.getenv('MAINTENANCE_BATCH_PAUSE', '0.05'))
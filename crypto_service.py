@@ -0,0 +1,150 @@
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from database import hash_password
+from encryption import EncryptionManager
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(func, *args):
+    """Выполнение в процессе пула с замером чистого времени, без ожидания очереди"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class CryptoService:
+    """Асинхронный сервис для CPU-тяжелых криптографических операций
+
+    PBKDF2 и шифрование выполняются в пуле процессов, поэтому event loop
+    продолжает обрабатывать обновления других пользователей.
+    """
+
+    def __init__(self, encryption: EncryptionManager, workers: Optional[int] = None, queue_limit: int = 64):
+        self.encryption = encryption
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = max(queue_limit, self.workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Ограничивает число задач, переданных в пул одновременно
+        self._slots = asyncio.Semaphore(self.queue_limit)
+        # Генерации ключей хранилища, которые уже выполняются в пуле
+        self._pending_keys: Dict[bytes, asyncio.Future] = {}
+        # Гистограмма времени KDF с меткой kdf (задается при включенных метриках)
+        self.kdf_latency = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Ленивое создание пула процессов"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    async def _run(self, func, *args):
+        """Выполнение функции в пуле процессов с ограничением очереди"""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def _run_kdf(self, name: str, func, *args):
+        """Запуск KDF в пуле; время самого вычисления попадает в kdf_latency"""
+        if self.kdf_latency is None:
+            return await self._run(func, *args)
+        result, seconds = await self._run(_timed, func, *args)
+        self.kdf_latency.observe(seconds, name)
+        return result
+
+    async def hash_password(self, password: str, salt: bytes) -> str:
+        """Хеширование мастер-пароля"""
+        return await self._run_kdf('hash_password', hash_password, password, salt)
+
+    async def verify_master_password(self, db, user_id: int, password: str) -> bool:
+        """Проверка мастер-пароля"""
+        result = db.get_master_credentials(user_id)
+        if not result:
+            return False
+
+        stored_hash, salt = result
+        computed_hash = await self.hash_password(password, salt)
+        return hmac.compare_digest(stored_hash, computed_hash)
+
+    async def generate_key(self, password: str, salt: bytes) -> bytes:
+        """Генерация ключа из пароля"""
+        return await self._run_kdf('generate_key', EncryptionManager.generate_key, password, salt)
+
+    async def get_vault_key(self, key: bytes) -> bytes:
+        """Ключ хранилища пользователя: из кэша или одна генерация в пуле"""
+        vault_key = self.encryption.key_cache.get(key)
+        if vault_key is not None:
+            return vault_key
+
+        # Одновременные запросы одного пользователя ждут одну и ту же генерацию;
+        # отмена любого из них, в том числе первого, генерацию не прерывает
+        pending = self._pending_keys.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._run_kdf('derive_vault_key', EncryptionManager.derive_vault_key, key))
+            self._pending_keys[key] = pending
+            pending.add_done_callback(lambda future: self._vault_key_done(key, future))
+
+        return await asyncio.shield(pending)
+
+    def _vault_key_done(self, key: bytes, future: asyncio.Future):
+        """Кэширование готового ключа хранилища, даже если ждавшие его уже отменены"""
+        if self._pending_keys.get(key) is future:
+            del self._pending_keys[key]
+        # exception() заодно помечает ошибку полученной, если ждущих не осталось
+        if not future.cancelled() and future.exception() is None:
+            self.encryption.key_cache.set(key, future.result())
+
+    async def encrypt(self, data: str, key: bytes) -> Dict[str, bytes]:
+        """Шифрование данных"""
+        vault_key = await self.get_vault_key(key)
+        return EncryptionManager.encrypt_entry(data, vault_key, self.encryption.cipher)
+
+    async def decrypt(self, encrypted_data: bytes, salt: bytes, key: bytes) -> str:
+        """Дешифрование данных"""
+        vault_key = await self.get_vault_key(key)
+        decrypted = EncryptionManager.decrypt_entry(encrypted_data, salt, vault_key)
+        if decrypted is None:
+            decrypted = await self._run_kdf('decrypt_legacy', EncryptionManager.decrypt_legacy,
+                                            encrypted_data, salt, key)
+        return decrypted
+
+    async def decrypt_many(self, entries: Sequence[Tuple[bytes, bytes]],
+                           key: bytes) -> List[Union[str, Exception]]:
+        """Дешифрование набора записей: одна генерация ключа хранилища и N ключей записей"""
+        vault_key = await self.get_vault_key(key)
+        results: List[Union[str, Exception, None]] = []
+        legacy = []
+
+        for index, (encrypted_data, salt) in enumerate(entries):
+            try:
+                decrypted = EncryptionManager.decrypt_entry(encrypted_data, salt, vault_key)
+            except Exception as e:
+                decrypted = e
+            if decrypted is None:
+                legacy.append((index, self._run_kdf('decrypt_legacy', EncryptionManager.decrypt_legacy,
+                                                    encrypted_data, salt, key)))
+            results.append(decrypted)
+
+        # Записи старого формата требуют PBKDF2 на каждую, считаем их параллельно
+        if legacy:
+            decrypted_legacy = await asyncio.gather(*(task for _, task in legacy), return_exceptions=True)
+            for (index, _), decrypted in zip(legacy, decrypted_legacy):
+                results[index] = decrypted
+
+        return results
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
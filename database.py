@@ -1,79 +1,421 @@
 import sqlite3
 import logging
 import hashlib
+import heapq
 import hmac
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Маркер отсутствия значения в кэше (False и None - допустимые значения)
+_MISSING = object()
+
+def hash_password(password: str, salt: bytes) -> str:
+    """Хеширование мастер-пароля (PBKDF2-SHA256, 100 000 итераций)"""
+    return hashlib.pbkdf2_hmac(
+        'sha256',
+        password.encode('utf-8'),
+        salt,
+        100000
+    ).hex()
+
+
+# Миграции схемы: (версия, SQL-команды). Текущая версия хранится в PRAGMA user_version,
+# каждая миграция применяется в отдельной транзакции вместе с обновлением версии.
+MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            master_password_hash TEXT NOT NULL,
+            salt BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS password_settings (
+            user_id INTEGER PRIMARY KEY,
+            length INTEGER DEFAULT 16,
+            use_uppercase BOOLEAN DEFAULT 1,
+            use_lowercase BOOLEAN DEFAULT 1,
+            use_digits BOOLEAN DEFAULT 1,
+            use_special BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS passwords (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            service_name TEXT NOT NULL,
+            encrypted_password BLOB NOT NULL,
+            salt BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_reminder_sent TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            password_id INTEGER NOT NULL,
+            reminder_date DATE NOT NULL,
+            sent BOOLEAN DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (password_id) REFERENCES passwords (id)
+        )
+        '''
+    ]),
+    (2, [
+        'CREATE INDEX IF NOT EXISTS idx_passwords_user_created ON passwords (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders (reminder_date) WHERE sent = 0'
+    ]),
+    (3, [
+        # Покрывающий индекс для списков без зашифрованных данных
+        'CREATE INDEX IF NOT EXISTS idx_passwords_user_listing ON passwords (user_id, created_at, id, service_name)',
+        'DROP INDEX IF EXISTS idx_passwords_user_created',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_password ON reminders (password_id)'
+    ]),
+    (4, [
+        # Режим генерации: символы или парольная фраза из слов
+        "ALTER TABLE password_settings ADD COLUMN mode TEXT DEFAULT 'chars'",
+        'ALTER TABLE password_settings ADD COLUMN word_count INTEGER DEFAULT 6'
+    ]),
+    (5, [
+        # Напоминания удаляются вместе с паролем; оставшиеся сироты чистит maintenance.py
+        '''
+        CREATE TRIGGER IF NOT EXISTS passwords_delete_reminders AFTER DELETE ON passwords BEGIN
+            DELETE FROM reminders WHERE password_id = old.id;
+        END
+        '''
+    ]),
+    (6, [
+        # Покрывающий частичный индекс для очереди напоминаний; sent в колонках
+        # индекса нужен SQLite, чтобы условие sent = 0 не читало таблицу
+        'DROP INDEX IF EXISTS idx_reminders_pending',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_pending '
+        'ON reminders (reminder_date, id, user_id, password_id, sent) WHERE sent = 0'
+    ])
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Поисковый индекс по названиям сервисов: FTS5 с токенизатором trigram ищет
+# подстроку без учета регистра. Индекс без собственного содержимого хранит
+# только id записи; user_key вида x<user_id>x ограничивает поиск одним
+# пользователем прямо в индексе. Поддерживается триггерами на passwords.
+SEARCH_INDEX_STATEMENTS = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS passwords_fts
+    USING fts5(user_key, service_name, content='', tokenize='trigram')
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS passwords_fts_insert AFTER INSERT ON passwords BEGIN
+        INSERT INTO passwords_fts (rowid, user_key, service_name)
+        VALUES (new.id, 'x' || new.user_id || 'x', new.service_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS passwords_fts_delete AFTER DELETE ON passwords BEGIN
+        INSERT INTO passwords_fts (passwords_fts, rowid, user_key, service_name)
+        VALUES ('delete', old.id, 'x' || old.user_id || 'x', old.service_name);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS passwords_fts_update AFTER UPDATE OF user_id, service_name ON passwords BEGIN
+        INSERT INTO passwords_fts (passwords_fts, rowid, user_key, service_name)
+        VALUES ('delete', old.id, 'x' || old.user_id || 'x', old.service_name);
+        INSERT INTO passwords_fts (rowid, user_key, service_name)
+        VALUES (new.id, 'x' || new.user_id || 'x', new.service_name);
+    END
+    ''',
+    '''
+    INSERT INTO passwords_fts (rowid, user_key, service_name)
+    SELECT id, 'x' || user_id || 'x', service_name FROM passwords
+    '''
+]
+
+# Короче трех символов trigram-индекс не ищет, такие запросы идут через LIKE
+SEARCH_MIN_TRIGRAM = 3
+
+
+def fts5_trigram_available() -> bool:
+    """Поддержка FTS5 с токенизатором trigram в этой сборке SQLite (3.34+)"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute("CREATE VIRTUAL TABLE probe USING fts5(text, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+    return True
+
+# Идентификаторы напоминаний уникальны между шардами: шард N выдает id
+# из диапазона [N << REMINDER_ID_SHIFT, (N + 1) << REMINDER_ID_SHIFT),
+# поэтому по id напоминания всегда известен его шард
+REMINDER_ID_SHIFT = 40
+
+
+def shard_index(user_id: int, shards: int) -> int:
+    """Номер шарда пользователя: стабильный хеш, не зависящий от запуска"""
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def shard_paths(db_path: str, shards: int) -> List[str]:
+    """Файлы шардов; без шардирования - сам db_path"""
+    if shards <= 1:
+        return [db_path]
+    root, extension = os.path.splitext(db_path)
+    return [f'{root}.shard-{index}-of-{shards}{extension}' for index in range(shards)]
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite: один писатель и несколько читателей"""
+
+    def __init__(self, db_path: str, readers: int = 4, cache_size_kb: int = 8192,
+                 mmap_size: int = 64 * 1024 * 1024, cached_statements: int = 256):
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+
+        # Писатель создается первым: он создает файл базы и переводит его в WAL
+        self._writer = self._connect(read_only=False)
+        self._write_lock = threading.Lock()
+
+        # Читатели открываются лениво, None в очереди означает свободный слот
+        self._readers: queue.Queue = queue.Queue()
+        for _ in range(max(readers, 1)):
+            self._readers.put(None)
+        self._opened: List[sqlite3.Connection] = []
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        """Открытие соединения с настроенными PRAGMA"""
+        if read_only:
+            conn = sqlite3.connect(
+                f'file:{quote(self.db_path)}?mode=ro',
+                uri=True,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=self.cached_statements
+            )
+        else:
+            conn = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=self.cached_statements
+            )
+            # Действует только для новой базы; существующую переводит VACUUM (maintenance.py --vacuum)
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+
+        conn.execute('PRAGMA busy_timeout = 5000')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Соединение только для чтения из пула"""
+        conn = self._readers.get()
+        try:
+            if conn is None:
+                conn = self._connect(read_only=True)
+                self._opened.append(conn)
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Единственное пишущее соединение внутри транзакции"""
+        with self._write_lock:
+            self._writer.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer.execute('ROLLBACK')
+                raise
+            else:
+                self._writer.execute('COMMIT')
+
+    def execute_autocommit(self, statement: str):
+        """Команда на пишущем соединении вне транзакции (VACUUM, wal_checkpoint, optimize)"""
+        with self._write_lock:
+            # executescript выполняет команду до конца; execute делает один шаг,
+            # и incremental_vacuum за вызов освободил бы одну страницу
+            self._writer.executescript(statement)
+
+    def writer_pragma(self, name: str):
+        """Значение PRAGMA на пишущем соединении
+
+        Читатели пула могут помнить заголовок файла до VACUUM, поэтому
+        режим auto_vacuum и размеры файла читаются у писателя.
+        """
+        with self._write_lock:
+            return self._writer.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def close(self):
+        """Закрытие всех соединений пула"""
+        for conn in self._opened:
+            conn.close()
+        self._opened.clear()
+        with self._write_lock:
+            self._writer.close()
+
+
 class DatabaseManager:
-    """Менеджер базы данных"""
+    """Менеджер базы данных
+
+    При shards > 1 данные лежат в нескольких файлах SQLite, у каждого свой
+    пул соединений и свой писатель. Пользователь целиком живет в одном шарде,
+    выбранном по shard_index, поэтому записи разных пользователей не ждут
+    друг друга. Общие задачи (напоминания) опрашивают шарды параллельно.
+    """
 
-    def __init__(self, db_path: str = 'password_manager.db'):
+    def __init__(self, db_path: str = 'password_manager.db', readers: int = 4,
+                 cache_size: int = 10000, cache_ttl: float = 300.0, shards: int = 1):
         self.db_path = db_path
+        self.pools = [ConnectionPool(path, readers=readers) for path in shard_paths(db_path, shards)]
+        # Первый шард; без шардирования - единственный пул
+        self.pool = self.pools[0]
+        self._fanout = ThreadPoolExecutor(len(self.pools), 'db-shard') if len(self.pools) > 1 else None
+        # Есть ли поисковый индекс в каждом шарде
+        self.search_index = [False] * len(self.pools)
+        # Кэши почти неизменяемых данных, читаемых почти в каждом обработчике
+        self.user_cache = TTLCache(cache_size, cache_ttl)
+        self.settings_cache = TTLCache(cache_size, cache_ttl)
+        # Подписчики на новые напоминания: вызываются с (reminder_id, reminder_date)
+        self.reminder_listeners: List[Callable[[int, str], None]] = []
         self.init_database()
 
+    def close(self):
+        """Закрытие пулов соединений"""
+        if self._fanout is not None:
+            self._fanout.shutdown()
+        for pool in self.pools:
+            pool.close()
+
+    def _shard(self, user_id: int) -> int:
+        """Номер шарда пользователя"""
+        if len(self.pools) == 1:
+            return 0
+        return shard_index(user_id, len(self.pools))
+
+    def _pool(self, user_id: int) -> ConnectionPool:
+        """Пул шарда пользователя"""
+        return self.pools[self._shard(user_id)]
+
+    def _map_shards(self, func: Callable[[ConnectionPool], object]) -> List:
+        """Выполнение функции на каждом шарде параллельно, результаты по порядку шардов"""
+        if self._fanout is None:
+            return [func(self.pool)]
+        return list(self._fanout.map(func, self.pools))
+
     def init_database(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    master_password_hash TEXT NOT NULL,
-                    salt BLOB NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+        """Инициализация базы данных и применение миграций на каждом шарде"""
+        trigram = fts5_trigram_available()
+        if not trigram:
+            logger.warning("SQLite has no FTS5 trigram tokenizer, service search falls back to LIKE")
 
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS password_settings (
-                    user_id INTEGER PRIMARY KEY,
-                    length INTEGER DEFAULT 16,
-                    use_uppercase BOOLEAN DEFAULT 1,
-                    use_lowercase BOOLEAN DEFAULT 1,
-                    use_digits BOOLEAN DEFAULT 1,
-                    use_special BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
+        for index, pool in enumerate(self.pools):
+            self._migrate(pool)
+            if index:
+                self._reserve_reminder_ids(pool, index)
+            self.search_index[index] = trigram and self._ensure_search_index(pool)
 
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS passwords (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    service_name TEXT NOT NULL,
-                    encrypted_password BLOB NOT NULL,
-                    salt BLOB NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_reminder_sent TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
+    @staticmethod
+    def _migrate(pool: ConnectionPool):
+        with pool.reader() as conn:
+            current_version = conn.execute('PRAGMA user_version').fetchone()[0]
 
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    password_id INTEGER NOT NULL,
-                    reminder_date DATE NOT NULL,
-                    sent BOOLEAN DEFAULT 0,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (password_id) REFERENCES passwords (id)
-                )
-            ''')
+        if current_version >= SCHEMA_VERSION:
+            return
+
+        for version, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
+            with pool.writer() as conn:
+                # Версию перепроверяем под блокировкой: базу мог обновить другой процесс
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {int(version)}')
+            logger.info(f"Applied database migration {version} to {pool.db_path}")
+
+    @staticmethod
+    def _ensure_search_index(pool: ConnectionPool) -> bool:
+        """Создание и заполнение поискового индекса, если его еще нет"""
+        def exists(conn) -> bool:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'passwords_fts'"
+            ).fetchone() is not None
+
+        with pool.reader() as conn:
+            if exists(conn):
+                return True
+
+        with pool.writer() as conn:
+            if not exists(conn):
+                for statement in SEARCH_INDEX_STATEMENTS:
+                    conn.execute(statement)
+                logger.info(f"Built service search index in {pool.db_path}")
+        return True
+
+    @staticmethod
+    def _reserve_reminder_ids(pool: ConnectionPool, index: int):
+        """Сдвиг счетчика AUTOINCREMENT напоминаний в диапазон шарда"""
+        start = index << REMINDER_ID_SHIFT
+        with pool.writer() as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'reminders'").fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('reminders', ?)", (start,))
+            elif row[0] < start:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'reminders'", (start,))
+
+    def _reminder_pool(self, reminder_id: int) -> ConnectionPool:
+        """Пул шарда, выдавшего напоминание"""
+        return self.pools[reminder_id >> REMINDER_ID_SHIFT]
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Статистика кэшей пользователей и настроек"""
+        return {
+            'users': self.user_cache.stats(),
+            'settings': self.settings_cache.stats()
+        }
 
     def user_exists(self, user_id: int) -> bool:
         """Проверка существования пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
-            return conn.execute(
+        exists = self.user_cache.get(user_id, _MISSING)
+        if exists is not _MISSING:
+            return exists
+
+        with self._pool(user_id).reader() as conn:
+            exists = conn.execute(
                 'SELECT 1 FROM users WHERE user_id = ?', 
                 (user_id,)
             ).fetchone() is not None
 
+        self.user_cache.set(user_id, exists)
+        return exists
+
     def create_user(self, user_id: int, master_password_hash: str, salt: bytes):
         """Создание нового пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool(user_id).writer() as conn:
             conn.execute(
                 'INSERT INTO users (user_id, master_password_hash, salt) VALUES (?, ?, ?)',
                 (user_id, master_password_hash, salt)
@@ -83,77 +425,202 @@ class DatabaseManager:
                 (user_id,)
             )
 
-    def verify_master_password(self, user_id: int, password: str) -> bool:
-        """Проверка мастер-пароля"""
-        with sqlite3.connect(self.db_path) as conn:
-            result = conn.execute(
+        self.user_cache.set(user_id, True)
+        self.settings_cache.pop(user_id)
+
+    def get_master_credentials(self, user_id: int) -> Optional[Tuple[str, bytes]]:
+        """Получение хеша и соли мастер-пароля"""
+        with self._pool(user_id).reader() as conn:
+            return conn.execute(
                 'SELECT master_password_hash, salt FROM users WHERE user_id = ?',
                 (user_id,)
             ).fetchone()
-            
-            if not result:
-                return False
 
-            stored_hash, salt = result
-            computed_hash = self._hash_password(password, salt)
-            return hmac.compare_digest(stored_hash, computed_hash)
+    def verify_master_password(self, user_id: int, password: str) -> bool:
+        """Проверка мастер-пароля"""
+        result = self.get_master_credentials(user_id)
+        if not result:
+            return False
+
+        stored_hash, salt = result
+        computed_hash = self._hash_password(password, salt)
+        return hmac.compare_digest(stored_hash, computed_hash)
 
     def _hash_password(self, password: str, salt: bytes) -> str:
         """Хеширование пароля"""
-        return hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000
-        ).hex()
+        return hash_password(password, salt)
 
     def get_user_settings(self, user_id: int) -> Dict:
         """Получение настроек пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        settings = self.settings_cache.get(user_id)
+        if settings is not None:
+            # Копия: обработчики изменяют полученный словарь
+            return dict(settings)
+
+        with self._pool(user_id).reader() as conn:
             result = conn.execute(
-                '''SELECT length, use_uppercase, use_lowercase, use_digits, use_special
+                '''SELECT length, use_uppercase, use_lowercase, use_digits, use_special, mode, word_count
                    FROM password_settings WHERE user_id = ?''',
                 (user_id,)
             ).fetchone()
             
-            return {
-                'length': result[0] if result else 16,
-                'use_uppercase': bool(result[1]) if result else True,
-                'use_lowercase': bool(result[2]) if result else True,
-                'use_digits': bool(result[3]) if result else True,
-                'use_special': bool(result[4]) if result else False
-            }
+        settings = {
+            'length': result[0] if result else 16,
+            'use_uppercase': bool(result[1]) if result else True,
+            'use_lowercase': bool(result[2]) if result else True,
+            'use_digits': bool(result[3]) if result else True,
+            'use_special': bool(result[4]) if result else False,
+            'mode': result[5] if result and result[5] else 'chars',
+            'word_count': result[6] if result and result[6] else 6
+        }
+        self.settings_cache.set(user_id, settings)
+        return dict(settings)
 
     def update_user_settings(self, user_id: int, settings: Dict):
         """Обновление настроек пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool(user_id).writer() as conn:
             conn.execute('''
                 INSERT OR REPLACE INTO password_settings 
-                (user_id, length, use_uppercase, use_lowercase, use_digits, use_special)
-                VALUES (?, ?, ?, ?, ?, ?)
+                (user_id, length, use_uppercase, use_lowercase, use_digits, use_special, mode, word_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (user_id, *[int(settings[key]) for key in 
-                ['length', 'use_uppercase', 'use_lowercase', 'use_digits', 'use_special']]))
+                ['length', 'use_uppercase', 'use_lowercase', 'use_digits', 'use_special']],
+                settings.get('mode', 'chars'), int(settings.get('word_count', 6))))
+
+        self.settings_cache.pop(user_id)
 
     def save_password(self, user_id: int, service_name: str, encrypted_data: bytes, salt: bytes) -> int:
         """Сохранение зашифрованного пароля"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool(user_id).writer() as conn:
             cursor = conn.execute('''
                 INSERT INTO passwords (user_id, service_name, encrypted_password, salt)
                 VALUES (?, ?, ?, ?)
             ''', (user_id, service_name, encrypted_data, salt))
             return cursor.lastrowid
 
+    def save_passwords(self, user_id: int, entries: Sequence[Tuple[str, bytes, bytes]]) -> int:
+        """Сохранение пачки паролей с напоминаниями одной транзакцией, возвращает число записей
+
+        entries - кортежи (service_name, encrypted_data, salt).
+        """
+        if not entries:
+            return 0
+
+        reminder_date = (datetime.now(timezone.utc) + timedelta(days=365)).strftime('%Y-%m-%d %H:%M:%S')
+        with self._pool(user_id).writer() as conn:
+            # Под BEGIN IMMEDIATE других писателей нет: новые id больше текущего максимума
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM passwords').fetchone()[0]
+            conn.executemany('''
+                INSERT INTO passwords (user_id, service_name, encrypted_password, salt)
+                VALUES (?, ?, ?, ?)
+            ''', [(user_id, service_name, encrypted_data, salt) for service_name, encrypted_data, salt in entries])
+            cursor = conn.execute('''
+                INSERT INTO reminders (user_id, password_id, reminder_date)
+                SELECT user_id, id, ? FROM passwords WHERE id > ? AND user_id = ?
+            ''', (reminder_date, last_id, user_id))
+            # Одна вставка AUTOINCREMENT выдает идущие подряд id
+            reminder_ids = range(cursor.lastrowid - cursor.rowcount + 1, cursor.lastrowid + 1)
+
+        for listener in self.reminder_listeners:
+            for reminder_id in reminder_ids:
+                listener(reminder_id, reminder_date)
+        return len(entries)
+
     def get_user_passwords(self, user_id: int) -> List[Tuple]:
         """Получение списка паролей пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool(user_id).reader() as conn:
             return conn.execute('''
                 SELECT id, service_name, encrypted_password, salt, created_at
                 FROM passwords WHERE user_id = ? ORDER BY created_at DESC
             ''', (user_id,)).fetchall()
 
+    def iter_user_passwords(self, user_id: int, batch_size: int = 500) -> Iterator[List[Tuple]]:
+        """Потоковое чтение паролей пользователя пачками из курсора, без fetchall"""
+        with self._pool(user_id).reader() as conn:
+            cursor = conn.execute('''
+                SELECT service_name, encrypted_password, salt, created_at
+                FROM passwords WHERE user_id = ? ORDER BY created_at, id
+            ''', (user_id,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def _passwords_page(self, columns: str, user_id: int, cursor: Optional[Tuple[str, int]],
+                        limit: int, newer: bool) -> Tuple[List[Tuple], bool]:
+        """Страница паролей от новых к старым по курсору (created_at, id)"""
+        with self._pool(user_id).reader() as conn:
+            if cursor is None:
+                rows = conn.execute(f'''
+                    SELECT {columns} FROM passwords WHERE user_id = ?
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (user_id, limit + 1)).fetchall()
+            elif newer:
+                rows = conn.execute(f'''
+                    SELECT {columns} FROM passwords WHERE user_id = ? AND (created_at, id) > (?, ?)
+                    ORDER BY created_at ASC, id ASC LIMIT ?
+                ''', (user_id, *cursor, limit + 1)).fetchall()
+            else:
+                rows = conn.execute(f'''
+                    SELECT {columns} FROM passwords WHERE user_id = ? AND (created_at, id) < (?, ?)
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (user_id, *cursor, limit + 1)).fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if newer and cursor is not None:
+            rows.reverse()
+        return rows, has_more
+
+    def get_user_passwords_page(self, user_id: int, cursor: Optional[Tuple[str, int]], limit: int,
+                                newer: bool = False) -> Tuple[List[Tuple], bool]:
+        """Страница паролей (id, service_name, encrypted_password, salt, created_at)
+
+        Возвращает записи страницы и признак того, что дальше в выбранном
+        направлении есть еще записи.
+        """
+        return self._passwords_page(
+            'id, service_name, encrypted_password, salt, created_at',
+            user_id, cursor, limit, newer
+        )
+
+    def get_user_password_list_page(self, user_id: int, cursor: Optional[Tuple[str, int]], limit: int,
+                                     newer: bool = False) -> Tuple[List[Tuple], bool]:
+        """Страница метаданных паролей (id, service_name, created_at) без зашифрованных данных"""
+        return self._passwords_page('id, service_name, created_at', user_id, cursor, limit, newer)
+
+    def search_passwords(self, user_id: int, query: str, limit: int) -> List[Tuple]:
+        """Пароли (id, service_name, encrypted_password, salt, created_at), в названии которых есть query"""
+        query = query.strip()
+        if not query:
+            return []
+
+        shard = self._shard(user_id)
+        with self.pools[shard].reader() as conn:
+            if self.search_index[shard] and len(query) >= SEARCH_MIN_TRIGRAM:
+                phrase = query.replace('"', '""')
+                return conn.execute('''
+                    SELECT p.id, p.service_name, p.encrypted_password, p.salt, p.created_at
+                    FROM passwords_fts f
+                    JOIN passwords p ON p.id = f.rowid
+                    WHERE passwords_fts MATCH ? AND p.user_id = ?
+                    ORDER BY p.service_name COLLATE NOCASE, p.id
+                    LIMIT ?
+                ''', (f'user_key : "x{user_id}x" AND service_name : "{phrase}"', user_id, limit)).fetchall()
+
+            pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            return conn.execute('''
+                SELECT id, service_name, encrypted_password, salt, created_at
+                FROM passwords
+                WHERE user_id = ? AND service_name LIKE ? ESCAPE '\\'
+                ORDER BY service_name COLLATE NOCASE, id
+                LIMIT ?
+            ''', (user_id, pattern, limit)).fetchall()
+
     def get_password_by_id(self, password_id: int, user_id: int) -> Optional[Tuple]:
         """Получение пароля по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool(user_id).reader() as conn:
             return conn.execute('''
                 SELECT id, service_name, encrypted_password, salt
                 FROM passwords WHERE id = ? AND user_id = ?
@@ -161,33 +628,141 @@ class DatabaseManager:
 
     def delete_password(self, password_id: int, user_id: int):
         """Удаление пароля"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                'DELETE FROM passwords WHERE id = ? AND user_id = ?',
-                (password_id, user_id)
-            )
+        self.delete_passwords([password_id], user_id)
+
+    def delete_passwords(self, password_ids: List[int], user_id: int) -> List[Tuple[int, str]]:
+        """Удаление паролей одной транзакцией, возвращает удаленные (id, service_name)
+
+        Напоминания удаляются триггером passwords_delete_reminders.
+        """
+        if not password_ids:
+            return []
+
+        params = [(password_id, user_id) for password_id in password_ids]
+        with self._pool(user_id).writer() as conn:
+            deleted = []
+            for password_id, owner_id in params:
+                row = conn.execute(
+                    'SELECT id, service_name FROM passwords WHERE id = ? AND user_id = ?',
+                    (password_id, owner_id)
+                ).fetchone()
+                if row:
+                    deleted.append(row)
+
+            conn.executemany('DELETE FROM passwords WHERE id = ? AND user_id = ?', params)
+        return deleted
 
     def schedule_annual_reminder(self, user_id: int, password_id: int):
         """Планирование ежегодного напоминания"""
-        reminder_date = datetime.now() + timedelta(days=365)
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('''
+        # Время в UTC с точностью до секунды, как и datetime('now') в SQLite
+        reminder_date = (datetime.now(timezone.utc) + timedelta(days=365)).strftime('%Y-%m-%d %H:%M:%S')
+
+        with self._pool(user_id).writer() as conn:
+            cursor = conn.execute('''
                 INSERT INTO reminders (user_id, password_id, reminder_date)
                 VALUES (?, ?, ?)
-            ''', (user_id, password_id, reminder_date.date()))
+            ''', (user_id, password_id, reminder_date))
+
+        for listener in self.reminder_listeners:
+            listener(cursor.lastrowid, reminder_date)
+
+    def get_upcoming_reminders(self, after: Optional[Tuple[str, int]], limit: int) -> List[Tuple[int, str]]:
+        """Ближайшие неотправленные напоминания после курсора (reminder_date, id) со всех шардов"""
+        after_date, after_id = after if after else ('', 0)
+
+        def query(pool: ConnectionPool) -> List[Tuple[int, str]]:
+            with pool.reader() as conn:
+                return conn.execute('''
+                    SELECT id, reminder_date FROM reminders
+                    WHERE sent = 0 AND (reminder_date, id) > (?, ?)
+                    ORDER BY reminder_date, id
+                    LIMIT ?
+                ''', (after_date, after_id, limit)).fetchall()
+
+        return self._merge_pages(self._map_shards(query), lambda row: (row[1], row[0]), limit)
 
     def get_pending_reminders(self) -> List[Tuple]:
-        """Получение ожидающих напоминаний"""
-        with sqlite3.connect(self.db_path) as conn:
-            return conn.execute('''
-                SELECT r.id, r.user_id, r.password_id, p.service_name
-                FROM reminders r
-                JOIN passwords p ON r.password_id = p.id
-                WHERE r.reminder_date <= date('now') AND r.sent = 0
-            ''').fetchall()
+        """Получение ожидающих напоминаний со всех шардов"""
+        def query(pool: ConnectionPool) -> List[Tuple]:
+            with pool.reader() as conn:
+                return conn.execute('''
+                    SELECT r.id, r.user_id, r.password_id, p.service_name
+                    FROM reminders r
+                    JOIN passwords p ON r.password_id = p.id
+                    WHERE r.reminder_date <= datetime('now') AND r.sent = 0
+                ''').fetchall()
+
+        return [row for rows in self._map_shards(query) for row in rows]
+
+    def get_pending_reminders_page(self, after: Optional[Tuple[str, int]], limit: int) -> List[Tuple]:
+        """Страница ожидающих напоминаний после курсора (reminder_date, id) со всех шардов"""
+        after_date, after_id = after if after else ('', 0)
+
+        def query(pool: ConnectionPool) -> List[Tuple]:
+            with pool.reader() as conn:
+                return conn.execute('''
+                    SELECT r.id, r.user_id, r.password_id, p.service_name, r.reminder_date
+                    FROM reminders r
+                    JOIN passwords p ON r.password_id = p.id
+                    WHERE r.reminder_date <= datetime('now') AND r.sent = 0
+                      AND (r.reminder_date, r.id) > (?, ?)
+                    ORDER BY r.reminder_date, r.id
+                    LIMIT ?
+                ''', (after_date, after_id, limit)).fetchall()
+
+        return self._merge_pages(self._map_shards(query), lambda row: (row[4], row[0]), limit)
+
+    @staticmethod
+    def _merge_pages(pages: List[List[Tuple]], key: Callable[[Tuple], Tuple], limit: int) -> List[Tuple]:
+        """Слияние отсортированных страниц шардов в одну страницу
+
+        id напоминаний не повторяются между шардами, поэтому курсор по
+        последней строке общей страницы не пропускает строк ни одного шарда.
+        """
+        if len(pages) == 1:
+            return pages[0]
+        return list(heapq.merge(*pages, key=key))[:limit]
+
+    def count_pending_reminders(self) -> int:
+        """Количество наступивших, но не отправленных напоминаний"""
+        def query(pool: ConnectionPool) -> int:
+            with pool.reader() as conn:
+                return conn.execute('''
+                    SELECT COUNT(*) FROM reminders
+                    WHERE reminder_date <= datetime('now') AND sent = 0
+                ''').fetchone()[0]
+
+        return sum(self._map_shards(query))
+
+    def mark_reminders_sent(self, reminder_ids: List[int]):
+        """Пометить пачку напоминаний как отправленные: одна транзакция на шард"""
+        self._update_reminders(reminder_ids, 'UPDATE reminders SET sent = 1 WHERE id = ?')
+
+    def delete_reminders(self, reminder_ids: List[int]):
+        """Удаление пачки недоставляемых напоминаний: одна транзакция на шард"""
+        self._update_reminders(reminder_ids, 'DELETE FROM reminders WHERE id = ?')
+
+    def _update_reminders(self, reminder_ids: List[int], statement: str):
+        """statement для каждого id из пачки, сгруппированной по шардам"""
+        if not reminder_ids:
+            return
+
+        by_shard: Dict[int, List[Tuple[int]]] = {}
+        for reminder_id in reminder_ids:
+            by_shard.setdefault(reminder_id >> REMINDER_ID_SHIFT, []).append((reminder_id,))
+
+        def update(item: Tuple[int, List[Tuple[int]]]):
+            index, params = item
+            with self.pools[index].writer() as conn:
+                conn.executemany(statement, params)
+
+        if self._fanout is None or len(by_shard) == 1:
+            for item in by_shard.items():
+                update(item)
+        else:
+            list(self._fanout.map(update, by_shard.items()))
 
     def mark_reminder_sent(self, reminder_id: int):
         """Пометить напоминание как отправленное"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('UPDATE reminders SET sent = 1 WHERE id = ?', (reminder_id,))
\ No newline at end of file
+        with self._reminder_pool(reminder_id).writer() as conn:
+            conn.execute('UPDATE reminders SET sent = 1 WHERE id = ?', (reminder_id,))
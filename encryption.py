@@ -1,10 +1,84 @@
 import os
 import hashlib
-from typing import Dict
+import hmac
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+from cache import TTLCache
+
+# Соль для производного ключа хранилища пользователя
+VAULT_KEY_SALT = b'north-vault-key'
+
+# Формат записи: [magic][версия][...]. Записи без заголовка зашифрованы
+# старой схемой (PBKDF2 на каждую запись).
+#   версия 1: [magic][1][XOR-шифротекст]
+#   версия 2: [magic][2][алгоритм][nonce][шифротекст + тег AEAD]
+FORMAT_MAGIC = b'\xffNV'
+FORMAT_VERSION_SUBKEY = 1
+FORMAT_VERSION_AEAD = 2
+SUBKEY_HEADER = FORMAT_MAGIC + bytes([FORMAT_VERSION_SUBKEY])
+AEAD_HEADER = FORMAT_MAGIC + bytes([FORMAT_VERSION_AEAD])
+
+class CipherEngine(ABC):
+    """Шифр, обрабатывающий буфер целиком"""
+
+    algorithm_id = 0
+    name = ''
+    nonce_size = 0
+
+    @abstractmethod
+    def encrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        """Шифрование буфера, возвращает шифротекст с тегом"""
+
+    @abstractmethod
+    def decrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        """Проверка тега и дешифрование буфера"""
+
+
+class AesGcmCipher(CipherEngine):
+    """AES-256-GCM"""
+
+    algorithm_id = 1
+    name = 'aes-gcm'
+    nonce_size = 12
+
+    def encrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        return AESGCM(key).encrypt(nonce, data, associated_data)
+
+    def decrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        return AESGCM(key).decrypt(nonce, data, associated_data)
+
+
+class ChaCha20Poly1305Cipher(CipherEngine):
+    """ChaCha20-Poly1305 для платформ без аппаратного AES"""
+
+    algorithm_id = 2
+    name = 'chacha20-poly1305'
+    nonce_size = 12
+
+    def encrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        return ChaCha20Poly1305(key).encrypt(nonce, data, associated_data)
+
+    def decrypt(self, key: bytes, nonce: bytes, data: bytes, associated_data: bytes) -> bytes:
+        return ChaCha20Poly1305(key).decrypt(nonce, data, associated_data)
+
+
+CIPHERS = {cipher.algorithm_id: cipher for cipher in (AesGcmCipher(), ChaCha20Poly1305Cipher())}
+CIPHERS_BY_NAME = {cipher.name: cipher for cipher in CIPHERS.values()}
+DEFAULT_CIPHER = CIPHERS_BY_NAME['aes-gcm']
 
 class EncryptionManager:
     """Менеджер шифрования для паролей"""
 
+    def __init__(self, cache_size: int = 1024, cache_ttl: float = 900.0, cipher: str = 'aes-gcm'):
+        self.key_cache = TTLCache(cache_size, cache_ttl)
+        if cipher not in CIPHERS_BY_NAME:
+            raise ValueError(f"Неизвестный алгоритм шифрования: {cipher}")
+        self.cipher = CIPHERS_BY_NAME[cipher]
+
     @staticmethod
     def generate_key(password: str, salt: bytes) -> bytes:
         """Генерация ключа из пароля с использованием PBKDF2"""
@@ -17,24 +91,93 @@ class EncryptionManager:
         )
 
     @staticmethod
-    def encrypt(data: str, key: bytes) -> Dict[str, bytes]:
-        """Шифрование данных"""
+    def derive_vault_key(key: bytes) -> bytes:
+        """Дорогая генерация ключа хранилища пользователя (один PBKDF2)"""
+        return EncryptionManager.generate_key(key.hex(), VAULT_KEY_SALT)
+
+    @staticmethod
+    def derive_entry_key(vault_key: bytes, salt: bytes) -> bytes:
+        """Дешевая генерация ключа записи по схеме HKDF-SHA256"""
+        prk = hmac.new(salt, vault_key, hashlib.sha256).digest()
+        return hmac.new(prk, b'north-entry\x01', hashlib.sha256).digest()
+
+    def get_vault_key(self, key: bytes) -> bytes:
+        """Ключ хранилища из кэша или новая генерация"""
+        vault_key = self.key_cache.get(key)
+        if vault_key is None:
+            vault_key = self.derive_vault_key(key)
+            self.key_cache.set(key, vault_key)
+        return vault_key
+
+    @staticmethod
+    def _xor(data: bytes, encryption_key: bytes) -> bytes:
+        """Наложение повторяющегося ключа на весь буфер за одну операцию"""
+        if not data:
+            return b''
+        repeats, remainder = divmod(len(data), len(encryption_key))
+        keystream = encryption_key * repeats + encryption_key[:remainder]
+        return (
+            int.from_bytes(data, 'little') ^ int.from_bytes(keystream, 'little')
+        ).to_bytes(len(data), 'little')
+
+    @staticmethod
+    def encrypt_entry(data: str, vault_key: bytes, cipher: CipherEngine = DEFAULT_CIPHER) -> Dict[str, bytes]:
+        """Шифрование записи AEAD-шифром на ключе, производном от ключа хранилища"""
         salt = os.urandom(16)
-        encryption_key = EncryptionManager.generate_key(key.hex(), salt)
+        nonce = os.urandom(cipher.nonce_size)
+        header = AEAD_HEADER + bytes([cipher.algorithm_id])
+        entry_key = EncryptionManager.derive_entry_key(vault_key, salt)
+        # Заголовок и соль аутентифицируются вместе с шифротекстом
+        encrypted = cipher.encrypt(entry_key, nonce, data.encode('utf-8'), header + salt)
+        return {'encrypted_data': header + nonce + encrypted, 'salt': salt}
 
-        encrypted = bytes(
-            byte ^ encryption_key[i % len(encryption_key)]
-            for i, byte in enumerate(data.encode('utf-8'))
-        )
-        return {'encrypted_data': encrypted, 'salt': salt}
+    @staticmethod
+    def decrypt_entry(encrypted_data: bytes, salt: bytes, vault_key: bytes) -> Optional[str]:
+        """Дешифрование записи по версии формата; None, если запись в старом формате"""
+        if encrypted_data.startswith(AEAD_HEADER) and len(encrypted_data) > len(AEAD_HEADER):
+            algorithm_id = encrypted_data[len(AEAD_HEADER)]
+            cipher = CIPHERS.get(algorithm_id)
+            if cipher is None:
+                raise ValueError(f"Неизвестный алгоритм шифрования: {algorithm_id}")
+
+            header_size = len(AEAD_HEADER) + 1
+            nonce = encrypted_data[header_size:header_size + cipher.nonce_size]
+            entry_key = EncryptionManager.derive_entry_key(vault_key, salt)
+            try:
+                decrypted = cipher.decrypt(
+                    entry_key,
+                    nonce,
+                    encrypted_data[header_size + cipher.nonce_size:],
+                    encrypted_data[:header_size] + salt
+                )
+            except InvalidTag:
+                raise ValueError("Запись повреждена или ключ неверен") from None
+            return decrypted.decode('utf-8')
+
+        if encrypted_data.startswith(SUBKEY_HEADER):
+            entry_key = EncryptionManager.derive_entry_key(vault_key, salt)
+            decrypted = EncryptionManager._xor(encrypted_data[len(SUBKEY_HEADER):], entry_key)
+            try:
+                return decrypted.decode('utf-8')
+            except UnicodeDecodeError:
+                # Старая запись, случайно начавшаяся с заголовка
+                return None
+
+        return None
 
     @staticmethod
-    def decrypt(encrypted_data: bytes, salt: bytes, key: bytes) -> str:
-        """Дешифрование данных"""
+    def decrypt_legacy(encrypted_data: bytes, salt: bytes, key: bytes) -> str:
+        """Дешифрование записи старого формата"""
         encryption_key = EncryptionManager.generate_key(key.hex(), salt)
+        return EncryptionManager._xor(encrypted_data, encryption_key).decode('utf-8')
 
-        decrypted = bytes(
-            byte ^ encryption_key[i % len(encryption_key)]
-            for i, byte in enumerate(encrypted_data)
-        )
-        return decrypted.decode('utf-8')
\ No newline at end of file
+    def encrypt(self, data: str, key: bytes) -> Dict[str, bytes]:
+        """Шифрование данных"""
+        return self.encrypt_entry(data, self.get_vault_key(key), self.cipher)
+
+    def decrypt(self, encrypted_data: bytes, salt: bytes, key: bytes) -> str:
+        """Дешифрование данных"""
+        decrypted = self.decrypt_entry(encrypted_data, salt, self.get_vault_key(key))
+        if decrypted is None:
+            decrypted = self.decrypt_legacy(encrypted_data, salt, key)
+        return decrypted
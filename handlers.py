@@ -1,23 +1,229 @@
+import asyncio
+import functools
 import html
+import io
 import hashlib
 import logging
-from typing import Dict
-
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-
-from config import SETTINGS, SERVICE_NAME, PASSWORD_LENGTH, PASSWORD_ACTIONS
+import re
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from telegram import (Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle,
+                      InlineQueryResultsButton, InputTextMessageContent)
+from telegram.ext import (ContextTypes, ConversationHandler, CommandHandler, MessageHandler, CallbackQueryHandler,
+                          InlineQueryHandler, filters)
+
+from config import (SETTINGS, SERVICE_NAME, PASSWORD_LENGTH, PASSWORD_ACTIONS, LIST_PAGE_SIZE, GENERATE_MAX_BATCH,
+                    IMPORT_MAX_FILE_SIZE, IMPORT_BATCH_SIZE, EXPORT_KDF_ITERATIONS, FIND_RESULTS_LIMIT,
+                    INLINE_RESULTS_LIMIT)
+from sessions import SessionStore
+from vault_io import ImportInterrupted, export_vault, import_vault
 
 logger = logging.getLogger(__name__)
 
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+# Файл импорта и экспорта держится в памяти до этого размера, дальше - на диске
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# Шаблоны сообщений: постоянные части собраны один раз, в обработчиках только подстановка
+GENERATED_TEMPLATE = (
+    "🔐 <b>Сгенерированный пароль:</b>\n\n"
+    "<code>{password}</code>\n\n"
+    "💡 Используйте /generate_dialog для сохранения пароля"
+)
+SERVICE_PASSWORD_TEMPLATE = "🔐 Сгенерированный пароль для <b>{service}</b>:\n\n<code>{password}</code>"
+REGENERATED_TEMPLATE = "🔐 Новый пароль для <b>{service}</b>:\n\n<code>{password}</code>"
+BATCH_HEADER_TEMPLATE = "🔐 <b>Сгенерировано паролей: {count}</b>\n\n"
+PASSWORD_ENTRY_TEMPLATE = "#{id} <b>{service}</b> - <code>{password}</code>\n   📅 Создан: {created}\n\n"
+PASSWORD_ENTRY_ERROR_TEMPLATE = "#{id} <b>{service}</b> - ❌ Ошибка расшифровки\n\n"
+SETTINGS_MENU_TEXT = "⚙️ <b>Настройки генерации паролей</b>\n\nВыберите параметр для изменения:"
+SETTINGS_PASSPHRASE_TEMPLATE = (
+    "⚙️ <b>Текущие настройки генерации паролей:</b>\n\n"
+    "• 🧩 Режим: парольная фраза\n"
+    "• 📏 Количество слов: {word_count}\n\n"
+    "💡 Используйте /settings_dialog для изменения настроек"
+)
+SETTINGS_CHARS_TEMPLATE = (
+    "⚙️ <b>Текущие настройки генерации паролей:</b>\n\n"
+    "• 🧩 Режим: символы\n"
+    "• 📏 Длина пароля: {length} символов\n"
+    "• 🔠 Заглавные буквы: {uppercase}\n"
+    "• 🔡 Строчные буквы: {lowercase}\n"
+    "• 🔢 Цифры: {digits}\n"
+    "• 🔣 Специальные символы: {special}\n\n"
+    "💡 Используйте /settings_dialog для изменения настроек"
+)
+
+# Переключатели категорий символов в меню настроек, по два в ряд
+SYMBOL_TOGGLES = (
+    ('uppercase', '🔠 Заглавные'),
+    ('lowercase', '🔡 Строчные'),
+    ('digits', '🔢 Цифры'),
+    ('special', '🔣 Специальные')
+)
+
+# Объекты telegram неизменяемы, поэтому одну клавиатуру можно отдавать во все ответы
+PASSWORD_ACTIONS_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("💾 Сохранить", callback_data='save'),
+        InlineKeyboardButton("🔄 Сгенерировать новый", callback_data='regenerate')
+    ],
+    [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
+])
+
+
+def mark(enabled) -> str:
+    return '✅' if enabled else '❌'
+
+
+@functools.lru_cache(maxsize=512)
+def settings_keyboard(passphrase: bool, length: int, toggles: Tuple[bool, ...]) -> InlineKeyboardMarkup:
+    """Клавиатура меню настроек, одна на каждое сочетание режима, длины и переключателей"""
+    keyboard = [
+        [InlineKeyboardButton(f"🧩 Режим: {'парольная фраза' if passphrase else 'символы'}", callback_data='mode')]
+    ]
+
+    if passphrase:
+        keyboard.append([InlineKeyboardButton(f"📏 Количество слов: {length}", callback_data='length')])
+    else:
+        keyboard.append([InlineKeyboardButton(f"📏 Длина пароля: {length}", callback_data='length')])
+        buttons = [
+            InlineKeyboardButton(f"{label}: {mark(enabled)}", callback_data=key)
+            for (key, label), enabled in zip(SYMBOL_TOGGLES, toggles)
+        ]
+        keyboard.extend(buttons[i:i + 2] for i in range(0, len(buttons), 2))
+
+    keyboard.append([
+        InlineKeyboardButton("💾 Сохранить", callback_data='save'),
+        InlineKeyboardButton("❌ Отмена", callback_data='cancel')
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def settings_keyboard_for(settings: Dict) -> InlineKeyboardMarkup:
+    """Клавиатура меню для настроек пользователя"""
+    if settings['mode'] == 'passphrase':
+        return settings_keyboard(True, settings['word_count'], ())
+    return settings_keyboard(False, settings['length'],
+                             tuple(bool(settings[f'use_{key}']) for key, _ in SYMBOL_TOGGLES))
+
+
+# Теги, HTML-сущности, переводы строк и участки текста между ними
+HTML_TOKEN_RE = re.compile(r'<[^<>]*>|&#?\w+;|\n|[^<&\n]+|[<&]')
+HTML_TAG_RE = re.compile(r'<(/?)([a-zA-Z][\w-]*)')
+
+
+def utf16_length(text: str) -> int:
+    """Длина в единицах UTF-16: так Telegram считает ограничение сообщения"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_html(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Разбиение HTML-сообщения на части не длиннее limit за один проход
+
+    Часть заканчивается на последнем переводе строки, который в нее
+    поместился; строка длиннее части режется посреди текста. Теги и
+    HTML-сущности не разрываются: открытые теги закрываются в конце части и
+    открываются заново в начале следующей. Каждый токен переносится в
+    следующую часть не больше одного раза, поэтому время линейное.
+    """
+    if utf16_length(text) <= limit:
+        return [text]
+
+    tokens = HTML_TOKEN_RE.findall(text)
+    chunks: List[str] = []
+    parts: List[str] = []
+    size = 0
+    # Открытые теги: (имя, открывающий тег) и длина закрывающих для них
+    stack: List[Tuple[str, str]] = []
+    closing = 0
+    # Состояние сразу после последнего перевода строки в текущей части
+    newline_mark = None
+
+    def start_chunk():
+        nonlocal parts, size, newline_mark
+        prefix = ''.join(opening for _, opening in stack)
+        parts, size, newline_mark = [prefix], utf16_length(prefix), None
+
+    def finish_chunk(body: List[str], open_tags: List[Tuple[str, str]]):
+        chunk = ''.join(body) + ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+        if chunk.strip():
+            chunks.append(chunk)
+
+    start_chunk()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        tag = HTML_TAG_RE.match(token) if len(token) > 2 and token[-1] == '>' else None
+        new_closing = closing
+        if tag is not None:
+            name_length = len(tag.group(2)) + 3
+            new_closing += -name_length if tag.group(1) else name_length
+
+        length = utf16_length(token)
+        if size + length + new_closing <= limit:
+            parts.append(token)
+            size += length
+            if tag is not None:
+                if tag.group(1):
+                    if stack:
+                        stack.pop()
+                else:
+                    stack.append((tag.group(2), token))
+                closing = new_closing
+            if token == '\n':
+                newline_mark = (i + 1, len(parts), list(stack), closing)
+            i += 1
+            continue
+
+        if newline_mark is not None and newline_mark[1] > 1:
+            # Часть обрывается после последней целой строки, остаток идет в следующую
+            i, count, open_tags, closing = newline_mark
+            finish_chunk(parts[:count], open_tags)
+            stack[:] = open_tags
+            start_chunk()
+            continue
+
+        room = limit - size - closing
+        if tag is None and not token.startswith('&') and room > 0:
+            # Длинная строка: заполняем часть до конца и режем текст
+            cut = room if token.isascii() else _utf16_prefix(token, room)
+            parts.append(token[:cut])
+            tokens[i] = token[cut:]
+        elif len(parts) == 1:
+            # Токен не помещается даже в пустую часть: отправляем как есть
+            parts.append(token)
+            i += 1
+        finish_chunk(parts, stack)
+        start_chunk()
+
+    finish_chunk(parts, stack)
+    return chunks
+
+
+def _utf16_prefix(text: str, units: int) -> int:
+    """Число символов text, занимающих не больше units единиц UTF-16"""
+    total = 0
+    for index, char in enumerate(text):
+        total += 2 if ord(char) > 0xFFFF else 1
+        if total > units:
+            return index
+    return len(text)
+
 class Handlers:
     """Класс с обработчиками команд бота"""
     
-    def __init__(self, db, encryption, generator):
+    def __init__(self, db, encryption, generator, crypto, sessions: Optional[SessionStore] = None):
         self.db = db
         self.encryption = encryption
         self.generator = generator
-        self.user_sessions: Dict[int, Dict] = {}
+        self.crypto = crypto
+        self.user_sessions = sessions if sessions is not None else SessionStore()
 
     def get_handlers(self):
         """Возвращает список обработчиков команд"""
@@ -25,13 +231,20 @@ class Handlers:
             CommandHandler("start", self.start),
             CommandHandler("help", self.help_command),
             CommandHandler("list", self.list_passwords),
+            CommandHandler("find", self.find_command),
             CommandHandler("settings", self.settings_command),
             CommandHandler("generate", self.generate_command),
             CommandHandler("setmaster", self.set_master_password),
             CommandHandler("delete", self.delete_password_command),
+            CommandHandler("import", self.import_command),
+            CommandHandler("export", self.export_command),
             self.get_password_conversation_handler(),
             self.get_settings_conversation_handler(),
+            CallbackQueryHandler(self.handle_list_page, pattern=r'^list\|'),
+            CallbackQueryHandler(self.handle_delete_selection, pattern=r'^del\|'),
             CallbackQueryHandler(self.handle_button_click),
+            InlineQueryHandler(self.inline_query),
+            MessageHandler(filters.Document.ALL, self.handle_import_document),
             MessageHandler(filters.COMMAND, self.unknown_command)
         ]
 
@@ -47,7 +260,10 @@ class Handlers:
                     CallbackQueryHandler(self.handle_password_actions, pattern='^(save|regenerate|cancel)$')
                 ]
             },
-            fallbacks=[CommandHandler('cancel', self.cancel)]
+            fallbacks=[CommandHandler('cancel', self.cancel)],
+            # Состояние диалога переживает перезапуск вместе с сессией (SESSION_DB_PATH)
+            name='generate_password',
+            persistent=self.user_sessions.persistent
         )
 
     def get_settings_conversation_handler(self):
@@ -57,7 +273,7 @@ class Handlers:
             states={
                 SETTINGS: [
                     CallbackQueryHandler(self.handle_settings,
-                                         pattern='^(length|uppercase|lowercase|digits|special|save|cancel)$')
+                                         pattern='^(mode|length|uppercase|lowercase|digits|special|save|cancel)$')
                 ],
                 PASSWORD_LENGTH: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_password_length)
@@ -93,10 +309,16 @@ class Handlers:
 /setmaster пароль - Установить мастер-пароль
 
 🔑 <b>Работа с паролями:</b>
-/generate - Быстрая генерация пароля
+/generate [N] - Быстрая генерация пароля или N паролей сразу
 /generate_dialog - Генерация с сохранением для сервиса
 /list - Показать список паролей
-/delete - Удалить пароль
+/find запрос - Найти пароли по названию сервиса
+@имя_бота запрос - Поиск пароля в любом чате (inline-режим)
+/delete - Удалить пароли (можно сразу несколько: /delete 3 5 7)
+
+📦 <b>Импорт и экспорт:</b>
+/import - Загрузить пароли из CSV или JSON
+/export пароль - Выгрузить пароли в зашифрованный файл
 
 ⚙️ <b>Настройки:</b>
 /settings - Показать текущие настройки
@@ -134,7 +356,7 @@ class Handlers:
         
         try:
             salt = hashlib.sha256(str(user_id).encode()).digest()
-            master_password_hash = self.db._hash_password(master_password, salt)
+            master_password_hash = await self.crypto.hash_password(master_password, salt)
             self.db.create_user(user_id, master_password_hash, salt)
 
             await update.message.reply_text(
@@ -146,26 +368,54 @@ class Handlers:
             await update.message.reply_text("❌ Ошибка при установке мастер-пароля.")
 
     async def generate_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Быстрая генерация пароля"""
+        """Быстрая генерация пароля или пачки паролей (/generate N)"""
         user_id = update.effective_user.id
 
         if not self.db.user_exists(user_id):
             await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
             return
 
+        count = 1
+        if context.args:
+            try:
+                count = int(context.args[0])
+            except ValueError:
+                count = 0
+            if not 1 <= count <= GENERATE_MAX_BATCH:
+                await update.message.reply_text(f"❌ Укажите количество паролей от 1 до {GENERATE_MAX_BATCH}.")
+                return
+
         settings = self.db.get_user_settings(user_id)
         try:
+            if count > 1:
+                await self.send_password_batch(update, self.generator.generate_batch(settings, count))
+                return
+
             password = self.generator.generate_password(settings)
-            escaped_password = html.escape(password)
             await update.message.reply_text(
-                f"🔐 <b>Сгенерированный пароль:</b>\n\n"
-                f"<code>{escaped_password}</code>\n\n"
-                f"💡 Используйте /generate_dialog для сохранения пароля",
+                GENERATED_TEMPLATE.format(password=html.escape(password)),
                 parse_mode='HTML'
             )
         except ValueError as e:
             await update.message.reply_text(f"❌ Ошибка генерации: {str(e)}")
 
+    async def send_password_batch(self, update: Update, passwords: List[str]):
+        """Отправка пачки паролей сообщением или файлом, если не помещается"""
+        text = BATCH_HEADER_TEMPLATE.format(count=len(passwords)) + "\n".join(
+            f"<code>{html.escape(password)}</code>" for password in passwords
+        )
+
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            await update.message.reply_text(text, parse_mode='HTML')
+            return
+
+        document = io.BytesIO("\n".join(passwords).encode('utf-8'))
+        await update.message.reply_document(
+            document=document,
+            filename='passwords.txt',
+            caption=f"🔐 Сгенерировано паролей: {len(passwords)}"
+        )
+
     async def start_generate_password(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Начало процесса генерации пароля с сохранением"""
         user_id = update.effective_user.id
@@ -195,26 +445,12 @@ class Handlers:
             await update.message.reply_text(f"❌ Ошибка генерации: {str(e)}")
             return ConversationHandler.END
 
-        self.user_sessions[user_id] = {
-            'current_password': password,
-            'service_name': service_name
-        }
-
-        keyboard = [
-            [
-                InlineKeyboardButton("💾 Сохранить", callback_data='save'),
-                InlineKeyboardButton("🔄 Сгенерировать новый", callback_data='regenerate')
-            ],
-            [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
-        ]
+        self.user_sessions.set(user_id, service_name, password)
 
-        escaped_password = html.escape(password)
-        escaped_service = html.escape(service_name)
-        
         await update.message.reply_text(
-            f"🔐 Сгенерированный пароль для <b>{escaped_service}</b>:\n\n<code>{escaped_password}</code>",
+            SERVICE_PASSWORD_TEMPLATE.format(service=html.escape(service_name), password=html.escape(password)),
             parse_mode='HTML',
-            reply_markup=InlineKeyboardMarkup(keyboard)
+            reply_markup=PASSWORD_ACTIONS_KEYBOARD
         )
         return PASSWORD_ACTIONS
 
@@ -241,13 +477,21 @@ class Handlers:
 
     async def save_password_to_db(self, query, user_id: int) -> int:
         """Сохранение пароля в базу данных"""
+        session = self.user_sessions.get(user_id)
+        if session.current_password is None:
+            # Сессия восстановлена после перезапуска: пароль на диске не хранится
+            await query.edit_message_text(
+                "⚠️ Бот перезапускался, и сгенерированный пароль не сохранился. Сгенерируйте новый.",
+                reply_markup=PASSWORD_ACTIONS_KEYBOARD
+            )
+            return PASSWORD_ACTIONS
+
         try:
-            session_data = self.user_sessions[user_id]
-            service_name = session_data['service_name']
-            password = session_data['current_password']
+            service_name = session.service_name
+            password = session.current_password
 
             encryption_key = hashlib.sha256(str(user_id).encode()).digest()
-            encrypted_data = self.encryption.encrypt(password, encryption_key)
+            encrypted_data = await self.crypto.encrypt(password, encryption_key)
 
             password_id = self.db.save_password(
                 user_id,
@@ -274,28 +518,17 @@ class Handlers:
 
     async def regenerate_password(self, query, user_id: int) -> int:
         """Регенерация пароля"""
-        service_name = self.user_sessions[user_id]['service_name']
+        service_name = self.user_sessions.get(user_id).service_name
         settings = self.db.get_user_settings(user_id)
 
         try:
             new_password = self.generator.generate_password(settings)
-            self.user_sessions[user_id]['current_password'] = new_password
-
-            keyboard = [
-                [
-                    InlineKeyboardButton("💾 Сохранить", callback_data='save'),
-                    InlineKeyboardButton("🔄 Сгенерировать новый", callback_data='regenerate')
-                ],
-                [InlineKeyboardButton("❌ Отмена", callback_data='cancel')]
-            ]
-
-            escaped_password = html.escape(new_password)
-            escaped_service = html.escape(service_name)
+            self.user_sessions.set(user_id, service_name, new_password)
 
             await query.edit_message_text(
-                f"🔐 Новый пароль для <b>{escaped_service}</b>:\n\n<code>{escaped_password}</code>",
+                REGENERATED_TEMPLATE.format(service=html.escape(service_name), password=html.escape(new_password)),
                 parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
+                reply_markup=PASSWORD_ACTIONS_KEYBOARD
             )
         except ValueError as e:
             await query.edit_message_text(f"❌ Ошибка генерации: {str(e)}")
@@ -313,17 +546,13 @@ class Handlers:
 
         settings = self.db.get_user_settings(user_id)
 
-        text = f"""
-⚙️ <b>Текущие настройки генерации паролей:</b>
-
-• 📏 Длина пароля: {settings['length']} символов
-• 🔠 Заглавные буквы: {'✅' if settings['use_uppercase'] else '❌'}
-• 🔡 Строчные буквы: {'✅' if settings['use_lowercase'] else '❌'}
-• 🔢 Цифры: {'✅' if settings['use_digits'] else '❌'}
-• 🔣 Специальные символы: {'✅' if settings['use_special'] else '❌'}
-
-💡 Используйте /settings_dialog для изменения настроек
-        """
+        if settings['mode'] == 'passphrase':
+            text = SETTINGS_PASSPHRASE_TEMPLATE.format(word_count=settings['word_count'])
+        else:
+            text = SETTINGS_CHARS_TEMPLATE.format(
+                length=settings['length'],
+                **{key: mark(settings[f'use_{key}']) for key, _ in SYMBOL_TOGGLES}
+            )
         await update.message.reply_text(text, parse_mode='HTML')
 
     async def start_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -339,37 +568,8 @@ class Handlers:
 
     async def show_settings_menu(self, update, settings: Dict) -> int:
         """Показать меню настроек"""
-        length = settings['length']
-        symbols = {
-            'uppercase': ('🔠 Заглавные', settings['use_uppercase']),
-            'lowercase': ('🔡 Строчные', settings['use_lowercase']),
-            'digits': ('🔢 Цифры', settings['use_digits']),
-            'special': ('🔣 Специальные', settings['use_special'])
-        }
-
-        text = "⚙️ <b>Настройки генерации паролей</b>\n\nВыберите параметр для изменения:"
-        
-        keyboard = [
-            [InlineKeyboardButton(f"📏 Длина пароля: {length}", callback_data='length')]
-        ]
-        
-        row = []
-        for key, (label, enabled) in symbols.items():
-            row.append(InlineKeyboardButton(f"{label}: {'✅' if enabled else '❌'}", callback_data=key))
-            if len(row) == 2:
-                keyboard.append(row)
-                row = []
-        if row:
-            keyboard.append(row)
-
-        keyboard.extend([
-            [
-                InlineKeyboardButton("💾 Сохранить", callback_data='save'),
-                InlineKeyboardButton("❌ Отмена", callback_data='cancel')
-            ]
-        ])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        text = SETTINGS_MENU_TEXT
+        reply_markup = settings_keyboard_for(settings)
 
         if isinstance(update, Update):
             await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
@@ -386,8 +586,15 @@ class Handlers:
 
         settings = self.db.get_user_settings(user_id)
 
-        if action == 'length':
-            await query.edit_message_text("📏 Введите длину пароля (от 8 до 32 символов):")
+        if action == 'mode':
+            settings['mode'] = 'chars' if settings['mode'] == 'passphrase' else 'passphrase'
+            self.db.update_user_settings(user_id, settings)
+            return await self.show_settings_menu(query, settings)
+        elif action == 'length':
+            if settings['mode'] == 'passphrase':
+                await query.edit_message_text("📏 Введите количество слов (от 4 до 12):")
+            else:
+                await query.edit_message_text("📏 Введите длину пароля (от 8 до 32 символов):")
             return PASSWORD_LENGTH
         elif action in ['uppercase', 'lowercase', 'digits', 'special']:
             settings_key = f"use_{action}"
@@ -407,10 +614,24 @@ class Handlers:
     async def handle_password_length(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка ввода длины пароля"""
         user_id = update.effective_user.id
+        settings = self.db.get_user_settings(user_id)
+
+        if settings['mode'] == 'passphrase':
+            try:
+                word_count = int(update.message.text)
+            except ValueError:
+                await update.message.reply_text("❌ Пожалуйста, введите число от 4 до 12.")
+                return PASSWORD_LENGTH
+            if not 4 <= word_count <= 12:
+                await update.message.reply_text("❌ Количество слов должно быть от 4 до 12.")
+                return PASSWORD_LENGTH
+            settings['word_count'] = word_count
+            self.db.update_user_settings(user_id, settings)
+            return await self.show_settings_menu(update, settings)
+
         try:
             length = int(update.message.text)
             if 8 <= length <= 32:
-                settings = self.db.get_user_settings(user_id)
                 settings['length'] = length
                 self.db.update_user_settings(user_id, settings)
                 return await self.show_settings_menu(update, settings)
@@ -422,92 +643,417 @@ class Handlers:
             return PASSWORD_LENGTH
 
     async def list_passwords(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Показать список сохраненных паролей с расшифровкой"""
+        """Показать первую страницу сохраненных паролей с расшифровкой"""
         user_id = update.effective_user.id
 
         if not self.db.user_exists(user_id):
             await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
             return
 
-        passwords = self.db.get_user_passwords(user_id)
+        page = await self.render_password_page(user_id, None, newer=False)
 
-        if not passwords:
+        if page is None:
             await update.message.reply_text("📭 У вас нет сохраненных паролей.")
             return
 
+        text, reply_markup = page
+        await self.reply_chunked(update.message, text, reply_markup)
+
+    async def handle_list_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Переход между страницами /list"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        await query.answer()
+
+        _, direction, created_at, password_id = query.data.split('|')
+        page = await self.render_password_page(user_id, (created_at, int(password_id)), newer=direction == 'prev')
+
+        if page is None:
+            await query.edit_message_text("📭 На этой странице больше нет паролей. Используйте /list")
+            return
+
+        text, reply_markup = page
+        chunks = split_html(text)
+        if len(chunks) == 1:
+            await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+            return
+
+        # Длинная страница: первая часть заменяет сообщение, кнопки - под последней
+        await query.edit_message_text(chunks[0], parse_mode='HTML')
+        for index, chunk in enumerate(chunks[1:], 2):
+            await query.message.reply_text(
+                chunk, parse_mode='HTML', reply_markup=reply_markup if index == len(chunks) else None
+            )
+
+    @staticmethod
+    async def reply_chunked(message, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Ответ HTML-текстом любой длины: части по MAX_MESSAGE_LENGTH, кнопки под последней"""
+        chunks = split_html(text)
+        for index, chunk in enumerate(chunks, 1):
+            await message.reply_text(
+                chunk, parse_mode='HTML', reply_markup=reply_markup if index == len(chunks) else None
+            )
+
+    async def render_password_page(self, user_id: int, cursor: Optional[Tuple[str, int]],
+                                   newer: bool) -> Optional[Tuple[str, Optional[InlineKeyboardMarkup]]]:
+        """Страница /list: расшифровываются только записи этой страницы"""
+        passwords, has_more = self.db.get_user_passwords_page(user_id, cursor, LIST_PAGE_SIZE, newer=newer)
+
+        if not passwords:
+            return None
+
         encryption_key = hashlib.sha256(str(user_id).encode()).digest()
-        
-        text = "📋 <b>Сохраненные пароли:</b>\n\n"
-        
-        for i, (pwd_id, service, encrypted_pwd, salt, created_at) in enumerate(passwords, 1):
-            try:
-                decrypted_password = self.encryption.decrypt(encrypted_pwd, salt, encryption_key)
-                
-                escaped_service = html.escape(service)
-                escaped_password = html.escape(decrypted_password)
-                
-                text += f"<b>{escaped_service}</b> - <code>{escaped_password}</code>\n"
-                text += f"   📅 Создан: {created_at[:10]}\n\n"
-                
-            except Exception as e:
-                logger.error(f"Error decrypting password for {service}: {e}")
-                escaped_service = html.escape(service)
-                text += f"<b>{escaped_service}</b> - ❌ Ошибка расшифровки\n\n"
 
+        decrypted = await self.crypto.decrypt_many(
+            [(encrypted_pwd, salt) for _, _, encrypted_pwd, salt, _ in passwords],
+            encryption_key
+        )
+
+        text = "📋 <b>Сохраненные пароли:</b>\n\n" + self.format_password_entries(passwords, decrypted)
         text += "\n💡 Используйте /delete для удаления паролей"
-        
-        if len(text) > 4096:
-            parts = []
-            while len(text) > 4096:
-                split_index = text[:4096].rfind('\n')
-                if split_index == -1:
-                    split_index = 4096
-                parts.append(text[:split_index])
-                text = text[split_index:].lstrip()
-            parts.append(text)
-            
-            for part in parts:
-                await update.message.reply_text(part, parse_mode='HTML')
-        else:
-            await update.message.reply_text(text, parse_mode='HTML')
 
-    async def delete_password_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработчик команды /delete"""
+        # Страницы идут от новых к старым: ◀ - более новые, ▶ - более старые
+        has_newer = has_more if newer else cursor is not None
+        has_older = cursor is not None if newer else has_more
+
+        buttons = []
+        if has_newer:
+            first_id, *_, first_created = passwords[0]
+            buttons.append(InlineKeyboardButton("◀", callback_data=f"list|prev|{first_created}|{first_id}"))
+        if has_older:
+            last_id, *_, last_created = passwords[-1]
+            buttons.append(InlineKeyboardButton("▶", callback_data=f"list|next|{last_created}|{last_id}"))
+
+        return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+    @staticmethod
+    def format_password_entries(passwords: List[Tuple], decrypted: List) -> str:
+        """Записи (id, service_name, encrypted_password, salt, created_at) с расшифрованными паролями"""
+        lines = []
+        for (pwd_id, service, encrypted_pwd, salt, created_at), decrypted_password in zip(passwords, decrypted):
+            escaped_service = html.escape(service)
+            if isinstance(decrypted_password, Exception):
+                logger.error(f"Error decrypting password for {service}: {decrypted_password}")
+                lines.append(PASSWORD_ENTRY_ERROR_TEMPLATE.format(id=pwd_id, service=escaped_service))
+                continue
+            lines.append(PASSWORD_ENTRY_TEMPLATE.format(
+                id=pwd_id, service=escaped_service,
+                password=html.escape(decrypted_password), created=created_at[:10]
+            ))
+        return ''.join(lines)
+
+    async def find_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /find: расшифровываются только найденные записи"""
         user_id = update.effective_user.id
 
         if not self.db.user_exists(user_id):
             await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
             return
 
-        passwords = self.db.get_user_passwords(user_id)
+        if not context.args:
+            await update.message.reply_text("🔍 Для поиска введите:\n/find название_сервиса")
+            return
+
+        query = ' '.join(context.args)
+        passwords = self.db.search_passwords(user_id, query, FIND_RESULTS_LIMIT)
+        escaped_query = html.escape(query)
 
         if not passwords:
-            await update.message.reply_text("📭 У вас нет сохраненных паролей для удаления.")
+            await update.message.reply_text(f"📭 По запросу «{escaped_query}» ничего не найдено.", parse_mode='HTML')
             return
 
-        if context.args:
-            try:
-                password_num = int(context.args[0])
-                if 1 <= password_num <= len(passwords):
-                    password_id, service_name, *_ = passwords[password_num - 1]
-                    self.db.delete_password(password_id, user_id)
-                    escaped_service = html.escape(service_name)
-                    await update.message.reply_text(
-                        f"✅ Пароль для <b>{escaped_service}</b> удален!", 
+        encryption_key = hashlib.sha256(str(user_id).encode()).digest()
+        decrypted = await self.crypto.decrypt_many(
+            [(encrypted_pwd, salt) for _, _, encrypted_pwd, salt, _ in passwords],
+            encryption_key
+        )
+
+        text = f"🔍 <b>Найдено по запросу «{escaped_query}»:</b>\n\n" + self.format_password_entries(passwords, decrypted)
+        if len(passwords) == FIND_RESULTS_LIMIT:
+            text += f"💡 Показаны первые {FIND_RESULTS_LIMIT} совпадений, уточните запрос"
+        await self.reply_chunked(update.message, text)
+
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Поиск пароля в inline-режиме: @имя_бота запрос"""
+        inline_query = update.inline_query
+        user_id = inline_query.from_user.id
+        query = inline_query.query.strip()
+
+        if not self.db.user_exists(user_id):
+            await inline_query.answer(
+                [], cache_time=0, is_personal=True,
+                button=InlineQueryResultsButton(text="🔐 Установить мастер-пароль", start_parameter='setmaster')
+            )
+            return
+
+        results = []
+        passwords = self.db.search_passwords(user_id, query, INLINE_RESULTS_LIMIT) if query else []
+        if passwords:
+            encryption_key = hashlib.sha256(str(user_id).encode()).digest()
+            decrypted = await self.crypto.decrypt_many(
+                [(encrypted_pwd, salt) for _, _, encrypted_pwd, salt, _ in passwords],
+                encryption_key
+            )
+            for (pwd_id, service, _, _, created_at), password in zip(passwords, decrypted):
+                if isinstance(password, Exception):
+                    logger.error(f"Error decrypting password for {service}: {password}")
+                    continue
+                results.append(InlineQueryResultArticle(
+                    id=str(pwd_id),
+                    title=service,
+                    description=f"Создан {created_at[:10]}, пароль будет скрыт спойлером",
+                    input_message_content=InputTextMessageContent(
+                        f"🔐 <b>{html.escape(service)}</b>\n<tg-spoiler>{html.escape(password)}</tg-spoiler>",
                         parse_mode='HTML'
                     )
-                else:
-                    await update.message.reply_text("❌ Неверный номер пароля.")
+                ))
+
+        # В ответе пароли: Telegram не должен ни кэшировать его, ни показывать другим пользователям
+        await inline_query.answer(results, cache_time=0, is_personal=True)
+
+    async def delete_password_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /delete"""
+        user_id = update.effective_user.id
+
+        if not self.db.user_exists(user_id):
+            await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
+            return
+
+        if context.args:
+            try:
+                password_ids = list(dict.fromkeys(int(arg.lstrip('#')) for arg in context.args))
             except ValueError:
-                await update.message.reply_text("❌ Пожалуйста, укажите номер пароля.")
-        else:
-            text = "🗑️ <b>Выберите пароль для удаления:</b>\n\n"
-            for i, (_, service, _, _, created_at) in enumerate(passwords, 1):
-                escaped_service = html.escape(service)
-                text += f"{i}. <b>{escaped_service}</b> - создан {created_at[:10]}\n"
-            
-            text += f"\n💡 Используйте: /delete <номер>"
-            await update.message.reply_text(text, parse_mode='HTML')
+                await update.message.reply_text("❌ Пожалуйста, укажите ID паролей: /delete <id> [<id> ...]")
+                return
+
+            deleted = self.db.delete_passwords(password_ids, user_id)
+            await update.message.reply_text(self.format_deleted(password_ids, deleted), parse_mode='HTML')
+            return
+
+        context.user_data['delete_selected'] = set()
+        context.user_data['delete_page'] = (None, False)
+        page = self.render_delete_page(user_id, None, False, set())
+
+        if page is None:
+            await update.message.reply_text("📭 У вас нет сохраненных паролей для удаления.")
+            return
+
+        text, reply_markup = page
+        await update.message.reply_text(text, parse_mode='HTML', reply_markup=reply_markup)
+
+    async def handle_delete_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Выбор паролей для удаления на inline-клавиатуре"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        await query.answer()
+
+        selected = context.user_data.setdefault('delete_selected', set())
+        cursor, newer = context.user_data.get('delete_page', (None, False))
+        _, action, *args = query.data.split('|')
+
+        if action == 'cancel':
+            context.user_data.pop('delete_selected', None)
+            context.user_data.pop('delete_page', None)
+            await query.edit_message_text("❌ Удаление отменено.")
+            return
+
+        if action == 'go':
+            password_ids = sorted(selected)
+            context.user_data.pop('delete_selected', None)
+            context.user_data.pop('delete_page', None)
+            if not password_ids:
+                await query.edit_message_text("ℹ️ Ничего не выбрано.")
+                return
+            deleted = self.db.delete_passwords(password_ids, user_id)
+            await query.edit_message_text(self.format_deleted(password_ids, deleted), parse_mode='HTML')
+            return
+
+        if action == 'toggle':
+            password_id = int(args[0])
+            selected.symmetric_difference_update({password_id})
+        elif action in ('prev', 'next'):
+            cursor, newer = (args[0], int(args[1])), action == 'prev'
+            context.user_data['delete_page'] = (cursor, newer)
+
+        page = self.render_delete_page(user_id, cursor, newer, selected)
+        if page is None:
+            await query.edit_message_text("📭 У вас нет сохраненных паролей для удаления.")
+            return
+
+        text, reply_markup = page
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
+
+    def render_delete_page(self, user_id: int, cursor: Optional[Tuple[str, int]], newer: bool,
+                           selected: set) -> Optional[Tuple[str, InlineKeyboardMarkup]]:
+        """Страница выбора для /delete: только метаданные, без зашифрованных данных"""
+        passwords, has_more = self.db.get_user_password_list_page(user_id, cursor, LIST_PAGE_SIZE, newer=newer)
+
+        if not passwords:
+            return None
+
+        text = "🗑️ <b>Выберите пароли для удаления:</b>\n\n"
+        keyboard = []
+        for password_id, service, created_at in passwords:
+            escaped_service = html.escape(service)
+            text += f"#{password_id} <b>{escaped_service}</b> - создан {created_at[:10]}\n"
+            check = '☑️' if password_id in selected else '⬜'
+            keyboard.append([InlineKeyboardButton(f"{check} {service}", callback_data=f"del|toggle|{password_id}")])
+
+        text += "\n💡 Отметьте пароли или используйте: /delete &lt;id&gt; [&lt;id&gt; ...]"
+
+        has_newer = has_more if newer else cursor is not None
+        has_older = cursor is not None if newer else has_more
+        navigation = []
+        if has_newer:
+            first_id, _, first_created = passwords[0]
+            navigation.append(InlineKeyboardButton("◀", callback_data=f"del|prev|{first_created}|{first_id}"))
+        if has_older:
+            last_id, _, last_created = passwords[-1]
+            navigation.append(InlineKeyboardButton("▶", callback_data=f"del|next|{last_created}|{last_id}"))
+        if navigation:
+            keyboard.append(navigation)
+
+        keyboard.append([
+            InlineKeyboardButton(f"🗑️ Удалить выбранные ({len(selected)})", callback_data='del|go'),
+            InlineKeyboardButton("❌ Отмена", callback_data='del|cancel')
+        ])
+        return text, InlineKeyboardMarkup(keyboard)
+
+    @staticmethod
+    def format_deleted(password_ids, deleted) -> str:
+        """Отчет об удалении паролей"""
+        if not deleted:
+            return "❌ Пароли с такими ID не найдены."
+
+        text = "✅ Удалены пароли:\n" + "\n".join(
+            f"#{password_id} <b>{html.escape(service)}</b>" for password_id, service in deleted
+        )
+        missing = set(password_ids) - {password_id for password_id, _ in deleted}
+        if missing:
+            text += "\n\n⚠️ Не найдены: " + ", ".join(f"#{password_id}" for password_id in sorted(missing))
+        return text
+
+    async def import_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /import"""
+        user_id = update.effective_user.id
+
+        if not self.db.user_exists(user_id):
+            await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
+            return
+
+        context.user_data['awaiting_import'] = True
+        await update.message.reply_text(
+            "📥 <b>Импорт паролей</b>\n\n"
+            "Отправьте файл одного из форматов:\n"
+            "• CSV с колонками service (или name, url) и password\n"
+            "• JSON-массив объектов с полями service и password\n"
+            "• JSON Lines - по объекту в строке\n\n"
+            f"Максимальный размер файла: {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ",
+            parse_mode='HTML'
+        )
+
+    async def handle_import_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Прием файла после /import: разбор, шифрование и запись пачками"""
+        user_id = update.effective_user.id
+        document = update.message.document
+
+        if not context.user_data.pop('awaiting_import', False):
+            await update.message.reply_text("ℹ️ Чтобы импортировать пароли из файла, сначала отправьте /import")
+            return
+
+        if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+            await update.message.reply_text(
+                f"❌ Файл слишком большой. Максимум {IMPORT_MAX_FILE_SIZE // (1024 * 1024)} МБ."
+            )
+            return
+
+        status = await update.message.reply_text("⏳ Импортирую пароли...")
+        encryption_key = hashlib.sha256(str(user_id).encode()).digest()
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+            try:
+                telegram_file = await document.get_file()
+                await telegram_file.download_to_memory(buffer)
+                buffer.seek(0)
+
+                vault_key = await self.crypto.get_vault_key(encryption_key)
+                imported, skipped = await asyncio.to_thread(
+                    import_vault, self.db, user_id, buffer, document.file_name or '',
+                    vault_key, self.encryption.cipher, IMPORT_BATCH_SIZE
+                )
+            except (ValueError, UnicodeDecodeError) as e:
+                await status.edit_text(f"❌ Не удалось разобрать файл: {e}")
+                return
+            except ImportInterrupted as e:
+                logger.error(f"Import for user {user_id} interrupted after {e.imported} passwords: {e.error}")
+                await status.edit_text(
+                    f"⚠️ Импортировано паролей: {e.imported}, затем импорт прервался из-за ошибки.\n"
+                    "Эти пароли уже сохранены: повторная загрузка того же файла создаст дубликаты."
+                )
+                return
+            except Exception as e:
+                logger.error(f"Error importing passwords for user {user_id}: {e}")
+                await status.edit_text("❌ Ошибка при импорте паролей.")
+                return
+
+        logger.info(f"User {user_id} imported {imported} passwords, skipped {skipped}")
+        text = f"✅ Импортировано паролей: {imported}"
+        if skipped:
+            text += f"\n⚠️ Пропущено записей без сервиса или пароля: {skipped}"
+        await status.edit_text(text)
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /export: файл, зашифрованный мастер-паролем"""
+        user_id = update.effective_user.id
+
+        if not self.db.user_exists(user_id):
+            await update.message.reply_text("❌ Сначала установите мастер-пароль командой /setmaster")
+            return
+
+        if not context.args:
+            await update.message.reply_text(
+                "📤 Для экспорта введите:\n"
+                "/export ваш_мастер_пароль\n\n"
+                "Файл будет зашифрован мастер-паролем."
+            )
+            return
+
+        master_password = ' '.join(context.args)
+        chat = update.effective_chat
+
+        # Сообщение с мастер-паролем не должно оставаться в истории чата
+        try:
+            await update.message.delete()
+        except Exception as e:
+            logger.warning(f"Could not delete /export message for user {user_id}: {e}")
+
+        if not await self.crypto.verify_master_password(self.db, user_id, master_password):
+            await chat.send_message("❌ Неверный мастер-пароль.")
+            return
+
+        status = await chat.send_message("⏳ Готовлю экспорт...")
+        encryption_key = hashlib.sha256(str(user_id).encode()).digest()
+
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+            try:
+                vault_key = await self.crypto.get_vault_key(encryption_key)
+                count = await asyncio.to_thread(
+                    export_vault, self.db, user_id, vault_key, encryption_key, master_password,
+                    buffer, EXPORT_KDF_ITERATIONS, IMPORT_BATCH_SIZE
+                )
+                buffer.seek(0)
+                await chat.send_document(
+                    document=buffer,
+                    filename=f"vault-{datetime.now():%Y-%m-%d}.nvx",
+                    caption=f"🔐 Экспортировано паролей: {count}\n"
+                            "Файл зашифрован мастер-паролем, расшифровка: python vault_io.py файл.nvx"
+                )
+            except Exception as e:
+                logger.error(f"Error exporting passwords for user {user_id}: {e}")
+                await status.edit_text("❌ Ошибка при экспорте паролей.")
+                return
+
+        await status.delete()
 
     async def handle_button_click(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка нажатий на inline кнопки"""
@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+from bot import PasswordManagerBot
+from metrics import LoopLagMonitor
+from outbound import OutboundQueue
+
+logger = logging.getLogger(__name__)
+
+FAKE_TOKEN = '123456:LOAD-TEST-TOKEN'
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Password Manager', 'username': 'load_test_bot'}
+
+# Первый id виртуальных пользователей, чтобы не пересекаться с настоящими
+FIRST_USER_ID = 10 ** 9
+
+
+class FakeBot(ExtBot):
+    """Бот без сети: отвечает на вызовы Bot API правдоподобными заглушками и считает их"""
+
+    def __init__(self, token: str = FAKE_TOKEN, latency: float = 0.0, rate_limiter: Optional[OutboundQueue] = None):
+        super().__init__(token, rate_limiter=rate_limiter)
+        # Объекты telegram неизменяемы после создания, свои поля добавляем явно
+        with self._unfrozen():
+            self.latency = latency
+            self.calls: Counter = Counter()
+            self._message_id = 0
+
+    async def _do_post(self, endpoint: str, data: Dict, *, read_timeout=None, write_timeout=None,
+                       connect_timeout=None, pool_timeout=None):
+        # Как и ExtBot, пропускаем вызовы через очередь, но вместо сети - заглушки
+        rate_limit_args = self._extract_rl_kwargs(data)
+        if self.rate_limiter is None:
+            return await self._fake_post(endpoint, data)
+        return await self.rate_limiter.process_request(
+            callback=self._fake_post, args=(endpoint, data), kwargs={}, endpoint=endpoint, data=data,
+            rate_limit_args=rate_limit_args
+        )
+
+    async def _fake_post(self, endpoint: str, data: Dict):
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if endpoint == 'getMe':
+            return dict(BOT_USER, can_join_groups=False, can_read_all_group_messages=False,
+                        supports_inline_queries=False)
+        if endpoint in ('sendMessage', 'sendDocument', 'editMessageText', 'editMessageReplyMarkup'):
+            self._message_id += 1
+            return {
+                'message_id': data.get('message_id', self._message_id),
+                'date': int(time.time()),
+                'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'},
+                'from': BOT_USER,
+                'text': data.get('text', '')
+            }
+        return True
+
+
+class UpdateFactory:
+    """Синтетические обновления Telegram для виртуальных пользователей"""
+
+    def __init__(self, bot: FakeBot):
+        self.bot = bot
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    @staticmethod
+    def _user(user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+
+    def message(self, user_id: int, text: str) -> Update:
+        """Текстовое сообщение или команда"""
+        update_id, message_id = self._next_ids()
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': update_id, 'message': message}, self.bot)
+
+    def callback(self, user_id: int, data: str) -> Update:
+        """Нажатие кнопки под сообщением бота"""
+        update_id, message_id = self._next_ids()
+        return Update.de_json({
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': '...'
+                }
+            }
+        }, self.bot)
+
+    def inline_query(self, user_id: int, query: str) -> Update:
+        """Запрос в inline-режиме: @бот запрос"""
+        update_id, _ = self._next_ids()
+        return Update.de_json({
+            'update_id': update_id,
+            'inline_query': {
+                'id': str(update_id),
+                'from': self._user(user_id),
+                'query': query,
+                'offset': ''
+            }
+        }, self.bot)
+
+
+def scenario(factory: UpdateFactory, user_id: int, rounds: int) -> List[tuple]:
+    """Шаги виртуального пользователя: (название шага, обновление)"""
+    steps = [('setmaster', factory.message(user_id, '/setmaster load-test-master'))]
+    for i in range(rounds):
+        steps += [
+            ('generate_dialog', factory.message(user_id, '/generate_dialog')),
+            ('service_name', factory.message(user_id, f'service-{i}.example')),
+            ('save', factory.callback(user_id, 'save')),
+            ('list', factory.message(user_id, '/list')),
+        ]
+    steps += [
+        ('find', factory.message(user_id, '/find example')),
+        ('inline_query', factory.inline_query(user_id, 'service-0')),
+    ]
+    steps += [
+        ('settings_dialog', factory.message(user_id, '/settings_dialog')),
+        ('settings_toggle', factory.callback(user_id, 'digits')),
+        ('settings_save', factory.callback(user_id, 'save')),
+    ]
+    return steps
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def run_load(users: int, concurrency: int, rounds: int, latency: float, db_path: str,
+                   outbound_rate: float = 0.0) -> Dict:
+    """Прогон сценариев через настоящий Application и обработчики"""
+    outbound = OutboundQueue(outbound_rate, chat_rate=outbound_rate) if outbound_rate > 0 else None
+    fake_bot = FakeBot(latency=latency, rate_limiter=outbound)
+    password_bot = PasswordManagerBot(FAKE_TOKEN, bot=fake_bot, db_path=db_path)
+    application = password_bot.application
+    factory = UpdateFactory(fake_bot)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors = Counter()
+
+    async def on_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(on_error)
+    await application.initialize()
+    await password_bot.post_init(application)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    monitor = LoopLagMonitor(interval=0.01, max_samples=None)
+
+    async def virtual_user(user_id: int):
+        async with semaphore:
+            for step, update in scenario(factory, user_id, rounds):
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies[step].append(time.perf_counter() - started)
+
+    monitor.start()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(virtual_user(FIRST_USER_ID + i) for i in range(users)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await monitor.stop()
+        await application.shutdown()
+        await password_bot.post_shutdown(application)
+
+    return {
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'loop_lag': monitor.samples,
+        'bot_calls': fake_bot.calls,
+        'errors': errors,
+        'outbound': outbound.stats() if outbound is not None else None,
+    }
+
+
+def print_report(result: Dict):
+    """Пропускная способность, перцентили задержек и задержка event loop"""
+    all_latencies = [value for values in result['latencies'].values() for value in values]
+    total = len(all_latencies)
+    print(f"Updates: {total} in {result['elapsed']:.2f}s, {total / result['elapsed']:.1f} updates/s")
+    print(f"{'step':<20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for step, values in list(result['latencies'].items()) + [('all', all_latencies)]:
+        print(f"{step:<20} {len(values):>7} "
+              + ' '.join(f"{percentile(values, q) * 1000:>9.1f}" for q in (50, 95, 99, 100)))
+
+    lag = result['loop_lag']
+    print(f"Event loop lag: p50 {percentile(lag, 50) * 1000:.1f} ms, "
+          f"p99 {percentile(lag, 99) * 1000:.1f} ms, max {percentile(lag, 100) * 1000:.1f} ms")
+    print(f"Bot API calls: {dict(result['bot_calls'])}")
+    if result['outbound'] is not None:
+        print(f"Outbound queue: {result['outbound']}")
+    if result['errors']:
+        print(f"Handler errors: {dict(result['errors'])}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='End-to-end load test against a fake Telegram bot')
+    parser.add_argument('--users', type=int, default=1000, help='virtual users')
+    parser.add_argument('--concurrency', type=int, default=100, help='users active at the same time')
+    parser.add_argument('--rounds', type=int, default=3, help='generate/save/list rounds per user')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated Bot API latency, seconds')
+    parser.add_argument('--outbound-rate', type=float, default=0.0,
+                        help='send through OutboundQueue with this global and per-chat rate (0 - directly)')
+    parser.add_argument('--db', help='database file (default: a fresh temporary database)')
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, 'load_test.db')
+        result = asyncio.run(run_load(args.users, args.concurrency, args.rounds, args.latency, db_path,
+                                     args.outbound_rate))
+    print_report(result)
+
+
+if __name__ == '__main__':
+    main()
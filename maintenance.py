@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (DB_PATH, DB_SHARDS, LOG_CONFIG, REMINDER_RETENTION_DAYS, MAINTENANCE_BATCH_SIZE,
+                    MAINTENANCE_BATCH_PAUSE)
+from database import ConnectionPool, DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# Страниц, возвращаемых системе одной транзакцией incremental_vacuum
+VACUUM_STEP_PAGES = 1024
+
+PURGE_QUERIES = {
+    # Отправленные напоминания старше срока хранения
+    'sent': '''
+        SELECT id FROM reminders
+        WHERE id > ? AND sent = 1 AND reminder_date < ?
+        ORDER BY id LIMIT ?
+    ''',
+    # Напоминания паролей, удаленных до появления триггера каскадного удаления
+    'orphaned': '''
+        SELECT r.id FROM reminders r
+        WHERE r.id > ? AND NOT EXISTS (SELECT 1 FROM passwords p WHERE p.id = r.password_id)
+        ORDER BY r.id LIMIT ?
+    '''
+}
+
+
+def _never() -> bool:
+    return False
+
+
+def purge_reminders(pool: ConnectionPool, kind: str, params: tuple = (), batch_size: int = 1000,
+                    pause: float = 0.05, should_stop: Callable[[], bool] = _never) -> int:
+    """Удаление напоминаний пачками по возрастанию id, возвращает число удаленных
+
+    Кандидаты ищутся на читателе: условия отбора не покрыты индексами, и
+    поиск может пройти остаток таблицы. Писатель берется только на удаление
+    найденных id по первичному ключу, поэтому каждая пачка - короткая
+    транзакция, и между пачками писатель свободен для обработчиков бота.
+    Условия отбора со временем не перестают выполняться: отправленное
+    напоминание не становится неотправленным, а id паролей не переиспользуются
+    (AUTOINCREMENT), поэтому повторная проверка при удалении не нужна.
+    """
+    query = PURGE_QUERIES[kind]
+    after = 0
+    total = 0
+
+    while True:
+        with pool.reader() as conn:
+            ids = [row[0] for row in conn.execute(query, (after, *params, batch_size))]
+        if ids:
+            with pool.writer() as conn:
+                conn.executemany('DELETE FROM reminders WHERE id = ?', [(reminder_id,) for reminder_id in ids])
+
+        total += len(ids)
+        if len(ids) < batch_size or should_stop():
+            return total
+        after = ids[-1]
+        time.sleep(pause)
+
+
+def page_stats(pool: ConnectionPool) -> Tuple[int, int]:
+    """Размер базы и ее свободных страниц в байтах"""
+    page_size = pool.writer_pragma('page_size')
+    return pool.writer_pragma('page_count') * page_size, pool.writer_pragma('freelist_count') * page_size
+
+
+def reclaim_space(pool: ConnectionPool, pause: float = 0.05, vacuum: bool = False,
+                  should_stop: Callable[[], bool] = _never) -> int:
+    """Возврат свободных страниц системе, возвращает освобожденные байты
+
+    По умолчанию - incremental_vacuum порциями по VACUUM_STEP_PAGES. Полный
+    VACUUM (vacuum=True) перестраивает файл целиком, блокируя запись, и
+    переводит старую базу в режим auto_vacuum = INCREMENTAL.
+    """
+    size_before, free = page_stats(pool)
+
+    if vacuum:
+        pool.execute_autocommit('VACUUM')
+    else:
+        if pool.writer_pragma('auto_vacuum') != 2:
+            if free:
+                logger.info(f"{pool.db_path} is not in incremental auto_vacuum mode, "
+                            f"run maintenance.py --vacuum once to reclaim {free} bytes")
+            return 0
+
+        while free and not should_stop():
+            pool.execute_autocommit(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+            free = page_stats(pool)[1]
+            time.sleep(pause)
+
+    # Файл уменьшается только после переноса WAL в основную базу
+    pool.execute_autocommit('PRAGMA wal_checkpoint(TRUNCATE)')
+    return max(size_before - page_stats(pool)[0], 0)
+
+
+def run_maintenance(db: DatabaseManager, retention_days: int = 30, batch_size: int = 1000, pause: float = 0.05,
+                    vacuum: bool = False, should_stop: Callable[[], bool] = _never) -> Dict[str, float]:
+    """Очистка напоминаний, возврат места и PRAGMA optimize на каждом шарде
+
+    should_stop проверяется между пачками: при остановке бота работа
+    прерывается, не дожидаясь конца обхода.
+    """
+    started = time.perf_counter()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    report = {'sent': 0, 'orphaned': 0, 'reclaimed_bytes': 0}
+
+    for pool in db.pools:
+        if should_stop():
+            break
+        report['sent'] += purge_reminders(pool, 'sent', (cutoff,), batch_size, pause, should_stop)
+        report['orphaned'] += purge_reminders(pool, 'orphaned', (), batch_size, pause, should_stop)
+        report['reclaimed_bytes'] += reclaim_space(pool, pause, vacuum, should_stop)
+        pool.execute_autocommit('PRAGMA optimize')
+
+    report['seconds'] = time.perf_counter() - started
+    logger.info(
+        f"Maintenance done in {report['seconds']:.1f}s: purged {report['sent']} sent and "
+        f"{report['orphaned']} orphaned reminders, reclaimed {report['reclaimed_bytes']} bytes"
+    )
+    return report
+
+
+class MaintenanceScheduler:
+    """Ежедневное обслуживание базы в заданный час (UTC), в отдельном потоке"""
+
+    def __init__(self, db: DatabaseManager, hour: int = 4, retention_days: int = 30,
+                 batch_size: int = 1000, pause: float = 0.05):
+        self.db = db
+        self.hour = hour
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.last_report: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._job: Optional[asyncio.Future] = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка; идущее обслуживание прерывается после текущей пачки"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Поток нельзя отменить: ждем его, чтобы база не закрылась посреди пачки
+        if self._job is not None:
+            await asyncio.wait([self._job])
+            self._job = None
+
+    def seconds_until_next_run(self, now: Optional[datetime] = None) -> float:
+        """Время до ближайшего наступления self.hour:00 UTC"""
+        now = now or datetime.now(timezone.utc)
+        next_run = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.seconds_until_next_run())
+            self._job = asyncio.ensure_future(asyncio.to_thread(
+                run_maintenance, self.db, self.retention_days, self.batch_size, self.pause,
+                False, self._stopping.is_set
+            ))
+            try:
+                self.last_report = await asyncio.shield(self._job)
+            except Exception as e:
+                logger.error(f"Error in database maintenance: {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Purge old reminders and reclaim database space')
+    parser.add_argument('--db', default=DB_PATH, help='base database path (DB_PATH)')
+    parser.add_argument('--shards', type=int, default=DB_SHARDS, help='DB_SHARDS')
+    parser.add_argument('--retention-days', type=int, default=REMINDER_RETENTION_DAYS,
+                        help='keep sent reminders this long')
+    parser.add_argument('--batch-size', type=int, default=MAINTENANCE_BATCH_SIZE,
+                        help='reminders deleted per transaction')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='full VACUUM instead of incremental (blocks writes, enables incremental mode)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(**LOG_CONFIG)
+    db = DatabaseManager(args.db, readers=1, shards=args.shards)
+    try:
+        report = run_maintenance(db, args.retention_days, args.batch_size, MAINTENANCE_BATCH_PAUSE, args.vacuum)
+    finally:
+        db.close()
+
+    print(f"sent={report['sent']} orphaned={report['orphaned']} reclaimed_bytes={report['reclaimed_bytes']} "
+          f"seconds={report['seconds']:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import asyncio
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram.ext import BaseHandler, CommandHandler, ConversationHandler
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержек (секунды): от запроса к кэшу до PBKDF2 под нагрузкой
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """Метки в формате Prometheus: {name="value",...}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """Базовая метрика с набором меток"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        """Строки текстового формата Prometheus"""
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(Metric):
+    """Мгновенное значение; может вычисляться функцией при каждом сборе"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                logger.error(f"Error collecting gauge {self.name}: {e}")
+                return lines
+            lines.append(f'{self.name} {_format_value(value)}')
+            return lines
+
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(Metric):
+    """Гистограмма с накопительными корзинами, суммой и количеством"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счетчики по корзинам (+Inf последней), сумма
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            item = self._values.get(labels)
+            if item is None:
+                item = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            counts, total = item
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}')
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых одним эндпоинтом"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def handler_name(handler: BaseHandler) -> str:
+    """Имя обработчика для меток: команда или имя функции"""
+    if isinstance(handler, CommandHandler):
+        return '/' + sorted(handler.commands)[0]
+    return getattr(handler.callback, '__name__', type(handler).__name__)
+
+
+def wrap_handler(handler: BaseHandler, decorate: Callable[[Callable, str], Callable]) -> BaseHandler:
+    """Замена callback обработчика на decorate(callback, имя); ConversationHandler - рекурсивно"""
+    if isinstance(handler, ConversationHandler):
+        for nested in handler.entry_points + handler.fallbacks:
+            wrap_handler(nested, decorate)
+        for handlers in handler.states.values():
+            for nested in handlers:
+                wrap_handler(nested, decorate)
+        return handler
+
+    handler.callback = functools.wraps(handler.callback)(decorate(handler.callback, handler_name(handler)))
+    return handler
+
+
+def instrument_handler(handler: BaseHandler, latency: Histogram, errors: Counter) -> BaseHandler:
+    """Обертка callback обработчика замером времени"""
+    def decorate(callback, name):
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started, name)
+        return timed
+
+    return wrap_handler(handler, decorate)
+
+
+def instrument_methods(obj, latency: Histogram, errors: Counter,
+                       names: Optional[Iterable[str]] = None, exclude: Iterable[str] = ()):
+    """Замена публичных методов экземпляра обертками с замером времени
+
+    Обертки ставятся на сам экземпляр, поэтому класс и другие его
+    экземпляры (например, в процессах пула шифрования) не затрагиваются.
+    """
+    if names is None:
+        names = [
+            name for name, value in inspect.getmembers(type(obj), callable)
+            if not name.startswith('_') and not inspect.isclass(value)
+        ]
+    excluded = set(exclude)
+
+    for name in names:
+        if name in excluded:
+            continue
+        method = getattr(obj, name)
+
+        if inspect.iscoroutinefunction(method):
+            async def timed(*args, _method=method, _name=name, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await _method(*args, **kwargs)
+                except Exception:
+                    errors.inc(_name)
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - started, _name)
+        else:
+            def timed(*args, _method=method, _name=name, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return _method(*args, **kwargs)
+                except Exception:
+                    errors.inc(_name)
+                    raise
+                finally:
+                    latency.observe(time.perf_counter() - started, _name)
+
+        setattr(obj, name, functools.wraps(method)(timed))
+
+
+class LoopLagMonitor:
+    """Задержка event loop: насколько позже заказанного просыпается спящая задача"""
+
+    def __init__(self, interval: float = 0.5, max_samples: Optional[int] = 120):
+        self.interval = interval
+        self.samples = deque(maxlen=max_samples)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def max_lag(self) -> float:
+        """Наибольшая задержка среди последних замеров"""
+        return max(self.samples, default=0.0)
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from rate_limit import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Полосы очереди по убыванию приоритета: ответы пользователям идут впереди рассылок
+INTERACTIVE_LANE = 'interactive'
+BULK_LANE = 'bulk'
+LANES = (INTERACTIVE_LANE, BULK_LANE)
+
+
+class ChatState:
+    """Очередь одного чата: блокировка задает порядок, бакет - частоту"""
+
+    __slots__ = ('lock', 'bucket', 'users', 'released_at')
+
+    def __init__(self, rate: float, burst: float):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, burst)
+        self.users = 0
+        self.released_at = 0.0
+
+
+class OutboundQueue(BaseRateLimiter[str]):
+    """Общая очередь исходящих запросов к Bot API с учетом flood control
+
+    Подключается к боту как rate_limiter, поэтому через нее проходят все
+    вызовы: ответы обработчиков, правки сообщений и напоминания. Запрос
+    сначала ждет своей очереди в чате (по порядку, с лимитом чата), затем
+    токен общего лимита бота; общий лимит раздается по приоритету полос.
+    Полоса задается через rate_limit_args, по умолчанию - interactive.
+
+    Правка editMessageText, которую еще ждущая в очереди более новая правка
+    того же сообщения делает ненужной, не отправляется: вызов получает
+    результат новой правки. При RetryAfter выдача токенов приостанавливается
+    на указанное время, и запрос повторяется до max_retries раз.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 max_retries: int = 3):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats: Dict[Hashable, ChatState] = {}
+        self._pruned_at = time.monotonic()
+        # Последняя правка каждого сообщения, еще не отправленная
+        self._edits: Dict[Tuple, asyncio.Future] = {}
+        # Ожидающие общего токена: (приоритет полосы, порядковый номер, полоса, разрешение)
+        self._heap: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.queued = dict.fromkeys(LANES, 0)
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._pump())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """Запросы в работе по полосам (ждущие лимитов и отправляемые) и счетчики для метрик"""
+        return {
+            **self.queued,
+            'chats': sum(1 for chat in self._chats.values() if chat.users),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retries': self.retries
+        }
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[str],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        if self._task is None:
+            await self.initialize()
+
+        lane = rate_limit_args if rate_limit_args in LANES else INTERACTIVE_LANE
+        chat_id = data.get('chat_id')
+        if chat_id is None and data.get('inline_message_id') is not None:
+            chat_id = ('inline', data['inline_message_id'])
+
+        edit_key = None
+        edit: Optional[asyncio.Future] = None
+        if endpoint == 'editMessageText':
+            edit_key = (chat_id, data.get('message_id'))
+            edit = self._edits[edit_key] = asyncio.get_running_loop().create_future()
+
+        self.queued[lane] += 1
+        try:
+            if chat_id is None:
+                return await self._send(callback, args, kwargs, lane, None)
+
+            chat = self._chat(chat_id)
+            chat.users += 1
+            latest = None
+            try:
+                async with chat.lock:
+                    latest = self._edits.get(edit_key) if edit is not None else None
+                    if latest is None or latest is edit:
+                        latest = None
+                        if edit is not None:
+                            del self._edits[edit_key]
+                        result = await self._send(callback, args, kwargs, lane, chat)
+                        if edit is not None:
+                            edit.set_result(result)
+                        return result
+            finally:
+                chat.users -= 1
+                chat.released_at = time.monotonic()
+
+            # Более новая правка того же сообщения стоит в очереди чата за нами:
+            # ждем ее результата, уже отпустив очередь
+            self.coalesced += 1
+            return await asyncio.shield(latest)
+        except Exception as e:
+            if edit is not None and not edit.done():
+                edit.set_exception(e)
+                # Исключение уже получил вызывающий; ждущих правок может и не быть
+                edit.exception()
+            raise
+        finally:
+            self.queued[lane] -= 1
+            if edit is not None:
+                if not edit.done():
+                    edit.cancel()
+                if self._edits.get(edit_key) is edit:
+                    del self._edits[edit_key]
+
+    async def _send(self, callback, args, kwargs, lane: str, chat: Optional[ChatState]):
+        """Ожидание лимитов и вызов API с повтором после RetryAfter"""
+        for attempt in range(self.max_retries + 1):
+            if chat is not None:
+                await chat.bucket.acquire()
+            await self._grant(lane)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Flood control hit, giving up after {self.max_retries} retries")
+                    raise
+                delay = retry_after_seconds(e)
+                logger.warning(f"Flood control hit, pausing outbound queue for {delay}s")
+                self.retries += 1
+                self.global_bucket.pause(delay)
+                if chat is not None:
+                    chat.bucket.pause(delay)
+                continue
+            self.sent += 1
+            return result
+
+    async def _grant(self, lane: str):
+        """Очередь за токеном общего лимита с учетом приоритета полосы"""
+        grant = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (LANES.index(lane), next(self._counter), lane, grant))
+        self._wakeup.set()
+        await grant
+
+    async def _pump(self):
+        """Раздача токенов общего лимита ожидающим в порядке приоритета"""
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            grant = self._heap[0][3]
+            if grant.done():
+                # Вызывающий отменил запрос, пока ждал
+                heapq.heappop(self._heap)
+                continue
+
+            wait = self.global_bucket.try_acquire()
+            if wait > 0:
+                # Пока ждем, в очередь может встать запрос с более высоким приоритетом
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._heap)
+            grant.set_result(None)
+
+    def _chat(self, chat_id: Hashable) -> ChatState:
+        """Состояние чата; чаты без запросов удаляются после восстановления бакета"""
+        now = time.monotonic()
+        idle = self.chat_burst / self.chat_rate
+        if now - self._pruned_at >= idle and len(self._chats) > 1024:
+            self._chats = {
+                key: chat for key, chat in self._chats.items()
+                if chat.users or now - chat.released_at < idle
+            }
+            self._pruned_at = now
+
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatState(self.chat_rate, self.chat_burst)
+        return chat
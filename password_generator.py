@@ -1,39 +1,159 @@
+import os
 import secrets
 import string
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy нужен только для очень больших пачек
+    np = None
+
+from wordlist import Wordlist
+
+CHAR_CATEGORIES = {
+    'use_uppercase': string.ascii_uppercase,
+    'use_lowercase': string.ascii_lowercase,
+    'use_digits': string.digits,
+    'use_special': '!@#$%^&*()_+-=[]{}|;:,.<>?'
+}
+
+# С какого размера пачки использовать NumPy, если он установлен
+NUMPY_BATCH_THRESHOLD = 2000
+
+DEFAULT_WORDLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wordlists', 'eff_large_wordlist.txt')
+PASSPHRASE_SEPARATOR = '-'
+
+
+class Alphabet:
+    """Алфавит с таблицей для несмещенной выборки из случайных байт
+
+    Байт b < limit превращается в символ alphabet[b % n], остальные байты
+    отбрасываются (rejection sampling). bytes.translate делает это для всего
+    буфера за один вызов.
+    """
+
+    __slots__ = ('chars', 'limit', 'table', 'rejected')
+
+    def __init__(self, chars: str):
+        self.chars = chars
+        self.limit = 256 - 256 % len(chars)
+        self.table = bytes(ord(chars[b % len(chars)]) if b < self.limit else 0 for b in range(256))
+        self.rejected = bytes(range(self.limit, 256))
+
+    def sample(self, count: int) -> bytes:
+        """count случайных символов алфавита"""
+        result = b''
+        while len(result) < count:
+            missing = count - len(result)
+            # Запас на отброшенные байты, чтобы почти всегда хватало одного вызова
+            buffer = os.urandom(missing * 256 // self.limit + 16)
+            result += buffer.translate(self.table, self.rejected)
+        return result[:count]
+
+
+@lru_cache(maxsize=64)
+def get_alphabets(flags: Tuple[bool, ...]) -> Tuple[Alphabet, Tuple[Alphabet, ...]]:
+    """Общий алфавит и алфавиты категорий для набора настроек"""
+    categories = tuple(
+        Alphabet(chars)
+        for enabled, chars in zip(flags, CHAR_CATEGORIES.values())
+        if enabled
+    )
+    return Alphabet(''.join(alphabet.chars for alphabet in categories)), categories
+
 
 class PasswordGenerator:
     """Генератор паролей"""
 
-    @staticmethod
-    def generate_password(settings: Dict) -> str:
+    def __init__(self, wordlist_path: str = DEFAULT_WORDLIST_PATH):
+        self.wordlist_path = wordlist_path
+        self._wordlist: Optional[Wordlist] = None
+
+    @property
+    def wordlist(self) -> Wordlist:
+        """Список слов для парольных фраз, открывается при первом использовании"""
+        if self._wordlist is None:
+            self._wordlist = Wordlist(self.wordlist_path)
+        return self._wordlist
+
+    def generate_password(self, settings: Dict) -> str:
         """Генерация пароля по настройкам"""
-        length = settings.get('length', 16)
-        char_categories = {
-            'use_uppercase': string.ascii_uppercase,
-            'use_lowercase': string.ascii_lowercase,
-            'use_digits': string.digits,
-            'use_special': '!@#$%^&*()_+-=[]{}|;:,.<>?'
-        }
-
-        characters = ''.join(
-            chars for setting, chars in char_categories.items() 
-            if settings.get(setting, True)
+        return self.generate_batch(settings, 1)[0]
+
+    def generate_batch(self, settings: Dict, count: int, use_numpy: bool = True) -> List[str]:
+        """Генерация пачки паролей или парольных фраз по настройкам"""
+        if settings.get('mode') == 'passphrase':
+            return [self.generate_passphrase(settings) for _ in range(count)]
+        return self.generate_char_batch(settings, count, use_numpy)
+
+    def generate_passphrase(self, settings: Dict) -> str:
+        """Парольная фраза в стиле diceware из случайных слов списка"""
+        wordlist = self.wordlist
+        word_count = settings.get('word_count', 6)
+        return PASSPHRASE_SEPARATOR.join(
+            wordlist[secrets.randbelow(len(wordlist))] for _ in range(word_count)
         )
 
-        if not characters:
+    @staticmethod
+    def generate_char_batch(settings: Dict, count: int, use_numpy: bool = True) -> List[str]:
+        """Генерация пачки паролей из одного буфера энтропии"""
+        length = settings.get('length', 16)
+        flags = tuple(settings.get(category, True) for category in CHAR_CATEGORIES)
+        if not any(flags):
             raise ValueError("Не выбран ни один тип символов для генерации пароля")
+        if count <= 0:
+            return []
 
+        combined, categories = get_alphabets(flags)
         # Гарантируем наличие хотя бы одного символа из каждой выбранной категории
-        password = [
-            secrets.choice(char_categories[category])
-            for category in char_categories 
-            if settings.get(category, True)
-        ]
-
-        # Добиваем до нужной длины
-        while len(password) < length:
-            password.append(secrets.choice(characters))
-
-        secrets.SystemRandom().shuffle(password)
-        return ''.join(password[:length])
\ No newline at end of file
+        guaranteed = min(len(categories), length)
+        fill = length - guaranteed
+
+        if use_numpy and np is not None and count >= NUMPY_BATCH_THRESHOLD:
+            return PasswordGenerator._generate_batch_numpy(combined, categories[:guaranteed], count, fill)
+
+        category_chars = [category.sample(count) for category in categories[:guaranteed]]
+        fill_chars = combined.sample(count * fill)
+        shuffle_bytes = bytearray()
+        shuffle_pos = 0
+
+        passwords = []
+        for i in range(count):
+            password = bytearray(chars[i] for chars in category_chars)
+            password += fill_chars[i * fill:(i + 1) * fill]
+
+            # Тасование Фишера-Йетса с несмещенными индексами из общего буфера
+            for j in range(length - 1, 0, -1):
+                limit = 256 - 256 % (j + 1)
+                while True:
+                    if shuffle_pos >= len(shuffle_bytes):
+                        shuffle_bytes = os.urandom(max(256, (count - i) * length))
+                        shuffle_pos = 0
+                    value = shuffle_bytes[shuffle_pos]
+                    shuffle_pos += 1
+                    if value < limit:
+                        break
+                k = value % (j + 1)
+                password[j], password[k] = password[k], password[j]
+
+            passwords.append(password.decode('ascii'))
+
+        return passwords
+
+    @staticmethod
+    def _generate_batch_numpy(combined: Alphabet, categories: Tuple[Alphabet, ...],
+                              count: int, fill: int) -> List[str]:
+        """Векторизованная генерация больших пачек"""
+        columns = [np.frombuffer(category.sample(count), dtype=np.uint8).reshape(count, 1)
+                   for category in categories]
+        columns.append(np.frombuffer(combined.sample(count * fill), dtype=np.uint8).reshape(count, fill))
+        matrix = np.hstack(columns)
+
+        # Случайная перестановка каждой строки: сортировка по 64-битным случайным ключам
+        keys = np.frombuffer(os.urandom(matrix.size * 8), dtype=np.uint64).reshape(matrix.shape)
+        matrix = np.take_along_axis(matrix, np.argsort(keys, axis=1), axis=1)
+
+        length = matrix.shape[1]
+        data = matrix.tobytes().decode('ascii')
+        return [data[i * length:(i + 1) * length] for i in range(count)]
@@ -0,0 +1,253 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+from metrics import instrument_methods, wrap_handler
+
+logger = logging.getLogger(__name__)
+
+# Интервалы вызовов базы и криптографии для обновления, которое сейчас обрабатывается
+update_timings: ContextVar[Optional[Dict[str, List[Tuple[float, float]]]]] = ContextVar('update_timings', default=None)
+
+# Глубина стека в одном сэмпле
+MAX_STACK_DEPTH = 64
+
+
+class UpdateTimer:
+    """Приемник замеров instrument_methods: интервалы вызовов в разбивку текущего обновления
+
+    Хранятся интервалы, а не сумма: вложенные вызовы (CryptoService.encrypt
+    вызывает get_vault_key) и параллельные (gather) не считаются дважды.
+    """
+
+    def __init__(self, category: str):
+        self.category = category
+
+    def observe(self, value: float, *labels: str):
+        timings = update_timings.get()
+        if timings is not None:
+            end = time.perf_counter()
+            timings.setdefault(self.category, []).append((end - value, end))
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        pass
+
+
+def covered(intervals: List[Tuple[float, float]]) -> float:
+    """Суммарная длина объединения интервалов"""
+    total = 0.0
+    current_start, current_end = None, None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total
+
+
+class StackSampler:
+    """Сэмплирующий профайлер потока event loop
+
+    Пока идет хотя бы одно выбранное обновление, фоновый поток раз в interval
+    снимает стек потока event loop через sys._current_frames. Остальное время
+    поток спит, и обработка обновлений не замедляется. Накопленные стеки раз в
+    flush_interval дописываются в файл в формате folded stacks (flamegraph.pl,
+    speedscope), файлы ротируются по размеру.
+    """
+
+    def __init__(self, path: str, interval: float = 0.005, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, flush_interval: float = 60.0):
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.samples = 0
+        self._active = 0
+        self._counts: Counter = Counter()
+        self._target: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self._file.setFormatter(logging.Formatter('%(message)s'))
+
+    def start(self):
+        """Запуск; вызывается из потока event loop, который и будет профилироваться"""
+        if self._thread is None:
+            self._target = threading.get_ident()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self._flush()
+        self._file.close()
+
+    def begin(self):
+        """Начало выбранного обновления"""
+        self._active += 1
+        self._wakeup.set()
+
+    def end(self):
+        self._active -= 1
+
+    @staticmethod
+    def fold(frame) -> str:
+        """Стек в формате folded: от корня к вершине через ';'"""
+        names: List[str] = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        flushed_at = time.monotonic()
+        while not self._stopping.is_set():
+            if self._active > 0:
+                frame = sys._current_frames().get(self._target)
+                if frame is not None:
+                    self._counts[self.fold(frame)] += 1
+                    self.samples += 1
+                del frame
+                time.sleep(self.interval)
+            else:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+
+            if time.monotonic() - flushed_at >= self.flush_interval:
+                self._flush()
+                flushed_at = time.monotonic()
+
+    def _flush(self):
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, Counter()
+        message = '\n'.join(f'{stack} {count}' for stack, count in counts.most_common())
+        self._file.emit(logging.makeLogRecord({'msg': message}))
+
+
+def task_stack(task: Optional[asyncio.Task]) -> str:
+    """Стек приостановленной задачи: цепочка await от внешней корутины до текущей точки
+
+    Task.get_stack для приостановленной корутины возвращает только ее
+    внешний кадр, поэтому цепочка собирается по cr_await.
+    """
+    frames = []
+    awaitable = task.get_coro() if task is not None else None
+    while awaitable is not None and len(frames) < MAX_STACK_DEPTH:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+    return ''.join(traceback.format_list(traceback.StackSummary.extract(frames)))
+
+
+class UpdateProfiler:
+    """Профилирование обработчиков: выборочный сэмплинг и журнал медленных обновлений
+
+    Подключается только при включенных настройках: если профилирование
+    выключено, обработчики и методы базы не оборачиваются вовсе. Для
+    обновлений дольше slow_threshold в журнал пишутся команда, хэш id
+    пользователя, время в базе и криптографии (с ожиданием пула процессов) и
+    стек задачи на момент превышения порога.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, slow_threshold: float = 0.0,
+                 sampler: Optional[StackSampler] = None):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.sampler = sampler if sample_rate > 0 else None
+        self.slow_updates = 0
+        # Ключ хэша id пользователя: записи одного запуска сопоставимы, id из журнала не восстановить
+        self._user_key = secrets.token_bytes(16)
+
+    def instrument(self, obj, category: str, exclude: Iterable[str] = ()):
+        """Учет времени вызовов методов obj в разбивке текущего обновления"""
+        timer = UpdateTimer(category)
+        instrument_methods(obj, timer, timer, exclude=exclude)
+
+    def wrap(self, handler: BaseHandler) -> BaseHandler:
+        return wrap_handler(handler, self._decorate)
+
+    def start(self):
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def user_hash(self, update: object) -> str:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            return '-'
+        return hmac.new(self._user_key, str(user.id).encode(), 'sha256').hexdigest()[:12]
+
+    def _decorate(self, callback, name: str):
+        async def profiled(update, context):
+            timings: Dict[str, List[Tuple[float, float]]] = {}
+            token = update_timings.set(timings)
+            sampled = self.sampler is not None and random.random() < self.sample_rate
+            if sampled:
+                self.sampler.begin()
+
+            snapshot: List[str] = []
+            timer = None
+            if self.slow_threshold > 0:
+                task = asyncio.current_task()
+                timer = asyncio.get_running_loop().call_later(
+                    self.slow_threshold, lambda: snapshot.append(task_stack(task))
+                )
+
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                if timer is not None:
+                    timer.cancel()
+                if sampled:
+                    self.sampler.end()
+                update_timings.reset(token)
+                if self.slow_threshold > 0 and elapsed >= self.slow_threshold:
+                    self._log_slow(name, update, elapsed, timings, snapshot)
+
+        return profiled
+
+    def _log_slow(self, name: str, update: object, elapsed: float, timings: Dict[str, List[Tuple[float, float]]],
+                  snapshot: List[str]):
+        self.slow_updates += 1
+        db = covered(timings.get('db', []))
+        crypto = covered(timings.get('crypto', []))
+        # Таймер порога не успел сработать: после порога обработчик не отдавал управление event loop
+        stack = snapshot[0] if snapshot else '  no stack snapshot: the handler did not yield after the threshold\n'
+        logger.warning(
+            f"Slow update {name} user={self.user_hash(update)}: {elapsed * 1000:.0f} ms "
+            f"(db {db * 1000:.0f} ms, crypto {crypto * 1000:.0f} ms, "
+            f"other {max(elapsed - db - crypto, 0.0) * 1000:.0f} ms)\n{stack.rstrip()}"
+        )
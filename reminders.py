@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import html
+import logging
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from telegram.error import Forbidden, RetryAfter
+
+from outbound import BULK_LANE
+from rate_limit import TokenBucket, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+REMINDER_TEMPLATE = (
+    "🔔 <b>Напоминание о смене пароля</b>\n\n"
+    "Прошел год с момента создания пароля для <b>{service}</b>.\n"
+    "Рекомендуем сменить пароль для обеспечения безопасности."
+)
+
+
+class ReminderDispatcher:
+    """Потоковая отправка напоминаний с ограничением скорости
+
+    Напоминания читаются страницами по курсору (reminder_date, id), отправляются
+    параллельно под общим лимитом скорости, а отправленные помечаются пачками.
+    При падении повторно отправится не больше одной неподтвержденной пачки.
+    Напоминания пользователей, заблокировавших бота, не помечаются
+    отправленными, а удаляются; прочие ошибки оставляют напоминание
+    в очереди до следующего прохода.
+    Если у бота есть OutboundQueue, напоминания идут в ней полосой bulk,
+    позади ответов пользователям.
+    """
+
+    def __init__(self, db, bot, rate_limit: float = 25.0, concurrency: int = 32,
+                 page_size: int = 500, commit_batch: int = 100, max_retries: int = 3):
+        self.db = db
+        self.bot = bot
+        self.limiter = TokenBucket(rate_limit)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.commit_batch = commit_batch
+        self.max_retries = max_retries
+        self._send_kwargs = {'rate_limit_args': BULK_LANE} if getattr(bot, 'rate_limiter', None) else {}
+        self._sent: List[int] = []
+        self._dropped: List[int] = []
+        self._running = asyncio.Lock()
+
+    async def run(self) -> int:
+        """Отправка всех наступивших напоминаний, возвращает число отправленных"""
+        if self._running.locked():
+            logger.info("Reminder dispatch is already running")
+            return 0
+
+        async with self._running:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            cursor: Optional[Tuple[str, int]] = None
+            total = 0
+
+            while True:
+                page = self.db.get_pending_reminders_page(cursor, self.page_size)
+                if not page:
+                    break
+                cursor = (page[-1][4], page[-1][0])
+
+                async def send(reminder):
+                    async with semaphore:
+                        return await self._send(reminder)
+
+                results = await asyncio.gather(*(send(reminder) for reminder in page))
+                total += sum(results)
+                self._flush()
+
+            self._flush()
+            logger.info(f"Sent {total} password reminders")
+            return total
+
+    async def _send(self, reminder: Tuple) -> bool:
+        """Отправка одного напоминания с учетом RetryAfter"""
+        reminder_id, user_id, _, service_name, _ = reminder
+        text = REMINDER_TEMPLATE.format(service=html.escape(service_name))
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text, parse_mode='HTML', **self._send_kwargs)
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                logger.warning(f"Flood control hit, pausing reminders for {delay}s")
+                self.limiter.pause(delay)
+                continue
+            except Forbidden as e:
+                # Пользователь заблокировал бота: повторять бессмысленно
+                logger.info(f"Reminder {reminder_id} dropped: {e}")
+                self._drop(reminder_id)
+                return False
+            except Exception as e:
+                logger.error(f"Error sending reminder to user {user_id}: {e}")
+                return False
+            else:
+                self._mark(reminder_id)
+                return True
+
+        logger.error(f"Reminder {reminder_id} not sent after {self.max_retries} retries")
+        return False
+
+    def _mark(self, reminder_id: int):
+        """Добавление напоминания в пачку на подтверждение"""
+        self._sent.append(reminder_id)
+        if len(self._sent) >= self.commit_batch:
+            self._flush()
+
+    def _drop(self, reminder_id: int):
+        """Добавление недоставляемого напоминания в пачку на удаление"""
+        self._dropped.append(reminder_id)
+        if len(self._dropped) >= self.commit_batch:
+            self._flush()
+
+    def _flush(self):
+        """Запись пачки отправленных и удаление пачки недоставляемых напоминаний"""
+        if self._sent:
+            sent, self._sent = self._sent, []
+            self.db.mark_reminders_sent(sent)
+        if self._dropped:
+            dropped, self._dropped = self._dropped, []
+            self.db.delete_reminders(dropped)
+
+
+def utc_now() -> datetime:
+    """Текущее время UTC без часового пояса, как в SQLite"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ReminderScheduler:
+    """Планировщик, который спит ровно до ближайшего напоминания
+
+    В памяти держится min-куча ближайших напоминаний, загружаемых окнами из
+    индекса по (reminder_date, id). Все неотправленные напоминания с ключом не
+    больше курсора уже в куче, поэтому ее вершина - ближайшее напоминание.
+    Новые напоминания добавляются через DatabaseManager.reminder_listeners.
+    """
+
+    def __init__(self, db, dispatcher, window: int = 1000, resync_interval: float = 3600.0):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.window = window
+        self.resync_interval = resync_interval
+        self._heap: List[Tuple[str, int]] = []
+        self._cursor: Optional[Tuple[str, int]] = None
+        self._exhausted = False
+        self._resynced_at = 0.0
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        db.reminder_listeners.append(self.push)
+
+    def start(self):
+        """Запуск планировщика в текущем event loop"""
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._stopping = False
+            self._resynced_at = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка планировщика"""
+        if self._task is not None:
+            # wait_for в Python 3.11 теряет отмену, если событие наступило одновременно с ней
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def push(self, reminder_id: int, reminder_date: str):
+        """Добавление нового напоминания (можно вызывать из любого потока)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._push, reminder_id, reminder_date)
+
+    def _push(self, reminder_id: int, reminder_date: str):
+        key = (reminder_date, reminder_id)
+        if self._exhausted:
+            self._cursor = max(self._cursor, key) if self._cursor else key
+        elif self._cursor is None or key > self._cursor:
+            # Напоминание за пределами окна будет загружено из индекса позже
+            return
+
+        heapq.heappush(self._heap, key)
+        self._wakeup.set()
+
+    def _load(self):
+        """Загрузка следующего окна напоминаний из индекса"""
+        rows = self.db.get_upcoming_reminders(self._cursor, self.window)
+        for reminder_id, reminder_date in rows:
+            heapq.heappush(self._heap, (reminder_date, reminder_id))
+        if rows:
+            self._cursor = (rows[-1][1], rows[-1][0])
+        self._exhausted = len(rows) < self.window
+
+    def _resync(self):
+        """Полная перезагрузка окна (на случай записей мимо DatabaseManager)"""
+        self._heap.clear()
+        self._cursor = None
+        self._exhausted = False
+        self._resynced_at = time.monotonic()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                # Перезагрузка по времени, а не по паузе: при частых напоминаниях
+                # пауза никогда не дорастает до resync_interval
+                until_resync = self._resynced_at + self.resync_interval - time.monotonic()
+                if until_resync <= 0:
+                    self._resync()
+                    until_resync = self.resync_interval
+
+                if not self._heap and not self._exhausted:
+                    self._load()
+
+                if self._heap:
+                    due_at = datetime.fromisoformat(self._heap[0][0])
+                    delay = (due_at - utc_now()).total_seconds()
+                else:
+                    delay = until_resync
+
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, until_resync))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                now = utc_now()
+                while self._heap and datetime.fromisoformat(self._heap[0][0]) <= now:
+                    heapq.heappop(self._heap)
+                await self.dispatcher.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in reminder scheduler: {e}")
+                await asyncio.sleep(60)
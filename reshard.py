@@ -0,0 +1,203 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from config import DB_PATH
+from database import SCHEMA_VERSION, DatabaseManager, shard_index, shard_paths
+
+# Пользователей за одну транзакцию записи в целевые шарды
+USER_BATCH_SIZE = 500
+
+TABLES = ('users', 'password_settings', 'passwords', 'reminders')
+
+
+def read_users(conn, after: int, limit: int) -> List[Tuple]:
+    return conn.execute('''
+        SELECT user_id, master_password_hash, salt, created_at FROM users
+        WHERE user_id > ? ORDER BY user_id LIMIT ?
+    ''', (after, limit)).fetchall()
+
+
+def copy_user(source, target, user: Tuple) -> Tuple[int, int]:
+    """Перенос пользователя со всеми данными, возвращает (паролей, напоминаний)
+
+    id паролей сохраняются, если в целевом шарде они свободны; иначе запись
+    получает новый id, а напоминания следуют за ней. id напоминаний всегда
+    выдаются заново из диапазона целевого шарда.
+    """
+    user_id = user[0]
+    target.execute(
+        'INSERT INTO users (user_id, master_password_hash, salt, created_at) VALUES (?, ?, ?, ?)',
+        user
+    )
+    settings = source.execute('''
+        SELECT user_id, length, use_uppercase, use_lowercase, use_digits, use_special, mode, word_count
+        FROM password_settings WHERE user_id = ?
+    ''', (user_id,)).fetchone()
+    if settings:
+        target.execute('''
+            INSERT INTO password_settings
+            (user_id, length, use_uppercase, use_lowercase, use_digits, use_special, mode, word_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', settings)
+
+    password_ids: Dict[int, int] = {}
+    for row in source.execute('''
+        SELECT id, user_id, service_name, encrypted_password, salt, created_at, last_reminder_sent
+        FROM passwords WHERE user_id = ? ORDER BY id
+    ''', (user_id,)):
+        cursor = target.execute('''
+            INSERT OR IGNORE INTO passwords
+            (id, user_id, service_name, encrypted_password, salt, created_at, last_reminder_sent)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', row)
+        if cursor.rowcount == 0:
+            cursor = target.execute('''
+                INSERT INTO passwords
+                (user_id, service_name, encrypted_password, salt, created_at, last_reminder_sent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', row[1:])
+        password_ids[row[0]] = cursor.lastrowid
+
+    reminders = [
+        (user_id, password_ids[password_id], reminder_date, sent)
+        for password_id, reminder_date, sent in source.execute(
+            'SELECT password_id, reminder_date, sent FROM reminders WHERE user_id = ? ORDER BY id',
+            (user_id,)
+        )
+        # Напоминания удаленных паролей не переносятся
+        if password_id in password_ids
+    ]
+    target.executemany(
+        'INSERT INTO reminders (user_id, password_id, reminder_date, sent) VALUES (?, ?, ?, ?)',
+        reminders
+    )
+    return len(password_ids), len(reminders)
+
+
+def open_source(path: str) -> sqlite3.Connection:
+    """Исходный шард только для чтения: без миграций схемы и без записи в файл"""
+    conn = sqlite3.connect(f'file:{quote(path)}?mode=ro', uri=True)
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < SCHEMA_VERSION:
+            raise ValueError(
+                f"{path} has schema version {version}, expected {SCHEMA_VERSION}; "
+                "start the bot once to migrate it before resharding"
+            )
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def reader_connections(db: DatabaseManager) -> Iterator[sqlite3.Connection]:
+    """Читатели всех шардов по очереди"""
+    for pool in db.pools:
+        with pool.reader() as conn:
+            yield conn
+
+
+def count_rows(connections: Iterable[sqlite3.Connection]) -> Dict[str, int]:
+    """Число строк в таблицах по всем шардам"""
+    totals = dict.fromkeys(TABLES, 0)
+    for conn in connections:
+        for table in TABLES:
+            totals[table] += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    return totals
+
+
+def reshard(db_path: str, source_shards: int, target_shards: int,
+            batch_size: int = USER_BATCH_SIZE, target_path: Optional[str] = None) -> Dict[str, int]:
+    """Перенос всех пользователей из source_shards шардов в target_shards
+
+    Исходные файлы открываются только для чтения и не изменяются. Целевые
+    шарды создаются по базовому пути target_path (по умолчанию db_path);
+    уже существующие файлы не перезаписываются, поэтому для переноса в один
+    файл нужен отдельный target_path. Бот на время переноса должен быть
+    остановлен, после переноса он запускается с DB_SHARDS=target_shards и
+    DB_PATH=target_path.
+    """
+    target_path = target_path or db_path
+    missing = [path for path in shard_paths(db_path, source_shards) if not os.path.exists(path)]
+    if missing:
+        raise ValueError(f"Source shards not found: {', '.join(missing)}")
+    existing = [path for path in shard_paths(target_path, target_shards) if os.path.exists(path)]
+    if existing:
+        raise ValueError(f"Target shards already exist: {', '.join(existing)}; choose another output path")
+
+    sources: List[sqlite3.Connection] = []
+    target = None
+    copied = {'users': 0, 'passwords': 0, 'reminders': 0}
+    try:
+        for path in shard_paths(db_path, source_shards):
+            sources.append(open_source(path))
+        target = DatabaseManager(target_path, readers=1, shards=target_shards)
+
+        for path, conn in zip(shard_paths(db_path, source_shards), sources):
+            after = 0
+            while True:
+                users = read_users(conn, after, batch_size)
+                if not users:
+                    break
+                after = users[-1][0]
+
+                by_shard: Dict[int, List[Tuple]] = {}
+                for user in users:
+                    by_shard.setdefault(shard_index(user[0], target_shards), []).append(user)
+
+                for index, shard_users in by_shard.items():
+                    with target.pools[index].writer() as target_conn:
+                        for user in shard_users:
+                            passwords, reminders = copy_user(conn, target_conn, user)
+                            copied['users'] += 1
+                            copied['passwords'] += passwords
+                            copied['reminders'] += reminders
+            print(f"{path}: done, {copied['users']} users copied so far")
+
+        expected, actual = count_rows(sources), count_rows(reader_connections(target))
+        if expected['users'] != actual['users'] or expected['passwords'] != actual['passwords']:
+            raise RuntimeError(f"Row count mismatch after resharding: {expected} -> {actual}")
+        return actual
+    finally:
+        for conn in sources:
+            conn.close()
+        if target is not None:
+            target.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Offline resharding of the password manager database')
+    parser.add_argument('--db', default=DB_PATH, help='base database path (DB_PATH)')
+    parser.add_argument('--from-shards', type=int, required=True, help='current DB_SHARDS')
+    parser.add_argument('--to-shards', type=int, required=True, help='new DB_SHARDS')
+    parser.add_argument('--output', help='base path of the new shards (default: --db); required for --to-shards 1')
+    parser.add_argument('--batch-size', type=int, default=USER_BATCH_SIZE, help='users per target transaction')
+    args = parser.parse_args(argv)
+    output = args.output or args.db
+
+    if args.from_shards < 1 or args.to_shards < 1 or args.from_shards == args.to_shards:
+        parser.error('shard counts must be positive and different')
+
+    started = time.perf_counter()
+    try:
+        totals = reshard(args.db, args.from_shards, args.to_shards, args.batch_size, output)
+    except (ValueError, RuntimeError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"Resharded in {time.perf_counter() - started:.1f}s: "
+          + ', '.join(f'{table}={count}' for table, count in totals.items()))
+    for path in shard_paths(output, args.to_shards):
+        print(f"  {path}")
+    print(f"Start the bot with DB_PATH={output} DB_SHARDS={args.to_shards}; "
+          "the old files can be removed afterwards.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
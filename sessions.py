@@ -0,0 +1,301 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+class Session:
+    """Незавершенный диалог генерации пароля
+
+    current_password есть только в памяти: после перезапуска он равен None,
+    и пользователю нужно сгенерировать пароль заново.
+    """
+
+    __slots__ = ('service_name', 'current_password', 'touched_at')
+
+    def __init__(self, service_name: str, current_password: Optional[str], touched_at: float):
+        self.service_name = service_name
+        self.current_password = current_password
+        self.touched_at = touched_at
+
+
+class SessionStore:
+    """Ограниченное хранилище сессий с вытеснением по простою
+
+    Сессии лежат в OrderedDict в порядке последнего обращения, поэтому и
+    вытеснение самой старой сессии, и удаление просроченных - O(1) на сессию.
+    Если задан db_path, изменения сбрасываются в SQLite пачкой при каждом
+    проходе чистильщика, а не на каждое обновление. На диск пишется только
+    сервис и время: сгенерированный пароль в открытом виде не сохраняется.
+    В том же файле SessionPersistence хранит состояния диалогов PTB, без
+    которых восстановленные сессии не дошли бы до обработчиков.
+    """
+
+    def __init__(self, max_size: int = 10000, idle_ttl: float = 900.0,
+                 sweep_interval: float = 60.0, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._sessions: OrderedDict = OrderedDict()
+        self._dirty: Set[int] = set()
+        # Состояния ConversationHandler: загруженные при старте и еще не сброшенные изменения
+        self._restored_conversations: Dict[str, Dict[Tuple, Any]] = {}
+        self._dirty_conversations: Dict[Tuple[str, Tuple], Optional[Tuple[Any, float]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pool: Optional[ConnectionPool] = None
+
+        if db_path:
+            self._pool = ConnectionPool(db_path, readers=1)
+            self._load()
+
+    @property
+    def persistent(self) -> bool:
+        """Переживают ли сессии и диалоги перезапуск"""
+        return self._pool is not None
+
+    def _load(self):
+        """Восстановление сессий после перезапуска"""
+        with self._pool.writer() as conn:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(sessions)')]
+            if 'current_password' in columns:
+                # Файл прежней версии хранил пароли открытым текстом: стираем их вместе с таблицей
+                conn.execute('PRAGMA secure_delete = ON')
+                conn.execute('DROP TABLE sessions')
+                logger.info("Dropped dialog sessions stored with plaintext passwords")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id INTEGER PRIMARY KEY,
+                    service_name TEXT NOT NULL,
+                    touched_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    name TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    touched_at REAL NOT NULL,
+                    PRIMARY KEY (name, key)
+                )
+            ''')
+            # Диалог, простаивающий дольше idle_ttl, забывается вместе с сессией
+            deadline = time.time() - self.idle_ttl
+            conn.execute('DELETE FROM sessions WHERE touched_at <= ?', (deadline,))
+            conn.execute('DELETE FROM conversations WHERE touched_at <= ?', (deadline,))
+            rows = conn.execute('''
+                SELECT user_id, service_name, touched_at
+                FROM sessions ORDER BY touched_at DESC LIMIT ?
+            ''', (self.max_size,)).fetchall()
+            conversations = conn.execute('SELECT name, key, state, touched_at FROM conversations').fetchall()
+
+        for user_id, service_name, touched_at in reversed(rows):
+            self._sessions[user_id] = Session(service_name, None, touched_at)
+        for name, key, state, _ in conversations:
+            self._restored_conversations.setdefault(name, {})[tuple(json.loads(key))] = json.loads(state)
+        logger.info(f"Restored {len(rows)} dialog sessions and {len(conversations)} conversation states")
+
+    def conversations(self, name: str) -> Dict[Tuple, Any]:
+        """Восстановленные состояния ConversationHandler с именем name (читаются один раз при старте)"""
+        return self._restored_conversations.pop(name, {})
+
+    def set_conversation(self, name: str, key: Tuple, state: Any):
+        """Новое состояние диалога; None - диалог завершен"""
+        if self._pool is not None:
+            self._dirty_conversations[(name, key)] = (state, time.time()) if state is not None else None
+
+    def get(self, user_id: int) -> Optional[Session]:
+        """Получение активной сессии с продлением времени жизни"""
+        session = self._sessions.get(user_id)
+        if session is None:
+            return None
+
+        now = time.time()
+        if now - session.touched_at >= self.idle_ttl:
+            self.pop(user_id)
+            return None
+
+        session.touched_at = now
+        self._sessions.move_to_end(user_id)
+        self._dirty.add(user_id)
+        return session
+
+    def set(self, user_id: int, service_name: str, current_password: str) -> Session:
+        """Создание или обновление сессии"""
+        session = Session(service_name, current_password, time.time())
+        self._sessions[user_id] = session
+        self._sessions.move_to_end(user_id)
+        self._dirty.add(user_id)
+
+        while len(self._sessions) > self.max_size:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._dirty.add(evicted)
+        return session
+
+    def pop(self, user_id: int, default=None) -> Optional[Session]:
+        """Удаление сессии"""
+        session = self._sessions.pop(user_id, None)
+        if session is None:
+            return default
+        self._dirty.add(user_id)
+        return session
+
+    def __contains__(self, user_id: int) -> bool:
+        return self.get(user_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sweep(self) -> int:
+        """Удаление сессий, простаивающих дольше idle_ttl"""
+        deadline = time.time() - self.idle_ttl
+        expired = 0
+        while self._sessions:
+            user_id, session = next(iter(self._sessions.items()))
+            if session.touched_at > deadline:
+                break
+            self._sessions.popitem(last=False)
+            self._dirty.add(user_id)
+            expired += 1
+        return expired
+
+    def flush(self):
+        """Сброс измененных сессий и состояний диалогов в SQLite одной транзакцией"""
+        if self._pool is None or not (self._dirty or self._dirty_conversations):
+            self._dirty.clear()
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        upserts = []
+        deletes = []
+        for user_id in dirty:
+            session = self._sessions.get(user_id)
+            if session is None:
+                deletes.append((user_id,))
+            else:
+                upserts.append((user_id, session.service_name, session.touched_at))
+
+        dirty_conversations, self._dirty_conversations = self._dirty_conversations, {}
+        conversation_upserts = []
+        conversation_deletes = []
+        for (name, key), entry in dirty_conversations.items():
+            if entry is None:
+                conversation_deletes.append((name, json.dumps(key)))
+            else:
+                conversation_upserts.append((name, json.dumps(key), json.dumps(entry[0]), entry[1]))
+
+        with self._pool.writer() as conn:
+            conn.executemany('DELETE FROM sessions WHERE user_id = ?', deletes)
+            conn.executemany('''
+                INSERT OR REPLACE INTO sessions (user_id, service_name, touched_at)
+                VALUES (?, ?, ?)
+            ''', upserts)
+            conn.executemany('DELETE FROM conversations WHERE name = ? AND key = ?', conversation_deletes)
+            conn.executemany('''
+                INSERT OR REPLACE INTO conversations (name, key, state, touched_at)
+                VALUES (?, ?, ?, ?)
+            ''', conversation_upserts)
+
+    def start(self):
+        """Запуск фонового чистильщика"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweeper())
+
+    async def stop(self):
+        """Остановка чистильщика и финальный сброс на диск"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        self.flush()
+        if self._pool is not None:
+            self._pool.close()
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                expired = self.sweep()
+                if expired:
+                    logger.info(f"Expired {expired} idle dialog sessions")
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error sweeping sessions: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Размер хранилища"""
+        return {'size': len(self._sessions), 'max_size': self.max_size}
+
+
+class SessionPersistence(BasePersistence):
+    """Персистентность PTB для состояний диалогов поверх SessionStore
+
+    Бот не использует user_data, chat_data и bot_data, поэтому хранятся только
+    состояния ConversationHandler с persistent=True. Они пишутся в файл
+    сессий и сбрасываются вместе с ними, без записи на каждое обновление.
+    """
+
+    def __init__(self, store: SessionStore, update_interval: float = 60):
+        super().__init__(
+            PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval
+        )
+        self.store = store
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, Any]:
+        return self.store.conversations(name)
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        self.store.set_conversation(name, key, new_state)
+
+    async def flush(self) -> None:
+        self.store.flush()
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        pass
+
+    async def update_bot_data(self, data: Any) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Any) -> None:
+        pass
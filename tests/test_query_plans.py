@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from database import DatabaseManager
+
+
+class QueryPlanTest(unittest.TestCase):
+    """Горячие запросы списка паролей, поиска и очереди напоминаний идут по своим индексам
+
+    Запросы перехватываются у настоящих методов DatabaseManager через
+    trace_callback единственного читателя, затем для каждого выполняется
+    EXPLAIN QUERY PLAN.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = DatabaseManager(os.path.join(self.directory, 'test.db'), readers=1)
+        self.db.create_user(1, 'hash', b'salt')
+        password_id = self.db.save_password(1, 'example.com', b'data', b'salt')
+        self.db.schedule_annual_reminder(1, password_id)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def traced(self, call, table: str):
+        """SQL запросов к table, выполненных читателем во время call()"""
+        statements = []
+        with self.db.pool.reader() as conn:
+            conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            with self.db.pool.reader() as conn:
+                conn.set_trace_callback(None)
+        statements = [sql for sql in statements if f'FROM {table}' in sql]
+        self.assertTrue(statements, f'no queries against {table}')
+        return statements
+
+    def plan(self, sql: str) -> str:
+        with self.db.pool.reader() as conn:
+            return '\n'.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}'))
+
+    def test_password_listing_uses_covering_index(self):
+        calls = [
+            lambda: self.db.get_user_password_list_page(1, None, 10),
+            lambda: self.db.get_user_password_list_page(1, ('2000-01-01 00:00:00', 1), 10),
+            lambda: self.db.get_user_password_list_page(1, ('2000-01-01 00:00:00', 1), 10, newer=True),
+        ]
+        for call in calls:
+            for sql in self.traced(call, 'passwords'):
+                plan = self.plan(sql)
+                self.assertIn('USING COVERING INDEX idx_passwords_user_listing', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_search_uses_trigram_index(self):
+        self.assertTrue(self.db.search_index[0])
+        for sql in self.traced(lambda: self.db.search_passwords(1, 'ample', 10), 'passwords'):
+            plan = self.plan(sql)
+            # M - ограничение MATCH, которое обслуживает сам индекс FTS5
+            self.assertRegex(plan, r'VIRTUAL TABLE INDEX \d+:M')
+            self.assertIn('SEARCH p USING INTEGER PRIMARY KEY', plan)
+            self.assertNotIn('SCAN p', plan)
+            self.assertNotIn('SCAN passwords', plan)
+
+    def test_short_search_reads_only_the_user(self):
+        # Запрос короче триграммы ищется LIKE по записям одного пользователя
+        for sql in self.traced(lambda: self.db.search_passwords(1, 'ex', 10), 'passwords'):
+            plan = self.plan(sql)
+            self.assertIn('USING INDEX idx_passwords_user_listing (user_id=?)', plan)
+            self.assertNotIn('SCAN passwords', plan)
+
+    def test_pending_reminders_use_covering_partial_index(self):
+        calls = [
+            self.db.get_pending_reminders,
+            lambda: self.db.get_pending_reminders_page(None, 10),
+            lambda: self.db.get_upcoming_reminders(None, 10),
+        ]
+        for call in calls:
+            for sql in self.traced(call, 'reminders'):
+                plan = self.plan(sql)
+                self.assertIn('USING COVERING INDEX idx_reminders_pending', plan)
+                self.assertNotIn('SCAN r', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
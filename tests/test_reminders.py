@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from database import DatabaseManager
+from reminders import ReminderDispatcher
+
+BLOCKED_USER = 13
+FAILING_USER = 14
+THROTTLED_USER = 15
+RETRY_AFTER = 0.2
+
+
+class StubBot:
+    """Bot с одним send_message: записывает вызовы и имитирует ошибки Bot API"""
+
+    def __init__(self):
+        self.calls = []
+        self.throttled = False
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.calls.append((chat_id, time.monotonic()))
+        if chat_id == BLOCKED_USER:
+            raise Forbidden('Forbidden: bot was blocked by the user')
+        if chat_id == FAILING_USER:
+            raise NetworkError('connection reset')
+        if chat_id == THROTTLED_USER and not self.throttled:
+            self.throttled = True
+            raise RetryAfter(RETRY_AFTER)
+        return True
+
+
+class ReminderDispatcherTest(unittest.IsolatedAsyncioTestCase):
+    """Отправка наступивших напоминаний через заглушку бота"""
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = DatabaseManager(os.path.join(self.directory, 'test.db'), readers=1)
+        self.reminders = {}
+        users = [1, 2, BLOCKED_USER, 3, FAILING_USER, THROTTLED_USER, 4]
+        with self.db.pool.writer() as conn:
+            for index, user_id in enumerate(users):
+                conn.execute('INSERT INTO users (user_id, master_password_hash, salt) VALUES (?, ?, ?)',
+                             (user_id, 'hash', b'salt'))
+                password_id = conn.execute(
+                    'INSERT INTO passwords (user_id, service_name, encrypted_password, salt) VALUES (?, ?, ?, ?)',
+                    (user_id, f'service-{user_id}', b'data', b'salt')
+                ).lastrowid
+                reminder_id = conn.execute(
+                    'INSERT INTO reminders (user_id, password_id, reminder_date) VALUES (?, ?, ?)',
+                    (user_id, password_id, f'2000-01-01 00:00:{index:02d}')
+                ).lastrowid
+                self.reminders[user_id] = reminder_id
+            # Еще не наступившее напоминание не отправляется
+            conn.execute('INSERT INTO reminders (user_id, password_id, reminder_date) VALUES (1, 1, ?)',
+                         ('2999-01-01 00:00:00',))
+
+        self.pages = []
+        get_page = self.db.get_pending_reminders_page
+
+        def recording_page(after, limit):
+            page = get_page(after, limit)
+            self.pages.append((after, [row[0] for row in page]))
+            return page
+
+        self.db.get_pending_reminders_page = recording_page
+
+        self.batches = []
+        mark_sent = self.db.mark_reminders_sent
+
+        def recording_mark(reminder_ids):
+            self.batches.append(list(reminder_ids))
+            mark_sent(reminder_ids)
+
+        self.db.mark_reminders_sent = recording_mark
+
+        self.bot = StubBot()
+        self.dispatcher = ReminderDispatcher(self.db, self.bot, rate_limit=1000, concurrency=4,
+                                             page_size=2, commit_batch=2, max_retries=3)
+
+    async def asyncTearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def states(self):
+        with self.db.pool.reader() as conn:
+            return dict(conn.execute('SELECT id, sent FROM reminders'))
+
+    async def test_dispatch(self):
+        sent = await self.dispatcher.run()
+
+        delivered = {self.reminders[user_id] for user_id in (1, 2, 3, THROTTLED_USER, 4)}
+        self.assertEqual(sent, len(delivered))
+
+        # Страницы по курсору (reminder_date, id): каждое наступившее напоминание прочитано ровно один раз
+        self.assertGreater(len(self.pages), 2)
+        read = [reminder_id for _, page in self.pages for reminder_id in page]
+        self.assertEqual(sorted(read), sorted(self.reminders.values()))
+        self.assertIsNone(self.pages[0][0])
+        self.assertEqual(self.pages[-1][1], [])
+
+        # RetryAfter: повтор не раньше указанной паузы, затем доставка
+        attempts = [at for chat_id, at in self.bot.calls if chat_id == THROTTLED_USER]
+        self.assertEqual(len(attempts), 2)
+        self.assertGreaterEqual(attempts[1] - attempts[0], RETRY_AFTER * 0.9)
+
+        # Помечены отправленными ровно доставленные, пачками не больше commit_batch
+        self.assertTrue(all(len(batch) <= 2 for batch in self.batches))
+        marked = [reminder_id for batch in self.batches for reminder_id in batch]
+        self.assertEqual(sorted(marked), sorted(delivered))
+
+        states = self.states()
+        for reminder_id in delivered:
+            self.assertEqual(states[reminder_id], 1)
+        # Неудачная отправка остается в очереди, напоминание заблокировавшего бота удаляется
+        self.assertEqual(states[self.reminders[FAILING_USER]], 0)
+        self.assertNotIn(self.reminders[BLOCKED_USER], states)
+
+    async def test_second_run_retries_only_failed(self):
+        await self.dispatcher.run()
+        self.bot.calls.clear()
+
+        self.assertEqual(await self.dispatcher.run(), 0)
+        self.assertEqual([chat_id for chat_id, _ in self.bot.calls], [FAILING_USER])
+
+
+if __name__ == '__main__':
+    unittest.main()
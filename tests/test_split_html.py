@@ -0,0 +1,87 @@
+import re
+import unittest
+
+from handlers import MAX_MESSAGE_LENGTH, split_html, utf16_length
+
+TAG_RE = re.compile(r'<(/?)([a-zA-Z][\w-]*)[^<>]*>')
+BROKEN_ENTITY_RE = re.compile(r'&(?!#?\w+;)')
+
+
+def plain(text: str) -> str:
+    """Текст без тегов"""
+    return TAG_RE.sub('', text)
+
+
+class SplitHtmlTest(unittest.TestCase):
+    """Разбиение длинных HTML-ответов на сообщения Telegram"""
+
+    def check(self, text: str, limit: int = MAX_MESSAGE_LENGTH):
+        """Общие инварианты: длина частей, парные теги в каждой части, целые сущности, весь текст на месте"""
+        chunks = split_html(text, limit)
+        for chunk in chunks:
+            self.assertLessEqual(utf16_length(chunk), limit)
+            self.assertIsNone(BROKEN_ENTITY_RE.search(chunk), chunk[-20:])
+            stack = []
+            for closing, name in TAG_RE.findall(chunk):
+                if closing:
+                    self.assertEqual(stack.pop(), name)
+                else:
+                    stack.append(name)
+            self.assertEqual(stack, [], 'tags left open at the end of a chunk')
+        self.assertEqual(''.join(plain(chunk) for chunk in chunks), plain(text))
+        return chunks
+
+    def test_short_message_is_not_split(self):
+        text = '<b>title</b>\n' + 'x' * (MAX_MESSAGE_LENGTH - 13)
+        self.assertEqual(split_html(text), [text])
+
+    def test_just_over_the_limit(self):
+        lines = [f'{i:04d} ' + 'a' * 94 for i in range(41)]
+        text = '\n'.join(lines)
+        self.assertEqual(len(text), MAX_MESSAGE_LENGTH + 3)
+        chunks = self.check(text)
+        self.assertEqual(len(chunks), 2)
+        # Разрез по последнему переводу строки, поместившемуся в первую часть
+        self.assertTrue(chunks[0].endswith('\n'))
+        self.assertTrue(chunks[1].startswith(lines[-1][:4]))
+
+    def test_split_inside_bold(self):
+        text = '<b>' + '\n'.join('bold line %03d' % i for i in range(600)) + '</b>'
+        chunks = self.check(text)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.startswith('<b>'))
+            self.assertTrue(chunk.endswith('</b>'))
+
+    def test_split_inside_code_without_newlines(self):
+        text = 'Пароль: <code>' + 'Z' * 9000 + '</code> готово'
+        chunks = self.check(text)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].endswith('</code>'))
+        for chunk in chunks[1:]:
+            self.assertTrue(chunk.startswith('<code>'))
+
+    def test_nested_tags_are_reopened_with_attributes(self):
+        text = '<b>Сервисы <a href="https://example.com/?a=1&amp;b=2">' + 'ссылка ' * 1500 + '</a></b>'
+        chunks = self.check(text)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[1:]:
+            self.assertTrue(chunk.startswith('<b><a href="https://example.com/?a=1&amp;b=2">'))
+
+    def test_entities_are_not_cut(self):
+        for offset in range(12):
+            text = 'x' * (MAX_MESSAGE_LENGTH - 6 + offset) + '&lt;&amp;&#128272;&gt;' * 3
+            self.check(text)
+
+    def test_surrogate_pairs_count_twice(self):
+        text = '🔐' * 3000
+        chunks = self.check(text)
+        self.assertEqual([utf16_length(chunk) for chunk in chunks], [4096, 1904])
+
+    def test_no_chunk_over_a_small_limit(self):
+        text = ''.join(f'<b>{i}</b> <i>&amp; item</i>\n' for i in range(500))
+        self.check(text, limit=97)
+
+
+if __name__ == '__main__':
+    unittest.main()
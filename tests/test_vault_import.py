@@ -0,0 +1,72 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from database import DatabaseManager
+from encryption import EncryptionManager
+from vault_io import ImportInterrupted, import_vault
+
+
+class ImportVaultTest(unittest.TestCase):
+    """Импорт не оставляет части файла при ошибке разбора"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db = DatabaseManager(os.path.join(self.directory, 'test.db'), readers=1)
+        self.db.create_user(1, 'hash', b'salt')
+        self.vault_key = os.urandom(32)
+        self.cipher = EncryptionManager().cipher
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def csv_rows(self, count: int) -> bytes:
+        return b'service,password\r\n' + b''.join(b'site-%d,secret-%d\r\n' % (i, i) for i in range(count))
+
+    def stored(self) -> int:
+        return sum(len(rows) for rows in self.db.iter_user_passwords(1))
+
+    def test_imports_in_batches(self):
+        imported, skipped = import_vault(
+            self.db, 1, io.BytesIO(self.csv_rows(1200) + b'no-password\r\n'), 'vault.csv',
+            self.vault_key, self.cipher, batch_size=500
+        )
+        self.assertEqual((imported, skipped), (1200, 1))
+        self.assertEqual(self.stored(), 1200)
+
+    def test_decode_error_after_first_batch_stores_nothing(self):
+        stream = io.BytesIO(self.csv_rows(1000) + b'broken,\xff\xfe\r\n')
+        with self.assertRaises(UnicodeDecodeError):
+            import_vault(self.db, 1, stream, 'vault.csv', self.vault_key, self.cipher, batch_size=500)
+        self.assertEqual(self.stored(), 0)
+
+    def test_json_error_after_first_batch_stores_nothing(self):
+        records = b','.join(b'{"service": "site-%d", "password": "p"}' % i for i in range(1000))
+        stream = io.BytesIO(b'[' + records + b', {"service": ')
+        with self.assertRaises(ValueError):
+            import_vault(self.db, 1, stream, 'vault.json', self.vault_key, self.cipher, batch_size=500)
+        self.assertEqual(self.stored(), 0)
+
+    def test_write_failure_reports_committed_rows(self):
+        save_passwords = self.db.save_passwords
+        calls = []
+
+        def failing_save(user_id, batch):
+            calls.append(len(batch))
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+            return save_passwords(user_id, batch)
+
+        self.db.save_passwords = failing_save
+        with self.assertRaises(ImportInterrupted) as raised:
+            import_vault(self.db, 1, io.BytesIO(self.csv_rows(1200)), 'vault.csv',
+                         self.vault_key, self.cipher, batch_size=500)
+        self.assertEqual(raised.exception.imported, 500)
+        self.assertEqual(self.stored(), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
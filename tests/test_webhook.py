@@ -0,0 +1,70 @@
+import asyncio
+import json
+import unittest
+
+from telegram.ext import Application
+
+from webhook import SECRET_HEADER, WebhookIngress
+
+SECRET = 'test-secret'
+
+UPDATE = {
+    'update_id': 1,
+    'message': {
+        'message_id': 1,
+        'date': 0,
+        'chat': {'id': 42, 'type': 'private'},
+        'from': {'id': 42, 'is_bot': False, 'first_name': 'Test'},
+        'text': '/start'
+    }
+}
+
+
+class WebhookIngressTest(unittest.IsolatedAsyncioTestCase):
+    """Ответы вебхука на POST к локальному порту"""
+
+    async def asyncSetUp(self):
+        self.application = Application.builder().token('123:TEST').update_queue(asyncio.Queue(maxsize=1)).build()
+        self.ingress = WebhookIngress(self.application, SECRET, port=0)
+        await self.ingress.start()
+
+    async def asyncTearDown(self):
+        await self.ingress.stop()
+
+    async def post(self, body: bytes, secret=SECRET) -> int:
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.ingress.server.port)
+        headers = f'POST {self.ingress.path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n'
+        if secret is not None:
+            headers += f'{SECRET_HEADER}: {secret}\r\n'
+        writer.write(headers.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+        return int(response.split(b' ', 2)[1])
+
+    async def test_valid_update_is_queued(self):
+        self.assertEqual(await self.post(json.dumps(UPDATE).encode()), 200)
+        update = self.application.update_queue.get_nowait()
+        self.assertEqual(update.update_id, 1)
+        self.assertEqual(update.effective_user.id, 42)
+
+    async def test_wrong_or_missing_secret(self):
+        body = json.dumps(UPDATE).encode()
+        self.assertEqual(await self.post(body, secret='wrong'), 403)
+        self.assertEqual(await self.post(body, secret=None), 403)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_malformed_body(self):
+        self.assertEqual(await self.post(b'{"update_id": '), 400)
+        self.assertEqual(await self.post(b'[1, 2]'), 400)
+        self.assertTrue(self.application.update_queue.empty())
+
+    async def test_full_queue(self):
+        self.assertEqual(await self.post(json.dumps(UPDATE).encode()), 200)
+        self.assertEqual(await self.post(json.dumps(dict(UPDATE, update_id=2)).encode()), 503)
+        self.assertEqual(self.ingress.rejected, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
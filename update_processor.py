@@ -0,0 +1,70 @@
+import asyncio
+from typing import Any, Awaitable, Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей с порядком внутри пользователя
+
+    Обновления одного пользователя проходят через его asyncio.Lock, который
+    обслуживает ожидающих строго по очереди, поэтому ConversationHandler и
+    сессии диалогов видят их в порядке поступления. Общий лимит
+    max_concurrent_updates берется уже после блокировки пользователя: обновления,
+    ждущие своей очереди, не занимают слоты и не тормозят других пользователей.
+    Блокировка удаляется, как только у пользователя не остается обновлений.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # Ключ пользователя -> [блокировка, число обновлений в работе и в ожидании]
+        self._locks: Dict[Hashable, List[Any]] = {}
+        # Обновления, взятые из update_queue, но еще не обработанные
+        self.pending = 0
+
+    @staticmethod
+    def ordering_key(update: object) -> Optional[Hashable]:
+        """Ключ, внутри которого сохраняется порядок: пользователь, иначе чат"""
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return ('chat', update.effective_chat.id)
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.ordering_key(update)
+        self.pending += 1
+        try:
+            if key is None:
+                await super().process_update(update, coroutine)
+                return
+
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await super().process_update(update, coroutine)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+        finally:
+            self.pending -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    @property
+    def active_users(self) -> int:
+        """Число пользователей с обновлениями в работе или в очереди"""
+        return len(self._locks)
@@ -0,0 +1,302 @@
+import argparse
+import csv
+import getpass
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from encryption import CipherEngine, EncryptionManager
+
+# Названия колонок и полей, под которыми менеджеры паролей выгружают сервис и пароль
+SERVICE_FIELDS = ('service', 'service_name', 'name', 'title', 'url', 'login_uri')
+PASSWORD_FIELDS = ('password', 'pass', 'login_password')
+
+MAX_SERVICE_LENGTH = 50
+MAX_PASSWORD_LENGTH = 1024
+
+# Зашифрованный экспорт: заголовок NVX1 + соль + число итераций PBKDF2,
+# затем кадры AES-GCM (длина, nonce, шифротекст) с JSON Lines внутри.
+# Номер кадра и признак последнего кадра аутентифицируются, поэтому
+# перестановка или обрезка файла обнаруживается при чтении.
+EXPORT_MAGIC = b'NVX1'
+EXPORT_HEADER = struct.Struct('>4s16sI')
+FRAME_LENGTH = struct.Struct('>I')
+FRAME_AAD = struct.Struct('>QB')
+FRAME_NONCE_SIZE = 12
+
+
+def iter_json_array(stream: TextIO, chunk_size: int = 64 * 1024) -> Iterator[object]:
+    """Потоковый разбор JSON-массива: в памяти только текущий фрагмент файла"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof, opened = '', 0, False, False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Неожиданный конец JSON-массива")
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer, pos = chunk, 0
+            continue
+
+        if not opened:
+            if buffer[pos] != '[':
+                raise ValueError("JSON-файл должен содержать массив записей")
+            opened = True
+            pos += 1
+            continue
+
+        if buffer[pos] == ']':
+            return
+
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("Некорректный JSON") from None
+            # Запись не поместилась в буфер целиком: дочитываем
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield value
+
+
+def _pick(record: Dict, fields: Iterable[str]) -> Optional[str]:
+    """Первое непустое поле записи из списка возможных названий"""
+    lowered = {str(key).strip().lower(): value for key, value in record.items()}
+    for field in fields:
+        value = lowered.get(field)
+        if value not in (None, ''):
+            return str(value)
+    return None
+
+
+def _iter_csv(stream: TextIO) -> Iterator[Optional[Tuple[str, str]]]:
+    reader = csv.reader(stream)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    header = [column.strip().lower() for column in first]
+    service_column = next((header.index(f) for f in SERVICE_FIELDS if f in header), None)
+    password_column = next((header.index(f) for f in PASSWORD_FIELDS if f in header), None)
+    if service_column is None or password_column is None:
+        # Файл без заголовка: сервис и пароль в первых двух колонках
+        service_column, password_column = 0, 1
+        reader = _prepend(first, reader)
+
+    for row in reader:
+        if len(row) <= max(service_column, password_column):
+            yield None
+            continue
+        yield row[service_column], row[password_column]
+
+
+def _prepend(first: List[str], rows: Iterator[List[str]]) -> Iterator[List[str]]:
+    yield first
+    yield from rows
+
+
+def _iter_records(records: Iterable[object]) -> Iterator[Optional[Tuple[str, str]]]:
+    for record in records:
+        if not isinstance(record, dict):
+            yield None
+            continue
+        service, password = _pick(record, SERVICE_FIELDS), _pick(record, PASSWORD_FIELDS)
+        yield (service, password) if service is not None and password is not None else None
+
+
+def _iter_jsonl(stream: TextIO) -> Iterator[object]:
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def iter_import_rows(stream: BinaryIO, filename: str = '') -> Iterator[Optional[Tuple[str, str]]]:
+    """Пары (сервис, пароль) из CSV, JSON или JSON Lines; None - нераспознанная строка"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    extension = os.path.splitext(filename.lower())[1]
+
+    if extension not in ('.csv', '.json', '.jsonl', '.ndjson'):
+        # Формат по первому значимому символу
+        start = text.read(1)
+        while start.isspace():
+            start = text.read(1)
+        text.seek(0)
+        extension = {'[': '.json', '{': '.jsonl'}.get(start, '.csv')
+
+    if extension == '.csv':
+        rows = _iter_csv(text)
+    elif extension == '.json':
+        rows = _iter_records(iter_json_array(text))
+    else:
+        rows = _iter_records(_iter_jsonl(text))
+
+    try:
+        for row in rows:
+            if row is None:
+                yield None
+                continue
+            service, password = row[0].strip(), row[1]
+            if not service or not password or len(service) > MAX_SERVICE_LENGTH or len(password) > MAX_PASSWORD_LENGTH:
+                yield None
+                continue
+            yield service, password
+    finally:
+        # Обертка при сборке мусора закрыла бы и сам поток, а его читают повторно
+        text.detach()
+
+
+class ImportInterrupted(Exception):
+    """Импорт прервался после записи части пачек"""
+
+    def __init__(self, imported: int, error: Exception):
+        super().__init__(f"import interrupted after {imported} rows: {error}")
+        self.imported = imported
+        self.error = error
+
+
+def import_vault(db, user_id: int, stream: BinaryIO, filename: str, vault_key: bytes,
+                 cipher: CipherEngine, batch_size: int = 500) -> Tuple[int, int]:
+    """Импорт пачками: шифрование и запись одной транзакцией на пачку
+
+    Возвращает (импортировано, пропущено). Память ограничена одной пачкой.
+    Файл сначала целиком декодируется и разбирается без записи, поэтому
+    ошибка формата (ValueError) означает, что не записано ничего. Сбой
+    после записи первой пачки поднимается как ImportInterrupted с числом
+    уже сохраненных записей.
+    """
+    for _ in iter_import_rows(stream, filename):
+        pass
+    stream.seek(0)
+
+    imported = 0
+    skipped = 0
+    batch = []
+    try:
+        for row in iter_import_rows(stream, filename):
+            if row is None:
+                skipped += 1
+                continue
+            service, password = row
+            encrypted = EncryptionManager.encrypt_entry(password, vault_key, cipher)
+            batch.append((service, encrypted['encrypted_data'], encrypted['salt']))
+            if len(batch) >= batch_size:
+                imported += db.save_passwords(user_id, batch)
+                batch = []
+
+        if batch:
+            imported += db.save_passwords(user_id, batch)
+    except Exception as e:
+        if imported:
+            raise ImportInterrupted(imported, e) from e
+        raise
+    return imported, skipped
+
+
+def derive_export_key(master_password: str, salt: bytes, iterations: int) -> bytes:
+    """Ключ файла экспорта из мастер-пароля"""
+    return hashlib.pbkdf2_hmac('sha256', master_password.encode('utf-8'), salt, iterations, 32)
+
+
+def export_vault(db, user_id: int, vault_key: bytes, legacy_key: bytes, master_password: str,
+                 out: BinaryIO, iterations: int = 600000, batch_size: int = 500) -> int:
+    """Потоковая выгрузка паролей в зашифрованный файл, возвращает число записей
+
+    Записи читаются курсором пачками по batch_size, и каждая пачка
+    сразу становится отдельным кадром файла.
+    """
+    salt = os.urandom(16)
+    header = EXPORT_HEADER.pack(EXPORT_MAGIC, salt, iterations)
+    aead = AESGCM(derive_export_key(master_password, salt, iterations))
+    out.write(header)
+
+    def write_frame(index: int, payload: bytes, last: bool):
+        nonce = os.urandom(FRAME_NONCE_SIZE)
+        encrypted = aead.encrypt(nonce, payload, header + FRAME_AAD.pack(index, int(last)))
+        out.write(FRAME_LENGTH.pack(len(encrypted)) + nonce + encrypted)
+
+    count = 0
+    index = 0
+    for rows in db.iter_user_passwords(user_id, batch_size):
+        lines = []
+        for service_name, encrypted_data, entry_salt, created_at in rows:
+            password = EncryptionManager.decrypt_entry(encrypted_data, entry_salt, vault_key)
+            if password is None:
+                password = EncryptionManager.decrypt_legacy(encrypted_data, entry_salt, legacy_key)
+            lines.append(json.dumps(
+                {'service': service_name, 'password': password, 'created_at': created_at},
+                ensure_ascii=False
+            ))
+        write_frame(index, ('\n'.join(lines) + '\n').encode('utf-8'), last=False)
+        count += len(rows)
+        index += 1
+
+    # Пустой последний кадр подтверждает, что файл не обрезан
+    write_frame(index, b'', last=True)
+    return count
+
+
+def read_export(stream: BinaryIO, master_password: str) -> Iterator[Dict]:
+    """Чтение зашифрованного экспорта, записи по одной"""
+    header = stream.read(EXPORT_HEADER.size)
+    if len(header) != EXPORT_HEADER.size:
+        raise ValueError("Файл экспорта поврежден")
+    magic, salt, iterations = EXPORT_HEADER.unpack(header)
+    if magic != EXPORT_MAGIC:
+        raise ValueError("Это не файл экспорта")
+    aead = AESGCM(derive_export_key(master_password, salt, iterations))
+
+    index = 0
+    while True:
+        prefix = stream.read(FRAME_LENGTH.size + FRAME_NONCE_SIZE)
+        if len(prefix) != FRAME_LENGTH.size + FRAME_NONCE_SIZE:
+            raise ValueError("Файл экспорта обрезан")
+        length, = FRAME_LENGTH.unpack_from(prefix)
+        nonce = prefix[FRAME_LENGTH.size:]
+        encrypted = stream.read(length)
+
+        payload = None
+        for last in (False, True):
+            try:
+                payload = aead.decrypt(nonce, encrypted, header + FRAME_AAD.pack(index, int(last)))
+            except InvalidTag:
+                continue
+            break
+        if payload is None:
+            raise ValueError("Неверный пароль или файл экспорта поврежден")
+
+        for line in payload.decode('utf-8').splitlines():
+            yield json.loads(line)
+        if last:
+            return
+        index += 1
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Decrypt a vault export to JSON Lines')
+    parser.add_argument('path', help='export file (.nvx)')
+    args = parser.parse_args(argv)
+
+    master_password = getpass.getpass('Master password: ')
+    with open(args.path, 'rb') as f:
+        for record in read_export(f, master_password):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import hmac
+import json
+import logging
+from typing import Callable, Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class WebhookIngress:
+    """Прием обновлений от Telegram по HTTP
+
+    Обновление проверяется по секретному заголовку, кладется в update_queue
+    приложения и сразу подтверждается. Если очередь заполнена, отвечаем 503:
+    Telegram повторит доставку позже, а бот не копит обновления без предела.
+    При параллельной обработке очередь быстро разбирается в задачи, поэтому
+    предел задается еще и для backlog - числа взятых, но не обработанных обновлений.
+    """
+
+    def __init__(self, application: Application, secret: str, host: str = '127.0.0.1',
+                 port: int = 8443, path: str = '/telegram', max_body_size: int = 1024 * 1024,
+                 backlog: Optional[Callable[[], int]] = None, max_backlog: int = 0):
+        self.application = application
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self.secret = secret.encode('utf-8')
+        self.path = path
+        self.server = HttpServer(host, port, max_body_size=max_body_size)
+        self.server.route('POST', path, self.handle)
+        self.accepted = 0
+        self.rejected = 0
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        return self.application.update_queue
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        """Проверка, разбор и постановка обновления в очередь"""
+        token = request.headers.get(SECRET_HEADER, '').encode('utf-8')
+        if not hmac.compare_digest(token, self.secret):
+            return Response(403, b'Invalid secret token')
+
+        try:
+            data = json.loads(request.body)
+            update = Update.de_json(data, self.application.bot) if isinstance(data, dict) else None
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            logger.warning(f"Rejected malformed webhook update: {e}")
+            update = None
+        if update is None:
+            return Response(400, b'Malformed update')
+
+        try:
+            if self.backlog is not None and self.queue.qsize() + self.backlog() >= self.max_backlog:
+                raise asyncio.QueueFull
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return Response(503, b'Update queue is full')
+
+        self.accepted += 1
+        return Response(200, b'OK')
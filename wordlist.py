@@ -0,0 +1,82 @@
+import logging
+import mmap
+import os
+import struct
+from array import array
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+# Заголовок файла индекса: сигнатура, размер и время изменения списка слов
+INDEX_HEADER = struct.Struct('<8sQQ')
+INDEX_MAGIC = b'NWIDX001'
+
+
+class Wordlist:
+    """Список слов в файле, отображенном в память, с индексом смещений
+
+    Слова не разбираются в список Python: индекс хранит смещение начала каждой
+    строки (и конец файла в последнем элементе), поэтому слово с номером i
+    читается из mmap за O(1). Индекс строится один раз и сохраняется рядом со
+    списком в файл <путь>.idx, который тоже отображается в память. Строки в
+    формате diceware ("11111<TAB>слово") поддерживаются: берется последнее поле.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = self._load_index()
+        if len(self) == 0:
+            raise ValueError(f"Список слов пуст: {path}")
+
+    def _load_index(self) -> Union[memoryview, array]:
+        """Загрузка индекса из файла или его построение"""
+        index_path = self.path + '.idx'
+        stat = os.stat(self.path)
+
+        try:
+            with open(index_path, 'rb') as f:
+                index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, size, mtime_ns = INDEX_HEADER.unpack_from(index)
+            if (magic, size, mtime_ns) == (INDEX_MAGIC, stat.st_size, stat.st_mtime_ns):
+                return memoryview(index)[INDEX_HEADER.size:].cast('Q')
+            index.close()
+        except (OSError, ValueError, struct.error):
+            pass
+
+        offsets = self._build_index()
+        try:
+            with open(index_path, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns))
+                offsets.tofile(f)
+        except OSError as e:
+            logger.warning(f"Could not save wordlist index {index_path}: {e}")
+        return offsets
+
+    def _build_index(self) -> array:
+        """Смещения непустых строк; последний элемент - конец файла"""
+        offsets = array('Q')
+        data = self._data
+        position = 0
+        size = len(data)
+
+        while position < size:
+            end = data.find(b'\n', position)
+            if end == -1:
+                end = size
+            if data[position:end].strip():
+                offsets.append(position)
+            position = end + 1
+
+        offsets.append(size)
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        line = self._data[self._offsets[index]:self._offsets[index + 1]]
+        return line.split()[-1].decode('utf-8')